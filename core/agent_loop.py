@@ -5,27 +5,33 @@
   → 异步后处理链：反思 → 信号检测 → Observer 轻量 → 指标记录
 """
 
-import asyncio
 import logging
 import time
 import uuid
+from collections.abc import Awaitable, Callable
 from datetime import datetime
 from pathlib import Path
 
-from core.context import ContextEngine
-from core.llm_client import BaseLLMClient
+from core.context import ContextEngine, ConversationHistory
+from core.llm_client import BaseLLMClient, StreamInterrupted
 from core.memory import MemoryStore
 from core.rules import RulesInterpreter
+from core.sessions import DEFAULT_CHANNEL, DEFAULT_USER, Session, SessionManager
+from core.task_queue import PersistentTaskQueue
 
 logger = logging.getLogger(__name__)
 
+# 流式回复中途失败时：附加在已发出文本后的提示，以及代替不完整文本写入历史的内容
+_STREAM_INTERRUPTED_NOTICE = "⚠️ 回复生成中断，以上内容不完整，请重试。"
+_STREAM_INTERRUPTED_HISTORY = "（上一条回复生成中断，未完成）"
+
 
 class AgentLoop:
     """核心 Agent 执行循环。
 
     职责：
     1. 接收用户消息，组装上下文，调用 LLM
-    2. 管理对话历史
+    2. 按 (channel, user_id) 管理各会话的对话历史
     3. 执行任务后处理链（反思 → 信号 → Observer → 指标）
     4. 检测并执行对话压缩
     """
@@ -37,6 +43,13 @@ class AgentLoop:
         *,
         model: str = "opus",
         max_history_rounds: int = 20,
+        memory_backend: str = "keyword",
+        memory_ranker: str = "keyword",
+        max_active_sessions: int = 64,
+        post_task_workers: int = 2,
+        post_task_max_pending: int = 1000,
+        reflection_batch_size: int = 0,
+        reflection_batch_wait_ms: int = 2000,
     ):
         """
         Args:
@@ -44,27 +57,48 @@ class AgentLoop:
             llm_client: 多 Provider LLM 客户端
             model: 对话推理使用的 provider 名
             max_history_rounds: 最大保留对话轮数
+            memory_backend: 记忆检索后端（"keyword" | "vector"）
+            memory_ranker: 关键词检索排序器（"keyword" | "bm25"）
+            max_active_sessions: 内存中保留的会话数，超出时换出到 workspace/sessions/
+            post_task_workers: 任务后处理链的并发 worker 数
+            post_task_max_pending: 后处理队列的内存待处理上限，超出的任务只写入 spool，稍后补充处理
+            reflection_batch_size: 批量反思的每批条数；> 1 时开启批量模式，
+                多条任务的反思与 Observer 笔记合并为一次 LLM 调用
+            reflection_batch_wait_ms: 批量反思凑批的最长等待时间（毫秒）
         """
         self.workspace = Path(workspace_path)
         self.llm = llm_client
         self.model = model
         self.max_history_rounds = max_history_rounds
+        self.reflection_batch_size = reflection_batch_size
+        self.reflection_batch_wait_ms = reflection_batch_wait_ms
 
         # --- Core 模块 ---
         rules_dir = str(self.workspace / "rules")
-        self.rules = RulesInterpreter(rules_dir)
+        # 监听规则目录：Architect / 回滚改动的规则文件在下一条消息前生效
+        self.rules = RulesInterpreter(rules_dir, watch=True)
         self.rules.load_rules()
 
-        self.memory = MemoryStore(self.workspace)
+        self.memory = MemoryStore(
+            self.workspace, backend=memory_backend, ranker=memory_ranker
+        )
         self.context_engine = ContextEngine(self.rules)
 
         # --- 对话状态 ---
-        self._conversation_history: list[dict] = []
-        self._task_counter: int = 0
-        self._background_tasks: set[asyncio.Task] = set()
+        # 每个会话独立的对话历史（含 token 前缀和）、任务计数与压缩状态
+        self.sessions = SessionManager(self.workspace / "sessions", max_active=max_active_sessions)
+        # 任务后处理链队列：spool 持久化，重启后重放未完成的任务
+        self.post_task_queue = PersistentTaskQueue(
+            self.workspace / "queue" / "post_task.jsonl",
+            self._post_task_pipeline,
+            # 批量模式下每条轨迹在凑批期间占用一个 worker，worker 数至少为批大小
+            workers=max(post_task_workers, reflection_batch_size),
+            max_pending=post_task_max_pending,
+        )
 
         # --- 扩展模块（延迟初始化，允许部分缺失） ---
         self._reflection_engine = None
+        self._reflection_batcher = None
         self._signal_detector = None
         self._signal_store = None
         self._observer_engine = None
@@ -77,9 +111,15 @@ class AgentLoop:
         """尝试初始化扩展模块，缺失则跳过。"""
         # 反思引擎
         try:
-            from extensions.memory.reflection import ReflectionEngine
+            from extensions.memory.reflection import ReflectionBatcher, ReflectionEngine
             memory_dir = str(self.workspace / "memory")
             self._reflection_engine = ReflectionEngine(self.llm, memory_dir)
+            if self.reflection_batch_size > 1:
+                self._reflection_batcher = ReflectionBatcher(
+                    self._reflection_engine,
+                    max_items=self.reflection_batch_size,
+                    max_wait_ms=self.reflection_batch_wait_ms,
+                )
         except Exception as e:
             logger.warning("ReflectionEngine not available: %s", e)
 
@@ -125,6 +165,9 @@ class AgentLoop:
         *,
         user_feedback: str | None = None,
         project: str | None = None,
+        on_delta: Callable[[str], Awaitable[None]] | None = None,
+        channel: str = DEFAULT_CHANNEL,
+        user_id: str = DEFAULT_USER,
     ) -> dict:
         """处理一条用户消息，返回完整任务轨迹。
 
@@ -132,15 +175,42 @@ class AgentLoop:
             user_message: 用户输入
             user_feedback: 对上一轮回复的反馈（用于反思）
             project: 当前项目名（用于项目级记忆）
+            on_delta: 传入时流式调用 LLM，每收到一段文本增量就 await on_delta(delta)
+            channel: 消息来源通道，与 user_id 一起确定会话
+            user_id: 通道内的用户/聊天 ID
 
         Returns:
             task_trace dict，包含 response、task_id 等
+
+        同一会话的消息串行处理，不同会话互不影响。
         """
+        session = self.sessions.get(channel, user_id)
+        session.in_use += 1
+        try:
+            async with session.lock:
+                return await self._process_in_session(
+                    session, user_message, user_feedback=user_feedback, project=project, on_delta=on_delta
+                )
+        finally:
+            session.in_use -= 1
+
+    async def _process_in_session(
+        self,
+        session: Session,
+        user_message: str,
+        *,
+        user_feedback: str | None,
+        project: str | None,
+        on_delta: Callable[[str], Awaitable[None]] | None,
+    ) -> dict:
         start_time = time.monotonic()
-        self._task_counter += 1
-        task_id = f"task_{self._task_counter:04d}"
+        history = session.history
+        task_id = session.next_task_id()
         timestamp = datetime.now().replace(microsecond=0).isoformat()
 
+        # [0] 应用规则文件变化（只重新解析变化的文件）
+        self.rules.refresh()
+
         # [1] 记忆检索
         memories = self.memory.get_relevant_memories(
             query=user_message, project=project, max_results=5
@@ -151,7 +221,7 @@ class AgentLoop:
         self.context_engine.set_task_anchor(user_message[:200])
         assembled = self.context_engine.assemble(
             user_message=user_message,
-            conversation_history=self._conversation_history,
+            conversation_history=history,
             memories=memories,
             user_preferences=user_preferences,
         )
@@ -162,9 +232,16 @@ class AgentLoop:
         ):
             try:
                 result = await self._compaction_engine.compact(
-                    self._conversation_history, keep_recent=5
+                    list(history),
+                    keep_recent=5,
+                    original_tokens=history.total_tokens,
                 )
-                self._conversation_history = result["compacted_history"]
+                history.replace(result["compacted_history"])
+                session.compaction.update({
+                    "count": session.compaction.get("count", 0) + 1,
+                    "last_at": datetime.now().replace(microsecond=0).isoformat(),
+                    "last_tokens": [result.get("original_tokens", 0), result.get("compacted_tokens", 0)],
+                })
                 logger.info(
                     "Compaction done: %d → %d tokens",
                     result.get("original_tokens", 0),
@@ -173,7 +250,7 @@ class AgentLoop:
                 # 重新组装
                 assembled = self.context_engine.assemble(
                     user_message=user_message,
-                    conversation_history=self._conversation_history,
+                    conversation_history=history,
                     memories=memories,
                     user_preferences=user_preferences,
                 )
@@ -181,13 +258,22 @@ class AgentLoop:
                 logger.error("Compaction failed: %s", e)
 
         # [4] LLM 推理
+        interrupted = False
         try:
-            response = await self.llm.complete(
-                system_prompt=assembled.system_prompt,
-                user_message=user_message,
-                model=self.model,
-                max_tokens=4000,
-            )
+            # 裁剪后的历史作为真实多轮消息发送，当前消息在最后
+            request = {
+                "system_prompt": assembled.system_blocks or assembled.system_prompt,
+                "messages": [
+                    *assembled.conversation_history,
+                    {"role": "user", "content": user_message},
+                ],
+                "model": self.model,
+                "max_tokens": 4000,
+            }
+            if on_delta is None:
+                response = await self.llm.complete_messages(**request)
+            else:
+                response, interrupted = await self._stream_response(request, on_delta)
         except Exception as e:
             logger.error("LLM call failed: %s", e)
             response = f"抱歉，处理消息时出错：{e}"
@@ -196,12 +282,18 @@ class AgentLoop:
             logger.warning("LLM returned empty response for message: %.80s", user_message)
             response = "抱歉，暂时无法生成回复，请稍后再试。"
 
+        if interrupted:
+            response = f"{response}\n\n{_STREAM_INTERRUPTED_NOTICE}"
+
         duration_ms = int((time.monotonic() - start_time) * 1000)
 
-        # [5] 更新对话历史
-        self._conversation_history.append({"role": "user", "content": user_message})
-        self._conversation_history.append({"role": "assistant", "content": response})
-        self._trim_history()
+        # [5] 更新对话历史（中断的回复不作为正常回复写入）
+        history.append({"role": "user", "content": user_message})
+        history.append({
+            "role": "assistant",
+            "content": _STREAM_INTERRUPTED_HISTORY if interrupted else response,
+        })
+        self._trim_history(history)
 
         # [6] 组装 task_trace
         task_trace = {
@@ -214,25 +306,51 @@ class AgentLoop:
             "tokens_used": assembled.total_tokens,
             "model": self.model,
             "duration_ms": duration_ms,
+            "session": {"channel": session.channel, "user_id": session.user_id},
+            "interrupted": interrupted,
         }
 
-        # [7] 异步后处理链
-        task = asyncio.create_task(self._post_task_pipeline(task_trace))
-        self._background_tasks.add(task)
-        task.add_done_callback(self._background_tasks.discard)
+        # [7] 异步后处理链（写入 spool 后立即返回，队列满时延后处理，不阻塞回复）
+        self.post_task_queue.submit_nowait(task_trace)
 
         return task_trace
 
+    async def _stream_response(
+        self, request: dict, on_delta: Callable[[str], Awaitable[None]]
+    ) -> tuple[str, bool]:
+        """流式调用 LLM，转发增量并返回 (文本, 是否中途中断)；回调出错不中断生成。"""
+        parts: list[str] = []
+        try:
+            async for delta in self.llm.stream_messages(**request):
+                parts.append(delta)
+                try:
+                    await on_delta(delta)
+                except Exception as e:
+                    logger.warning("Stream delta callback failed: %s", e)
+        except StreamInterrupted as e:
+            text = "".join(parts)
+            logger.warning("LLM stream interrupted after %d chars: %s", len(text), e)
+            return text, True
+        return "".join(parts), False
+
     async def _post_task_pipeline(self, task_trace: dict):
-        """任务后处理链：反思 → 信号检测 → Observer → 指标。"""
+        """任务后处理链：反思 → 信号检测 → Observer → 指标。
+
+        批量模式下反思与 Observer 笔记来自同一次合批 LLM 调用，结果按任务分发，
+        信号检测与指标记录仍逐任务执行。
+        """
         reflection_output = None
+        observer_note = None
 
         # [7a] 反思引擎
         if self._reflection_engine:
             try:
-                reflection_output = await self._reflection_engine.lightweight_reflect(
-                    task_trace
-                )
+                if self._reflection_batcher:
+                    reflection_output, observer_note = await self._reflection_batcher.reflect(task_trace)
+                else:
+                    reflection_output = await self._reflection_engine.lightweight_reflect(
+                        task_trace
+                    )
                 logger.info(
                     "Reflection: type=%s outcome=%s",
                     reflection_output.get("type"),
@@ -263,7 +381,7 @@ class AgentLoop:
         if self._observer_engine:
             try:
                 await self._observer_engine.lightweight_observe(
-                    task_trace, reflection_output
+                    task_trace, reflection_output, note=observer_note
                 )
             except Exception as e:
                 logger.error("Observer lightweight failed: %s", e)
@@ -293,20 +411,24 @@ class AgentLoop:
             except Exception as e:
                 logger.error("Metrics recording failed: %s", e)
 
-    def _trim_history(self):
+    def _trim_history(self, history: ConversationHistory):
         """裁剪对话历史到 max_history_rounds。"""
-        max_messages = self.max_history_rounds * 2
-        if len(self._conversation_history) > max_messages:
-            self._conversation_history = self._conversation_history[-max_messages:]
-
-    def get_conversation_history(self) -> list[dict]:
-        """返回当前对话历史。"""
-        return list(self._conversation_history)
-
-    def clear_history(self):
-        """清空对话历史。"""
-        self._conversation_history.clear()
-        self._task_counter = 0
+        history.keep_last(self.max_history_rounds * 2)
+
+    def get_conversation_history(self, channel: str = DEFAULT_CHANNEL, user_id: str = DEFAULT_USER) -> list[dict]:
+        """返回指定会话（默认为本地会话）的对话历史。"""
+        return list(self.sessions.get(channel, user_id).history)
+
+    def clear_history(self, channel: str = DEFAULT_CHANNEL, user_id: str = DEFAULT_USER):
+        """清空指定会话的对话历史与任务计数。"""
+        session = self.sessions.get(channel, user_id)
+        session.history.clear()
+        session.task_counter = 0
+
+    async def shutdown(self, timeout: float = 30.0) -> None:
+        """停止前调用：等待后处理队列清空（超时未完成的留待重启重放），持久化会话。"""
+        await self.post_task_queue.stop(timeout=timeout)
+        self.sessions.flush()
 
     async def get_daily_summary(self) -> dict | None:
         """获取今日指标汇总。"""
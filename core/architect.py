@@ -26,6 +26,9 @@ _BLAST_RADIUS_LEVEL = {
 
 _MAX_FILES_PER_LEVEL = {0: 1, 1: 3, 2: 5}  # level 3: >5 files
 
+# 长输出的 opus 生成：单次请求超时（秒），避免健康的长生成被超时打断后重试、转移到其它模型
+_LLM_ATTEMPT_TIMEOUT = 300.0
+
 # ──────────────────────────────────────
 #  提示词
 # ──────────────────────────────────────
@@ -119,6 +122,8 @@ class ArchitectEngine:
                 user_message=user_message,
                 model=self.model,
                 max_tokens=3000,
+                priority="background",
+                attempt_timeout=_LLM_ATTEMPT_TIMEOUT,
             )
         except Exception as exc:
             logger.error("Architect LLM call failed: %s", exc)
@@ -419,6 +424,8 @@ class ArchitectEngine:
                     ),
                     model=self.model,
                     max_tokens=1500,
+                    priority="background",
+                    attempt_timeout=_LLM_ATTEMPT_TIMEOUT,
                 )
             except Exception as exc:
                 logger.error("Content generation failed: %s", exc)
@@ -19,6 +19,8 @@ class BaseChannel(ABC):
     """
 
     name: str = "base"
+    # Channels that can progressively edit a reply set this and implement open_stream()
+    supports_streaming: bool = False
 
     def __init__(self) -> None:
         self.bus: "MessageBus | None" = None
@@ -47,6 +49,14 @@ class BaseChannel(ABC):
     ) -> None:
         """Send a message to the given user."""
 
+    def open_stream(self, user_id: str) -> Any:
+        """Open a streamed reply to the given user.
+
+        The returned object provides ``start()``, ``append(delta)`` and
+        ``finish(text)`` coroutines. Only available when ``supports_streaming``.
+        """
+        raise NotImplementedError(f"{self.name} does not support streaming replies")
+
     @property
     def is_running(self) -> bool:
         """Check if the channel is currently running."""
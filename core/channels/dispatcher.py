@@ -0,0 +1,125 @@
+"""Concurrent inbound dispatcher with ordered per-session lanes."""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Hashable
+
+from core.channels.bus import InboundMessage
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[InboundMessage], Awaitable[None]]
+
+
+def is_callback(msg: InboundMessage) -> bool:
+    """Whether the message is an inline-button callback (approval etc.)."""
+    return bool(msg.metadata.get("callback_data"))
+
+
+class SessionDispatcher:
+    """
+    Runs inbound messages concurrently while keeping per-session order.
+
+    - Each (channel, user_id) session has its own lane; messages in a lane are
+      handled strictly one after another, different lanes run in parallel.
+    - Regular messages share a bounded pool of ``max_workers`` slots, so a slow
+      LLM call only blocks its own session.
+    - Messages matching ``fast_lane`` (callback buttons by default) go to a
+      separate per-session lane that does not wait for a worker slot.
+    """
+
+    def __init__(
+        self,
+        handler: Handler,
+        *,
+        max_workers: int = 8,
+        fast_lane: Callable[[InboundMessage], bool] = is_callback,
+    ) -> None:
+        self._handler = handler
+        self._fast_lane = fast_lane
+        self.max_workers = max_workers
+        self._slots = asyncio.Semaphore(max_workers)
+        self._lanes: dict[Hashable, deque[InboundMessage]] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.active = 0
+        self.processed = 0
+        self.failed = 0
+
+    # ------------------------------------------------------------------
+    # Submission
+    # ------------------------------------------------------------------
+
+    def submit(self, msg: InboundMessage) -> None:
+        """Queue a message on its session lane, starting the lane if idle."""
+        fast = self._fast_lane(msg)
+        key = (msg.channel, msg.user_id, "fast" if fast else "chat")
+        lane = self._lanes.get(key)
+        if lane is not None:
+            lane.append(msg)
+            return
+        self._lanes[key] = deque([msg])
+        task = asyncio.create_task(self._run_lane(key, fast))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_lane(self, key: Hashable, fast: bool) -> None:
+        lane = self._lanes[key]
+        try:
+            while lane:
+                if fast:
+                    await self._handle(lane[0])
+                else:
+                    async with self._slots:
+                        await self._handle(lane[0])
+                lane.popleft()
+        finally:
+            self._lanes.pop(key, None)
+
+    async def _handle(self, msg: InboundMessage) -> None:
+        self.active += 1
+        try:
+            await self._handler(msg)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error("Handler failed for %s/%s: %s", msg.channel, msg.user_id, e, exc_info=True)
+        finally:
+            self.active -= 1
+
+    # ------------------------------------------------------------------
+    # State
+    # ------------------------------------------------------------------
+
+    @property
+    def pending(self) -> int:
+        """Messages queued or in progress across all lanes."""
+        return sum(len(lane) for lane in self._lanes.values())
+
+    @property
+    def sessions(self) -> int:
+        """Number of lanes with work."""
+        return len(self._lanes)
+
+    # ------------------------------------------------------------------
+    # Shutdown
+    # ------------------------------------------------------------------
+
+    async def drain(self, timeout: float | None = None) -> bool:
+        """Wait until all lanes are empty. Returns False on timeout."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while self._tasks:
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                return False
+            await asyncio.wait(set(self._tasks), timeout=remaining)
+        return True
+
+    async def cancel(self) -> None:
+        """Cancel in-flight lanes and drop queued messages."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._lanes.clear()
@@ -2,6 +2,7 @@
 
 import asyncio
 import logging
+import time
 from dataclasses import dataclass, field
 from typing import Any
 
@@ -11,6 +12,109 @@ from core.channels.bus import InboundMessage, MessageBus
 logger = logging.getLogger(__name__)
 
 
+# Telegram 单条消息上限 4096，留出余量
+MAX_MESSAGE_LEN = 4000
+
+
+def split_message(text: str, max_len: int = MAX_MESSAGE_LEN) -> list[str]:
+    """将长消息分段。
+
+    分段点只取决于前 max_len 个字符，文本只在末尾增长时已满的分段保持不变。
+    """
+    if len(text) <= max_len:
+        return [text]
+    chunks = []
+    while text:
+        if len(text) <= max_len:
+            chunks.append(text)
+            break
+        # 在 max_len 附近找换行符
+        split_at = text.rfind("\n", 0, max_len)
+        if split_at == -1:
+            split_at = max_len
+        chunks.append(text[:split_at])
+        text = text[split_at:].lstrip("\n")
+    return chunks
+
+
+class TelegramReplyStream:
+    """流式回复：先发占位消息，随生成进度节流编辑，超长时续发新消息。"""
+
+    def __init__(
+        self,
+        bot,
+        chat_id: int,
+        *,
+        placeholder: str = "…",
+        edit_interval: float = 1.0,
+        max_len: int = MAX_MESSAGE_LEN,
+    ) -> None:
+        """
+        Args:
+            bot: python-telegram-bot 的 Bot 实例
+            chat_id: 目标 chat_id
+            placeholder: 占位消息文本
+            edit_interval: 两次编辑之间的最小间隔（秒），避免触发 Telegram 限流
+            max_len: 单条消息最大长度
+        """
+        self._bot = bot
+        self._chat_id = chat_id
+        self.placeholder = placeholder
+        self.edit_interval = edit_interval
+        self.max_len = max_len
+        self._text = ""
+        self._message_ids: list[int] = []
+        self._shown: list[str] = []
+        self._last_render = 0.0
+
+    @property
+    def text(self) -> str:
+        """目前收到的全部文本。"""
+        return self._text
+
+    async def start(self) -> None:
+        """发送占位消息。"""
+        await self._render(self.placeholder)
+
+    async def append(self, delta: str) -> None:
+        """追加文本增量；距上次编辑超过 edit_interval 时刷新显示。"""
+        self._text += delta
+        if time.monotonic() - self._last_render >= self.edit_interval:
+            await self._render(self._text)
+
+    async def finish(self, text: str | None = None) -> None:
+        """显示最终文本（默认为收到的全部增量）。"""
+        final = self._text if text is None else text
+        await self._render(final or self.placeholder)
+
+    async def _render(self, text: str) -> None:
+        chunks = split_message(text, self.max_len)
+        for i, chunk in enumerate(chunks):
+            try:
+                if i < len(self._message_ids):
+                    if self._shown[i] != chunk:
+                        await self._bot.edit_message_text(
+                            chat_id=self._chat_id, message_id=self._message_ids[i], text=chunk
+                        )
+                        self._shown[i] = chunk
+                else:
+                    message = await self._bot.send_message(chat_id=self._chat_id, text=chunk)
+                    self._message_ids.append(message.message_id)
+                    self._shown.append(chunk)
+            except Exception as e:
+                logger.error("Failed to update streamed reply to %s: %s", self._chat_id, e)
+                break
+        # 最终文本比已发出的消息少（如生成失败后替换为错误提示）时删除多余消息
+        while len(self._message_ids) > len(chunks):
+            message_id = self._message_ids.pop()
+            self._shown.pop()
+            try:
+                await self._bot.delete_message(chat_id=self._chat_id, message_id=message_id)
+            except Exception as e:
+                logger.warning("Failed to delete streamed reply message %s: %s", message_id, e)
+        self._last_render = time.monotonic()
+
+
 @dataclass
 class TelegramChannelConfig:
     token: str
@@ -27,6 +131,7 @@ class TelegramInboundChannel(BaseChannel):
     """
 
     name = "telegram"
+    supports_streaming = True
 
     def __init__(self, token: str, allowed_chat_ids: list[str], proxy: str | None = None) -> None:
         super().__init__()
@@ -130,6 +235,18 @@ class TelegramInboundChannel(BaseChannel):
         except Exception as e:
             logger.error("Failed to send Telegram message to %s: %s", user_id, e)
 
+    def open_stream(self, user_id: str) -> TelegramReplyStream | None:
+        """创建逐步编辑的流式回复；bot 未运行或 user_id 非法时返回 None。"""
+        if not self._app:
+            logger.warning("TelegramInboundChannel: bot not running, cannot stream")
+            return None
+        try:
+            chat_id_int = int(user_id)
+        except (ValueError, TypeError):
+            logger.error("Invalid user_id format: %s", user_id)
+            return None
+        return TelegramReplyStream(self._app.bot, chat_id_int)
+
     # ──────────────────────────────────────
     #  内部处理器
     # ──────────────────────────────────────
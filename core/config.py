@@ -35,8 +35,24 @@ _DEFAULTS: dict[str, Any] = {
     "llm": {
         "providers": _DEFAULT_PROVIDERS,
         "aliases": _DEFAULT_ALIASES,
+        "response_cache": {"enabled": True, "ttl_hours": 168, "max_entries": 5000},
+        "resilience": {},
+        "failover": {},
+    },
+    "agent_loop": {
+        "model": "opus",
+        "max_active_sessions": 64,
+        "post_task": {
+            "workers": 2,
+            "max_pending": 1000,
+            "batch": {"enabled": False, "max_items": 8, "max_wait_ms": 2000},
+        },
+    },
+    "bus": {"max_workers": 8},
+    "memory": {
+        "retrieval": {"backend": "keyword", "ranker": "keyword"},
+        "retention": {"enabled": True, "cron": "30 3 * * *"},
     },
-    "agent_loop": {"model": "opus"},
     "observer": {
         "light_mode": {"enabled": True, "model": "qwen"},
         "deep_mode": {"schedule": "02:00", "model": "opus", "emergency_threshold": 3},
@@ -140,6 +156,31 @@ class EvoConfig:
         """模型名别名映射。"""
         return dict(self.get("llm.aliases", _DEFAULT_ALIASES))
 
+    @property
+    def llm_response_cache_enabled(self) -> bool:
+        """是否为确定性辅助调用启用 LLM 响应缓存。"""
+        return bool(self.get("llm.response_cache.enabled", True))
+
+    @property
+    def llm_response_cache_ttl_hours(self) -> float:
+        """响应缓存条目有效期（小时）。"""
+        return float(self.get("llm.response_cache.ttl_hours", 168))
+
+    @property
+    def llm_response_cache_max_entries(self) -> int:
+        """响应缓存最多保留的条目数。"""
+        return int(self.get("llm.response_cache.max_entries", 5000))
+
+    @property
+    def llm_resilience(self) -> dict[str, Any]:
+        """LLM 重试/超时/对冲参数（见 core/llm_resilience.ResiliencePolicy），未配置的键取默认值。"""
+        return dict(self.get("llm.resilience", {}) or {})
+
+    @property
+    def llm_failover(self) -> dict[str, list[str]]:
+        """按 provider 的故障转移链，如 {"opus": ["qwen"]}。"""
+        return {k: list(v or []) for k, v in (self.get("llm.failover", {}) or {}).items()}
+
     # ── 各组件模型选择 ──
 
     @property
@@ -147,6 +188,36 @@ class EvoConfig:
         """Agent Loop（Telegram 对话）使用的模型。"""
         return str(self.get("agent_loop.model", "opus"))
 
+    @property
+    def agent_loop_max_active_sessions(self) -> int:
+        """内存中保留的对话会话数，超出时最久未用的会话换出到磁盘。"""
+        return int(self.get("agent_loop.max_active_sessions", 64))
+
+    @property
+    def post_task_workers(self) -> int:
+        """任务后处理链（反思/信号/观察/指标）的并发 worker 数。"""
+        return int(self.get("agent_loop.post_task.workers", 2))
+
+    @property
+    def post_task_max_pending(self) -> int:
+        """后处理队列的内存待处理上限；AgentLoop 入队不等待，超出的任务只写入 spool，worker 空闲时补充。"""
+        return int(self.get("agent_loop.post_task.max_pending", 1000))
+
+    @property
+    def post_task_batch_enabled(self) -> bool:
+        """是否开启批量反思（多条任务的反思与 Observer 笔记合并为一次 LLM 调用）。"""
+        return bool(self.get("agent_loop.post_task.batch.enabled", False))
+
+    @property
+    def post_task_batch_max_items(self) -> int:
+        """批量反思每批最多的任务数，凑满即发出。"""
+        return int(self.get("agent_loop.post_task.batch.max_items", 8))
+
+    @property
+    def post_task_batch_max_wait_ms(self) -> int:
+        """批量反思凑批的最长等待时间（毫秒）。"""
+        return int(self.get("agent_loop.post_task.batch.max_wait_ms", 2000))
+
     @property
     def observer_light_model(self) -> str:
         """Observer 轻量模式使用的模型。"""
@@ -162,6 +233,33 @@ class EvoConfig:
         """Architect 使用的模型。"""
         return str(self.get("architect.model", "opus"))
 
+    @property
+    def bus_max_workers(self) -> int:
+        """Bus 桥接同时处理的会话数上限（同一用户的消息仍按顺序处理）。"""
+        return int(self.get("bus.max_workers", 8))
+
+    # ── 记忆检索配置 ──
+
+    @property
+    def memory_backend(self) -> str:
+        """记忆检索后端："keyword"（倒排索引）或 "vector"（本地向量）。"""
+        return str(self.get("memory.retrieval.backend", "keyword"))
+
+    @property
+    def memory_ranker(self) -> str:
+        """关键词检索排序器："keyword" 或 "bm25"。"""
+        return str(self.get("memory.retrieval.ranker", "keyword"))
+
+    @property
+    def memory_retention_enabled(self) -> bool:
+        """是否定时整理只追加的记忆文件（去重、归档、大小上限）。"""
+        return bool(self.get("memory.retention.enabled", True))
+
+    @property
+    def memory_retention_cron(self) -> str:
+        """记忆整理任务 cron 表达式。"""
+        return str(self.get("memory.retention.cron", "30 3 * * *"))
+
     # ── 调度配置 ──
 
     @property
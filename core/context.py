@@ -1,9 +1,12 @@
 """上下文引擎 — token 预算管理与 prompt 组装。"""
 
 import logging
+from bisect import bisect_left
 from dataclasses import dataclass, field
 
+from core.llm_client import system_block
 from core.rules import RulesInterpreter
+from core.tokens import count_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -53,12 +56,15 @@ class ContextSection:
     content: str
     tokens: int = 0
     priority: int = 0  # 越高越优先保留
+    cacheable: bool = False  # 跨消息基本稳定，作为 prompt cache 前缀
 
 
 @dataclass
 class AssembledContext:
     """组装完成的上下文。"""
     system_prompt: str = ""
+    # 同一内容的结构化块：稳定区段各带 cache 断点，动态区段合并为最后一块
+    system_blocks: list[dict] = field(default_factory=list)
     conversation_history: list[dict] = field(default_factory=list)
     total_tokens: int = 0
     sections_used: list[str] = field(default_factory=list)
@@ -66,21 +72,81 @@ class AssembledContext:
 
 
 def estimate_tokens(text: str) -> int:
-    """粗略估算 token 数（中英混合取 len/2）。"""
-    if not text:
-        return 0
-    return len(text) // 2
+    """估算 token 数（core.tokens 统一计数器，按真实 usage 校准）。"""
+    return count_tokens(text)
 
 
 def truncate_to_tokens(text: str, max_tokens: int) -> str:
     """截断文本到指定 token 预算。"""
-    if estimate_tokens(text) <= max_tokens:
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
         return text
-    # 粗略：每 token ≈ 2 字符
-    max_chars = max_tokens * 2
+    # 按该文本自身的字符/token 比例换算截断位置
+    max_chars = max(0, len(text) * max_tokens // tokens)
     return text[:max_chars] + "\n\n[... 因 token 预算限制已截断 ...]"
 
 
+class ConversationHistory:
+    """带 token 前缀和的对话历史。
+
+    每条消息只在追加时估算一次 token，``_prefix[i]`` 为前 i 条的累计 token 数。
+    按预算保留最近消息时二分查找切点，不再逐条重新估算。
+    """
+
+    def __init__(self, messages: list[dict] | None = None):
+        self._messages: list[dict] = []
+        self._prefix: list[int] = [0]
+        self.extend(messages or [])
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self):
+        return iter(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    @property
+    def total_tokens(self) -> int:
+        """全部消息的 token 数。"""
+        return self._prefix[-1]
+
+    def append(self, message: dict) -> None:
+        self._messages.append(message)
+        self._prefix.append(self._prefix[-1] + estimate_tokens(message.get("content", "")))
+
+    def extend(self, messages: list[dict]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def keep_last(self, count: int) -> None:
+        """只保留最近 count 条消息。"""
+        drop = len(self._messages) - max(count, 0)
+        if drop <= 0:
+            return
+        base = self._prefix[drop]
+        self._messages = self._messages[drop:]
+        self._prefix = [p - base for p in self._prefix[drop:]]
+
+    def replace(self, messages: list[dict]) -> None:
+        """整体替换（如压缩后）。"""
+        self.clear()
+        self.extend(messages)
+
+    def clear(self) -> None:
+        self._messages = []
+        self._prefix = [0]
+
+    def tail_within(self, max_tokens: int) -> tuple[list[dict], int]:
+        """返回 token 总数不超过预算的最长后缀及其 token 数。"""
+        total = self._prefix[-1]
+        start = bisect_left(self._prefix, total - max_tokens)
+        if start >= len(self._prefix):
+            return [], 0
+        return self._messages[start:], total - self._prefix[start]
+
+
 class ContextEngine:
     """上下文引擎。负责 token 预算管理和 prompt 组装。"""
 
@@ -105,7 +171,7 @@ class ContextEngine:
     def assemble(
         self,
         user_message: str,
-        conversation_history: list[dict] | None = None,
+        conversation_history: list[dict] | ConversationHistory | None = None,
         memories: list[str] | None = None,
         user_preferences: str = "",
         error_trace: str = "",
@@ -119,7 +185,8 @@ class ContextEngine:
 
         Args:
             user_message: 当前用户消息
-            conversation_history: 对话历史 [{"role": "user"|"assistant", "content": "..."}]
+            conversation_history: 对话历史 [{"role": "user"|"assistant", "content": "..."}]，
+                传 ConversationHistory 时用其前缀和裁剪
             memories: 检索到的相关记忆片段
             user_preferences: 用户偏好摘要
             error_trace: 相关错误轨迹
@@ -135,11 +202,11 @@ class ContextEngine:
         budget_usage = {}
 
         # === 1. 系统身份 + 宪法规则（最高优先级，放前部） ===
-        identity_budget = self.budget.get_budget("system_identity")
+        # 宪法与经验规则一次选出，经验规则只打分一次
         rules_result = self.rules.build_system_prompt_section(
             task_context=user_message,
-            constitution_budget=identity_budget,
-            experience_budget=0,  # 经验规则单独处理
+            constitution_budget=self.budget.get_budget("system_identity"),
+            experience_budget=self.budget.get_budget("experience_rules"),
         )
         if rules_result["constitution_prompt"]:
             sections.append(ContextSection(
@@ -147,6 +214,7 @@ class ContextEngine:
                 content=rules_result["constitution_prompt"],
                 tokens=rules_result["constitution_tokens"],
                 priority=100,
+                cacheable=True,
             ))
         budget_usage["constitution"] = rules_result["constitution_tokens"]
 
@@ -165,21 +233,15 @@ class ContextEngine:
             ))
             budget_usage["task_anchor"] = anchor_tokens
 
-        # === 3. 经验规则（动态，放后部） ===
-        exp_budget = self.budget.get_budget("experience_rules")
-        exp_result = self.rules.build_system_prompt_section(
-            task_context=user_message,
-            constitution_budget=0,
-            experience_budget=exp_budget,
-        )
-        if exp_result["experience_prompt"]:
+        # === 3. 经验规则（按消息选出，动态，放后部；不设缓存断点） ===
+        if rules_result["experience_prompt"]:
             sections.append(ContextSection(
                 name="experience_rules",
-                content=exp_result["experience_prompt"],
-                tokens=exp_result["experience_tokens"],
+                content=rules_result["experience_prompt"],
+                tokens=rules_result["experience_tokens"],
                 priority=70,
             ))
-        budget_usage["experience_rules"] = exp_result["experience_tokens"]
+        budget_usage["experience_rules"] = rules_result["experience_tokens"]
 
         # === 4. 相关记忆 ===
         if memories:
@@ -226,18 +288,27 @@ class ContextEngine:
             budget_usage["error_trace"] = err_tokens
 
         # === 组装 system prompt ===
-        # 按优先级排序：高优先级在前（宪法规则前置利于 KV-cache）
-        sections.sort(key=lambda s: s.priority, reverse=True)
+        # 稳定区段（宪法）在前作为 prompt cache 前缀，其余按优先级在后
+        sections.sort(key=lambda s: (s.cacheable, s.priority), reverse=True)
         system_parts = [s.content for s in sections if s.content]
         result.system_prompt = "\n\n".join(system_parts)
+        result.system_blocks = [
+            system_block(s.content, cache=True) for s in sections if s.cacheable and s.content
+        ]
+        dynamic = "\n\n".join(s.content for s in sections if not s.cacheable and s.content)
+        if dynamic:
+            result.system_blocks.append(system_block(dynamic))
         system_tokens = sum(s.tokens for s in sections)
 
         # === 7. 对话历史（在 system prompt 之后分配剩余预算） ===
         history_budget = self.budget.get_budget("history")
-        trimmed_history = self._trim_history(conversation_history, history_budget)
-        history_tokens = sum(
-            estimate_tokens(m.get("content", "")) for m in trimmed_history
-        )
+        if isinstance(conversation_history, ConversationHistory):
+            trimmed_history, history_tokens = conversation_history.tail_within(history_budget)
+        else:
+            trimmed_history = self._trim_history(conversation_history, history_budget)
+            history_tokens = sum(
+                estimate_tokens(m.get("content", "")) for m in trimmed_history
+            )
         budget_usage["history"] = history_tokens
 
         result.conversation_history = trimmed_history
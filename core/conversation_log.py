@@ -0,0 +1,244 @@
+"""对话日志 — 分段追加写入的对话存储，替代每个对话一个 JSON 文件。
+
+磁盘格式（workspace/memory/conversations/）：
+- seg-000001.jsonl …：对话记录段，每行一条完整对话（紧凑 JSON）；
+  当前段超过 segment_bytes 后滚动到新段
+- manifest.jsonl：偏移索引，每次保存追加一行
+  {"id", "seg", "offset", "length", "timestamp", "mtime_ns", "message_count", "metadata"}
+  写入顺序即修改时间顺序；同一对话重复保存时以最后一行为准
+
+列出最近对话只读 manifest（加载时一次性读入内存），读取单个对话只 seek 一次。
+manifest 作废行过多时重写（原子替换）；段内记录全部作废后删除段文件。
+旧版 conversations/*.json 在首次加载时按 mtime 顺序导入，原文件移入 legacy/。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEGMENT_BYTES = 4 * 1024 * 1024
+
+
+class ConversationLog:
+    """分段追加写入的对话存储，带按修改时间排序的内存 manifest。"""
+
+    def __init__(self, log_dir: str | Path, *, segment_bytes: int = DEFAULT_SEGMENT_BYTES):
+        """
+        Args:
+            log_dir: 日志目录（memory/conversations/）
+            segment_bytes: 单个段文件的滚动阈值（字节）
+        """
+        self.log_dir = Path(log_dir)
+        self.manifest_path = self.log_dir / "manifest.jsonl"
+        self.segment_bytes = segment_bytes
+
+        self._entries: OrderedDict[str, dict] = OrderedDict()  # 旧 → 新
+        self._live: dict[int, int] = {}      # 段号 → 有效记录数
+        self._manifest_lines = 0
+        self._active_seg = 1
+        self._active_size = 0
+
+    # ──────────────────────────────────────
+    #  持久化
+    # ──────────────────────────────────────
+
+    def load(self) -> None:
+        """读取 manifest 重建内存索引，并导入旧版 JSON 文件。"""
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self._entries = OrderedDict()
+        self._live = {}
+        self._manifest_lines = 0
+
+        segments = sorted(self._segment_number(p) for p in self.log_dir.glob("seg-*.jsonl"))
+        self._active_seg = segments[-1] if segments else 1
+        sizes = {n: self.segment_path(n).stat().st_size for n in segments}
+        self._active_size = sizes.get(self._active_seg, 0)
+
+        if self.manifest_path.exists():
+            try:
+                with self.manifest_path.open("r", encoding="utf-8") as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        self._manifest_lines += 1
+                        try:
+                            entry = json.loads(line)
+                            end = entry["offset"] + entry["length"]
+                        except (json.JSONDecodeError, KeyError, TypeError):
+                            continue
+                        # 指向段文件之外的行（段被截断）丢弃
+                        if end > sizes.get(entry["seg"], 0):
+                            continue
+                        self._track(entry)
+            except OSError as e:
+                logger.warning(f"Conversation manifest unreadable: {e}")
+
+        self._import_legacy()
+
+    @staticmethod
+    def _segment_number(path: Path) -> int:
+        return int(path.stem.split("-", 1)[1])
+
+    def segment_path(self, seg: int) -> Path:
+        return self.log_dir / f"seg-{seg:06d}.jsonl"
+
+    def _track(self, entry: dict) -> None:
+        """把 manifest 行并入内存索引（移到最新位置）。"""
+        previous = self._entries.pop(entry["id"], None)
+        self._entries[entry["id"]] = entry
+        self._live[entry["seg"]] = self._live.get(entry["seg"], 0) + 1
+        if previous is not None:
+            self._release(previous["seg"])
+
+    def _release(self, seg: int) -> None:
+        """段内一条记录作废；非当前段全部作废时删除段文件。"""
+        self._live[seg] = self._live.get(seg, 1) - 1
+        if self._live[seg] <= 0 and seg != self._active_seg:
+            del self._live[seg]
+            self.segment_path(seg).unlink(missing_ok=True)
+
+    def _import_legacy(self) -> None:
+        """导入旧版每对话一个 JSON 的文件（按 mtime 顺序），原文件移入 legacy/。"""
+        legacy = []
+        for path in self.log_dir.glob("*.json"):
+            try:
+                legacy.append((path.stat().st_mtime_ns, path))
+            except OSError:
+                continue
+        if not legacy:
+            return
+
+        legacy_dir = self.log_dir / "legacy"
+        legacy_dir.mkdir(exist_ok=True)
+        imported = 0
+        for _, path in sorted(legacy):
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                conversation_id = data.get("conversation_id", path.stem)
+                self.append(
+                    conversation_id,
+                    data.get("messages", []),
+                    data.get("metadata", {}),
+                    timestamp=data.get("timestamp", ""),
+                )
+            except (OSError, json.JSONDecodeError, AttributeError) as e:
+                logger.warning(f"Skipping malformed conversation file: {path} ({e})")
+                continue
+            shutil.move(str(path), legacy_dir / path.name)
+            imported += 1
+        if imported:
+            logger.info(f"Imported {imported} legacy conversation files into the log")
+
+    def _compact_manifest(self) -> None:
+        """只保留有效行重写 manifest（原子替换）。"""
+        tmp = self.manifest_path.with_suffix(".tmp")
+        tmp.write_text(
+            "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in self._entries.values()),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.manifest_path)
+        self._manifest_lines = len(self._entries)
+
+    # ──────────────────────────────────────
+    #  写入
+    # ──────────────────────────────────────
+
+    def append(
+        self,
+        conversation_id: str,
+        messages: list[dict],
+        metadata: dict | None = None,
+        *,
+        timestamp: str | None = None,
+    ) -> dict:
+        """追加一条对话记录（同 ID 的旧记录作废）。
+
+        Returns:
+            manifest 条目
+        """
+        record = {
+            "conversation_id": conversation_id,
+            "timestamp": timestamp or datetime.now().isoformat(),
+            "messages": messages,
+            "metadata": metadata or {},
+        }
+        data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+        if self._active_size and self._active_size + len(data) > self.segment_bytes:
+            previous_seg = self._active_seg
+            self._active_seg += 1
+            self._active_size = 0
+            if not self._live.get(previous_seg):
+                self._release(previous_seg)
+        with self.segment_path(self._active_seg).open("ab") as f:
+            f.write(data)
+
+        entry = {
+            "id": conversation_id,
+            "seg": self._active_seg,
+            "offset": self._active_size,
+            "length": len(data),
+            "timestamp": record["timestamp"],
+            "mtime_ns": time.time_ns(),
+            "message_count": len(messages),
+            "metadata": record["metadata"],
+        }
+        self._active_size += len(data)
+
+        with self.manifest_path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._manifest_lines += 1
+        self._track(entry)
+
+        if self._manifest_lines > max(64, 2 * len(self._entries)):
+            self._compact_manifest()
+        return entry
+
+    # ──────────────────────────────────────
+    #  查询
+    # ──────────────────────────────────────
+
+    def entry(self, conversation_id: str) -> dict | None:
+        """返回 manifest 条目（不读取段文件）。"""
+        return self._entries.get(conversation_id)
+
+    def get(self, conversation_id: str) -> dict | None:
+        """读取完整对话记录 {"conversation_id", "timestamp", "messages", "metadata"}。"""
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return None
+        try:
+            with self.segment_path(entry["seg"]).open("rb") as f:
+                f.seek(entry["offset"])
+                return json.loads(f.read(entry["length"]))
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Failed to read conversation {conversation_id}: {e}")
+            return None
+
+    def recent(self, limit: int) -> list[dict]:
+        """最近修改的 manifest 条目，新 → 旧。"""
+        result = []
+        for entry in reversed(self._entries.values()):
+            if len(result) >= limit:
+                break
+            result.append(entry)
+        return result
+
+    def entries(self) -> list[dict]:
+        """全部有效 manifest 条目，旧 → 新。"""
+        return list(self._entries.values())
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return conversation_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -224,6 +224,7 @@ async def run_council_review(
                 system_prompt=role_info["system_prompt"],
                 user_message=proposal_text,
                 model=model,
+                priority="background",
             )
             concern, recommendation = _parse_member_response(response)
         except Exception as exc:
@@ -260,6 +261,7 @@ async def run_council_review(
             system_prompt=conclusion_system,
             user_message=conclusion_user,
             model=model,
+            priority="background",
         )
         conclusion, summary = _parse_conclusion_response(conclusion_response)
     except Exception as exc:
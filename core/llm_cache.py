@@ -0,0 +1,151 @@
+"""LLM 响应缓存 — 按请求内容寻址的 SQLite 持久化缓存。
+
+只用于确定性的辅助调用（分类、抽取、摘要等）：调用方以 ``cache=True`` 显式开启，
+相同的 (provider, model_id, system_prompt, messages, max_tokens) 直接返回上次的响应，
+不再请求 provider。重试、重复消息、对同一内容重跑时命中。
+提示中含任务 ID、耗时等逐次变化字段的调用（如反思、轻量观察）不应开启，否则只会写入永不命中的条目。
+
+淘汰策略：
+- TTL：写入超过 ttl_seconds 的条目视为过期，读取时删除；
+- 大小：条目数或响应总字节数超过上限时，按最近访问时间删除最旧的条目。
+
+空响应（调用失败）不写入缓存。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    nbytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at);
+"""
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """带 TTL 与容量上限的 LLM 响应缓存。"""
+
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_entries: int = 5000,
+        max_bytes: int = 32 * 1024 * 1024,
+    ):
+        """
+        Args:
+            path: SQLite 文件路径（父目录不存在时自动创建）；":memory:" 表示不落盘
+            ttl_seconds: 条目有效期（秒）
+            max_entries: 最多保留的条目数
+            max_bytes: 响应文本总字节上限
+        """
+        self.path = str(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(
+        provider: str,
+        model_id: str,
+        system_prompt: str,
+        messages: list[dict],
+        max_tokens: int,
+    ) -> str:
+        """由请求内容计算缓存键；system_prompt 与 messages 只以哈希参与。"""
+        messages_json = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+        return _sha256(
+            "\0".join([provider, model_id, _sha256(system_prompt), _sha256(messages_json), str(max_tokens)])
+        )
+
+    def get(self, key: str) -> str | None:
+        """返回未过期的缓存响应并刷新访问时间；未命中返回 None。"""
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        response, created_at = row
+        if now - created_at > self.ttl_seconds:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+            self.misses += 1
+            return None
+        self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        self.hits += 1
+        return response
+
+    def put(self, key: str, response: str) -> None:
+        """写入响应（空响应忽略），随后按 TTL 与容量上限淘汰。"""
+        if not response:
+            return
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, nbytes, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, response, len(response.encode("utf-8")), now, now),
+        )
+        self._evict(now)
+        self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM responses"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # 从最久未访问的条目开始删除，直到同时满足两个上限
+        doomed = []
+        rows = self._conn.execute("SELECT key, nbytes FROM responses ORDER BY accessed_at ASC")
+        for key, nbytes in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            count -= 1
+            total -= nbytes
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        logger.debug("Response cache evicted %d entries", len(doomed))
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> dict[str, int]:
+        """命中/未命中次数与当前条目数。"""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self)}
+
+    def clear(self) -> None:
+        """删除所有条目（计数器不变）。"""
+        self._conn.execute("DELETE FROM responses")
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
@@ -3,14 +3,80 @@
 支持 anthropic 和 openai 兼容两种后端，通过配置动态路由。
 """
 
+import asyncio
 import json
 import logging
 import os
+import time
 from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
 from typing import Any
 
+from core.llm_cache import ResponseCache
+from core.llm_limits import BACKGROUND, INTERACTIVE, ProviderLimiter
+from core.llm_resilience import LatencyTracker, ResiliencePolicy, is_retryable
+from core.tokens import TokenCounter, default_counter
+
 logger = logging.getLogger(__name__)
 
+# Anthropic 单次请求最多 4 个 cache_control 断点
+MAX_CACHE_BREAKPOINTS = 4
+_USAGE_FIELDS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_creation_input_tokens",
+    "cache_read_input_tokens",
+)
+
+
+class StreamInterrupted(Exception):
+    """流式调用在产出部分文本后失败（断流、空闲超时或超过截止时间）。"""
+
+
+def _total_tokens(usage: dict[str, int]) -> int:
+    """一次调用的总 token 数（输入含 cache 读写，加输出）。"""
+    return sum(usage.get(key, 0) for key in _USAGE_FIELDS)
+
+
+def system_block(text: str, *, cache: bool = False) -> dict:
+    """构造一个结构化 system 文本块；cache=True 时在块末尾设置缓存断点。"""
+    block: dict[str, Any] = {"type": "text", "text": text}
+    if cache:
+        block["cache_control"] = {"type": "ephemeral"}
+    return block
+
+
+def system_text(system_prompt: str | list[dict]) -> str:
+    """把 system_prompt（字符串或结构化块列表）展平为纯文本，块之间空一行。"""
+    if isinstance(system_prompt, str):
+        return system_prompt
+    return "\n\n".join(block["text"] for block in system_prompt if block.get("text"))
+
+
+def chat_messages(messages: list[dict]) -> list[dict]:
+    """规范化多轮消息为 user/assistant 严格交替、以 user 开头的 ``{"role", "content"}`` 列表。
+
+    只保留 role/content；``role="system"`` 的消息（如压缩摘要）作为 user 消息发送；
+    相邻同角色消息合并；开头的 assistant 消息与空消息丢弃。
+    """
+    result: list[dict] = []
+    for message in messages:
+        content = str(message.get("content", "") or "")
+        if not content.strip():
+            continue
+        role = message.get("role")
+        if role == "system":
+            role, content = "user", f"[对话摘要]\n{content}"
+        elif role != "assistant":
+            role = "user"
+        if not result and role == "assistant":
+            continue
+        if result and result[-1]["role"] == role:
+            result[-1]["content"] += "\n\n" + content
+        else:
+            result.append({"role": role, "content": content})
+    return result
+
 
 class BaseLLMClient(ABC):
     """LLM 客户端抽象基类。"""
@@ -18,19 +84,31 @@ class BaseLLMClient(ABC):
     @abstractmethod
     async def complete(
         self,
-        system_prompt: str,
+        system_prompt: str | list[dict],
         user_message: str,
         model: str = "opus",
         max_tokens: int = 2000,
+        *,
+        cache: bool = False,
+        priority: str = INTERACTIVE,
+        attempt_timeout: float | None = None,
     ) -> str:
         """
         调用 LLM 并返回文本响应。
 
         Args:
-            system_prompt: 系统提示词
+            system_prompt: 系统提示词；也可以是 system_block() 构造的块列表，
+                anthropic 后端按块发送并在带 cache_control 的块处设置 prompt cache 断点，
+                其它后端展平为纯文本
             user_message: 用户消息
             model: Provider 名称（如 "opus", "qwen"）
             max_tokens: 最大输出 token 数
+            cache: 是否允许复用相同请求的缓存响应（仅用于确定性的辅助调用；
+                客户端未配置 response_cache 时无效）
+            priority: "interactive"（用户对话）或 "background"（后台任务），
+                provider 配置了并发上限时 interactive 请求优先获得位置
+            attempt_timeout: 单次请求超时（秒），覆盖按 max_tokens 推算的默认值；
+                总截止时间随之按比例放宽
 
         Returns:
             LLM 的文本响应
@@ -39,6 +117,70 @@ class BaseLLMClient(ABC):
             不抛异常。超时或错误时返回空字符串并记录日志。
         """
 
+    async def complete_messages(
+        self,
+        system_prompt: str | list[dict],
+        messages: list[dict],
+        model: str = "opus",
+        max_tokens: int = 2000,
+        *,
+        cache: bool = False,
+        priority: str = INTERACTIVE,
+        attempt_timeout: float | None = None,
+    ) -> str:
+        """
+        以多轮消息调用 LLM 并返回文本响应。
+
+        Args:
+            system_prompt: 同 complete()
+            messages: [{"role": "user"|"assistant"|"system", "content": "..."}]，
+                最后一条为当前用户消息；由 chat_messages() 规范化
+            model: Provider 名称
+            max_tokens: 最大输出 token 数
+            cache: 同 complete()
+            priority: 同 complete()
+            attempt_timeout: 同 complete()
+
+        Returns:
+            LLM 的文本响应（错误时返回空字符串）
+
+        默认实现把历史展平进一条用户消息后调用 complete()，子类可原生支持多轮。
+        默认实现不使用响应缓存、优先级与超时覆盖。
+        """
+        turns = chat_messages(messages)
+        if not turns:
+            return await self.complete(system_prompt, "", model=model, max_tokens=max_tokens)
+        *history, current = turns
+        transcript = "\n\n".join(f"{m['role']}: {m['content']}" for m in history)
+        user_message = current["content"]
+        if transcript:
+            user_message = f"## 对话历史\n\n{transcript}\n\n## 当前消息\n\n{user_message}"
+        return await self.complete(system_prompt, user_message, model=model, max_tokens=max_tokens)
+
+    async def stream_messages(
+        self,
+        system_prompt: str | list[dict],
+        messages: list[dict],
+        model: str = "opus",
+        max_tokens: int = 2000,
+        *,
+        priority: str = INTERACTIVE,
+        attempt_timeout: float | None = None,
+    ) -> AsyncIterator[str]:
+        """
+        流式调用，逐段产出文本增量。参数同 complete_messages()。
+
+        产出第一段文本之前出错时停止产出并记录日志，不抛异常；已产出部分文本后出错时
+        抛出 StreamInterrupted，调用方据此把已收到的文本标记为不完整。
+        默认实现一次性产出完整响应。
+        """
+        text = await self.complete_messages(
+            system_prompt, messages, model=model, max_tokens=max_tokens,
+            priority=priority, attempt_timeout=attempt_timeout,
+        )
+        if text:
+            yield text
+
 
 # 默认 Provider 配置（无 YAML 时兜底）
 _DEFAULT_PROVIDERS: dict[str, dict[str, Any]] = {
@@ -73,10 +215,25 @@ class LLMClient(BaseLLMClient):
         self,
         providers: dict[str, dict[str, Any]] | None = None,
         aliases: dict[str, str] | None = None,
+        token_counter: TokenCounter | None = None,
+        response_cache: ResponseCache | None = None,
+        resilience: ResiliencePolicy | None = None,
     ):
         self._providers = providers or _DEFAULT_PROVIDERS
         self._aliases = aliases or _DEFAULT_ALIASES
         self._clients: dict[str, Any] = {}  # lazy-init cache
+        # 用真实 input token 数校准本地估算
+        self.token_counter = token_counter or default_counter
+        # token 用量：最近一次调用，以及按 provider 累计（含 prompt cache 读写）
+        self.last_usage: dict[str, int] = {}
+        self.usage: dict[str, dict[str, int]] = {}
+        # 确定性辅助调用（cache=True）的响应缓存
+        self.response_cache = response_cache
+        # 按 provider 的并发闸门与 RPM/TPM 令牌桶（懒创建，见 core/llm_limits.py）
+        self._limiters: dict[str, ProviderLimiter] = {}
+        # 重试/截止时间/对冲/故障转移策略，以及对冲阈值所需的延迟样本
+        self.resilience = resilience or ResiliencePolicy()
+        self.latency = LatencyTracker()
 
     def _resolve(self, model: str) -> tuple[str, dict]:
         """将 model 名解析为 (provider_name, config)，支持别名。"""
@@ -110,61 +267,437 @@ class LLMClient(BaseLLMClient):
         self._clients[name] = client
         return client
 
+    def _limiter(self, name: str, config: dict) -> ProviderLimiter:
+        """获取或创建指定 provider 的限流器。"""
+        limiter = self._limiters.get(name)
+        if limiter is None:
+            limiter = self._limiters[name] = ProviderLimiter.from_config(config)
+        return limiter
+
+    def _reservation(self, limiter: ProviderLimiter, system_prompt, turns: list[dict], max_tokens: int) -> int:
+        """TPM 预占额度：输入估算 + max_tokens；未配置 tpm 时为 0。"""
+        if limiter.tokens is None:
+            return 0
+        return self._estimate_input(system_prompt, turns) + max_tokens
+
     async def complete(
         self,
-        system_prompt: str,
+        system_prompt: str | list[dict],
         user_message: str,
         model: str = "opus",
         max_tokens: int = 2000,
+        *,
+        cache: bool = False,
+        priority: str = INTERACTIVE,
+        attempt_timeout: float | None = None,
+    ) -> str:
+        return await self.complete_messages(
+            system_prompt,
+            [{"role": "user", "content": user_message}],
+            model=model,
+            max_tokens=max_tokens,
+            cache=cache,
+            priority=priority,
+            attempt_timeout=attempt_timeout,
+        )
+
+    async def complete_messages(
+        self,
+        system_prompt: str | list[dict],
+        messages: list[dict],
+        model: str = "opus",
+        max_tokens: int = 2000,
+        *,
+        cache: bool = False,
+        priority: str = INTERACTIVE,
+        attempt_timeout: float | None = None,
     ) -> str:
+        """多轮调用。anthropic 后端在 system 使用 cache 断点时，历史末尾也设置一个断点。
+
+        cache=True 且配置了 response_cache 时，先按请求内容查缓存，命中则不请求 provider。
+        请求在 provider 的限流器中按 priority 排队，按 resilience 策略重试、对冲与故障转移，
+        全部失败时返回空字符串。
+        """
         try:
             name, config = self._resolve(model)
-            client = self._get_client(name, config)
-            model_id = config.get("model_id", model)
+            turns = chat_messages(messages) or [{"role": "user", "content": ""}]
+            cache_key = None
+            if cache and self.response_cache is not None:
+                cache_key = self.response_cache.make_key(
+                    name, config.get("model_id", name), system_text(system_prompt), turns, max_tokens
+                )
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
+            text, served_by = await self._call_with_failover(
+                name, system_prompt, turns, max_tokens, priority, attempt_timeout
+            )
+            # 故障转移到其它模型的响应不写入主模型的缓存键
+            if cache_key is not None and self._same_model(served_by, name):
+                self.response_cache.put(cache_key, text)
+            return text
+        except Exception as e:
+            logger.error(f"LLM call failed (model={model}): {e}")
+            return ""
+
+    async def stream_messages(
+        self,
+        system_prompt: str | list[dict],
+        messages: list[dict],
+        model: str = "opus",
+        max_tokens: int = 2000,
+        *,
+        priority: str = INTERACTIVE,
+        attempt_timeout: float | None = None,
+    ) -> AsyncIterator[str]:
+        """流式多轮调用，anthropic 与 openai 兼容后端均逐段产出文本增量；整个流期间占用限流位置。
 
+        产出第一段文本之前的失败按 resilience 策略重试与故障转移，全部失败时记录日志并结束；
+        之后的失败抛出 StreamInterrupted。两段文本之间超过 stream_idle_timeout
+        或整个流超过总截止时间视为失败。
+        """
+        try:
+            name, _ = self._resolve(model)
+            turns = chat_messages(messages) or [{"role": "user", "content": ""}]
+            policy = self.resilience
+            loop = asyncio.get_running_loop()
+            _, total = policy.limits(max_tokens, attempt_timeout)
+            deadline = loop.time() + total
+            last_error: Exception | None = None
+            for provider in self._failover_chain(name):
+                if provider != name:
+                    logger.warning("LLM stream for %s failing over to %s", name, provider)
+                for attempt in range(policy.max_retries + 1):
+                    if loop.time() >= deadline:
+                        raise asyncio.TimeoutError("LLM call deadline exceeded") from last_error
+                    started = False
+                    stream = self._stream_request(provider, system_prompt, turns, max_tokens, priority)
+                    try:
+                        while True:
+                            remaining = deadline - loop.time()
+                            if remaining <= 0:
+                                raise asyncio.TimeoutError("LLM stream deadline exceeded")
+                            try:
+                                delta = await asyncio.wait_for(
+                                    stream.__anext__(), timeout=min(policy.stream_idle_timeout, remaining)
+                                )
+                            except StopAsyncIteration:
+                                return
+                            started = True
+                            yield delta
+                    except Exception as e:
+                        if started:
+                            raise StreamInterrupted(f"{provider}: {e!r}") from e
+                        last_error = e
+                        if not await self._backoff_before_retry(provider, attempt, e, deadline):
+                            break
+                    finally:
+                        await stream.aclose()
+            raise last_error or RuntimeError("no LLM provider available")
+        except StreamInterrupted:
+            raise
+        except Exception as e:
+            logger.error(f"LLM stream failed (model={model}): {e}")
+
+    # ──────────────────────────────────────
+    #  容错：重试、对冲、故障转移
+    # ──────────────────────────────────────
+
+    def _failover_chain(self, name: str) -> list[str]:
+        """name 的故障转移链（别名已解析），忽略未注册的 provider。"""
+        chain: list[str] = []
+        for provider in self.resilience.chain(name):
+            provider = self._aliases.get(provider, provider)
+            if provider in self._providers and provider not in chain:
+                chain.append(provider)
+        return chain
+
+    async def _call_with_failover(
+        self,
+        name: str,
+        system_prompt,
+        turns: list[dict],
+        max_tokens: int,
+        priority: str,
+        attempt_timeout: float | None = None,
+    ) -> tuple[str, str]:
+        """沿故障转移链调用，每个 provider 重试可重试错误；受单次超时与总截止时间约束。
+
+        返回 (文本, 给出响应的故障转移链 provider)。
+        """
+        policy = self.resilience
+        chain = self._failover_chain(name)
+        attempt_limit, total = policy.limits(max_tokens, attempt_timeout)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + total
+        last_error: Exception | None = None
+        for index, provider in enumerate(chain):
+            if index:
+                logger.warning("LLM call for %s failing over to %s after: %r", name, provider, last_error)
+            backup = None
+            if priority != BACKGROUND:
+                backup = self._hedge_target(provider, chain[index + 1:])
+            for attempt in range(policy.max_retries + 1):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError("LLM call deadline exceeded") from last_error
+                try:
+                    text = await asyncio.wait_for(
+                        self._hedged_request(provider, backup, system_prompt, turns, max_tokens, priority),
+                        timeout=min(attempt_limit, remaining),
+                    )
+                    return text, provider
+                except Exception as e:
+                    last_error = e
+                    if not await self._backoff_before_retry(provider, attempt, e, deadline):
+                        break
+        raise last_error or RuntimeError("no LLM provider available")
+
+    def _hedge_target(self, primary: str, candidates: list[str]) -> str | None:
+        """对冲目标：候选中第一个与 primary 服务同一模型的 provider。"""
+        for candidate in candidates:
+            if self._same_model(candidate, primary):
+                return candidate
+        return None
+
+    def _same_model(self, a: str, b: str) -> bool:
+        """两个 provider 是否服务同一模型（type 与 model_id 相同）。"""
+        ca, cb = self._providers[a], self._providers[b]
+        return (ca.get("type", "openai"), ca.get("model_id", a)) == (cb.get("type", "openai"), cb.get("model_id", b))
+
+    async def _backoff_before_retry(self, provider: str, attempt: int, error: Exception, deadline: float) -> bool:
+        """决定是否重试同一 provider；需要重试时先退避等待（不越过截止时间）。"""
+        policy = self.resilience
+        if not is_retryable(error) or attempt >= policy.max_retries:
+            logger.warning("LLM provider %s failed: %r", provider, error)
+            return False
+        remaining = deadline - asyncio.get_running_loop().time()
+        delay = min(policy.backoff(attempt, error), max(0.0, remaining))
+        logger.warning(
+            "LLM provider %s failed (attempt %d), retrying in %.1fs: %r",
+            provider, attempt + 1, delay, error,
+        )
+        await asyncio.sleep(delay)
+        return True
+
+    async def _hedged_request(
+        self, primary: str, backup: str | None, system_prompt, turns: list[dict], max_tokens: int, priority: str
+    ) -> str:
+        """调用 primary；耗时超过其延迟分位数仍未返回时向 backup（同一模型）发对冲请求，取先成功者。"""
+        policy = self.resilience
+        threshold = None
+        if backup is not None and policy.hedge_quantile > 0:
+            threshold = self.latency.quantile(primary, policy.hedge_quantile, policy.hedge_min_samples)
+        if threshold is None:
+            return await self._request(primary, system_prompt, turns, max_tokens, priority)
+
+        tasks = {asyncio.ensure_future(self._request(primary, system_prompt, turns, max_tokens, priority))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=threshold)
+            if not done:
+                logger.info("LLM provider %s slower than %.1fs, hedging with %s", primary, threshold, backup)
+                tasks.add(asyncio.ensure_future(
+                    self._request(backup, system_prompt, turns, max_tokens, priority)
+                ))
+            pending = tasks
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _request(
+        self, name: str, system_prompt, turns: list[dict], max_tokens: int, priority: str
+    ) -> str:
+        """向单个 provider 发出一次请求（经限流），记录延迟与 usage。"""
+        config = self._providers[name]
+        client = self._get_client(name, config)
+        model_id = config.get("model_id", name)
+        limiter = self._limiter(name, config)
+        reserved = self._reservation(limiter, system_prompt, turns, max_tokens)
+
+        async with limiter.slot(priority, reserved) as used:
+            started = time.monotonic()
             if config.get("type") == "anthropic":
-                return await self._call_anthropic(
-                    client, model_id, system_prompt, user_message, max_tokens
+                text, usage = await self._call_anthropic(
+                    client, model_id, system_prompt, turns, max_tokens
                 )
             else:
                 extra_body = config.get("extra_body")
-                return await self._call_openai(
-                    client, model_id, system_prompt, user_message, max_tokens, extra_body
+                text, usage = await self._call_openai(
+                    client, model_id, system_text(system_prompt), turns, max_tokens, extra_body
                 )
-        except Exception as e:
-            logger.error(f"LLM call failed (model={model}): {e}")
-            return ""
+            self.latency.record(name, time.monotonic() - started)
+            used[0] = _total_tokens(usage)
+        self._after_call(name, system_prompt, turns, usage)
+        return text
+
+    async def _stream_request(
+        self, name: str, system_prompt, turns: list[dict], max_tokens: int, priority: str
+    ) -> AsyncIterator[str]:
+        """向单个 provider 发出一次流式请求（经限流），逐段产出文本。"""
+        config = self._providers[name]
+        client = self._get_client(name, config)
+        model_id = config.get("model_id", name)
+        usage = dict.fromkeys(_USAGE_FIELDS, 0)
+        limiter = self._limiter(name, config)
+        reserved = self._reservation(limiter, system_prompt, turns, max_tokens)
+
+        async with limiter.slot(priority, reserved) as used:
+            if config.get("type") == "anthropic":
+                deltas = self._stream_anthropic(
+                    client, model_id, system_prompt, turns, max_tokens, usage
+                )
+            else:
+                deltas = self._stream_openai(
+                    client, model_id, system_text(system_prompt), turns, max_tokens,
+                    config.get("extra_body"), usage,
+                )
+            async for delta in deltas:
+                yield delta
+            used[0] = _total_tokens(usage)
+        self._after_call(name, system_prompt, turns, usage)
+
+    def _after_call(self, name: str, system_prompt, turns: list[dict], usage: dict[str, int]) -> None:
+        """记录 usage，并用真实 input token 数校准本地估算。"""
+        self._record_usage(name, usage)
+        actual = _total_tokens(usage) - usage["output_tokens"]
+        estimated = self._estimate_input(system_prompt, turns)
+        self.token_counter.calibrate(estimated, actual, provider=name)
+
+    def _estimate_input(self, system_prompt, turns: list[dict]) -> int:
+        """请求输入部分的未校准 token 估算。"""
+        return self.token_counter.estimate(system_text(system_prompt)) + sum(
+            self.token_counter.estimate(m["content"]) for m in turns
+        )
+
+    def _record_usage(self, name: str, usage: dict[str, int]) -> None:
+        """记录最近一次与累计的 token 用量。"""
+        self.last_usage = usage
+        totals = self.usage.setdefault(name, dict.fromkeys(_USAGE_FIELDS, 0))
+        for key, value in usage.items():
+            totals[key] = totals.get(key, 0) + value
+        if usage.get("cache_read_input_tokens") or usage.get("cache_creation_input_tokens"):
+            logger.debug(
+                "Prompt cache (%s): read=%d write=%d uncached=%d",
+                name,
+                usage.get("cache_read_input_tokens", 0),
+                usage.get("cache_creation_input_tokens", 0),
+                usage.get("input_tokens", 0),
+            )
 
     @staticmethod
-    async def _call_anthropic(client, model_id, system_prompt, user_message, max_tokens) -> str:
-        """通过 Anthropic SDK 调用 Claude。"""
+    def _anthropic_request(
+        system_prompt: str | list[dict], turns: list[dict]
+    ) -> tuple[str | list[dict], list[dict]]:
+        """构造 system 与 messages 参数。
+
+        去掉空 system 块；system 含 cache 断点时在历史末尾（当前消息之前）再加一个断点，
+        下一轮对话可复用到这里的前缀。断点总数最多保留最后 4 个。
+        """
+        messages: list[dict] = [dict(m) for m in turns]
+        if isinstance(system_prompt, str):
+            return system_prompt, messages
+
+        blocks = [dict(block, type="text") for block in system_prompt if block.get("text")]
+        breakpoints = [i for i, block in enumerate(blocks) if "cache_control" in block]
+        budget = MAX_CACHE_BREAKPOINTS
+        if breakpoints and len(messages) > 1:
+            history_end = messages[-2]
+            history_end["content"] = [system_block(history_end["content"], cache=True)]
+            budget -= 1
+        for i in breakpoints[:-budget]:
+            del blocks[i]["cache_control"]
+        return blocks, messages
+
+    @classmethod
+    async def _call_anthropic(
+        cls, client, model_id, system_prompt, turns, max_tokens
+    ) -> tuple[str, dict[str, int]]:
+        """通过 Anthropic SDK 调用 Claude，返回 (文本, usage)。"""
+        system, messages = cls._anthropic_request(system_prompt, turns)
         response = await client.messages.create(
             model=model_id,
             max_tokens=max_tokens,
-            system=system_prompt,
-            messages=[{"role": "user", "content": user_message}],
+            system=system,
+            messages=messages,
         )
         if not response.content:
             raise ValueError("Anthropic API returned empty content")
-        return response.content[0].text or ""
+        usage_obj = getattr(response, "usage", None)
+        usage = {key: getattr(usage_obj, key, None) or 0 for key in _USAGE_FIELDS}
+        return response.content[0].text or "", usage
+
+    @classmethod
+    async def _stream_anthropic(
+        cls, client, model_id, system_prompt, turns, max_tokens, usage: dict[str, int]
+    ) -> AsyncIterator[str]:
+        """通过 Anthropic SDK 流式调用；结束后把 usage 写入传入的 dict。"""
+        system, messages = cls._anthropic_request(system_prompt, turns)
+        async with client.messages.stream(
+            model=model_id,
+            max_tokens=max_tokens,
+            system=system,
+            messages=messages,
+        ) as stream:
+            async for text in stream.text_stream:
+                if text:
+                    yield text
+            final = await stream.get_final_message()
+        usage_obj = getattr(final, "usage", None)
+        usage.update({key: getattr(usage_obj, key, None) or 0 for key in _USAGE_FIELDS})
 
     @staticmethod
-    async def _call_openai(client, model_id, system_prompt, user_message, max_tokens, extra_body=None) -> str:
-        """通过 OpenAI 兼容接口调用。"""
+    async def _stream_openai(
+        client, model_id, system_prompt, turns, max_tokens, extra_body, usage: dict[str, int]
+    ) -> AsyncIterator[str]:
+        """通过 OpenAI 兼容接口流式调用；provider 返回 usage 时写入传入的 dict。"""
         kwargs: dict[str, Any] = {
             "model": model_id,
             "max_tokens": max_tokens,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message},
-            ],
+            "messages": [{"role": "system", "content": system_prompt}, *turns],
+            "stream": True,
+        }
+        if extra_body:
+            kwargs["extra_body"] = extra_body
+        response = await client.chat.completions.create(**kwargs)
+        async for chunk in response:
+            usage_obj = getattr(chunk, "usage", None)
+            if usage_obj is not None:
+                usage["input_tokens"] = getattr(usage_obj, "prompt_tokens", None) or 0
+                usage["output_tokens"] = getattr(usage_obj, "completion_tokens", None) or 0
+            if chunk.choices:
+                text = chunk.choices[0].delta.content
+                if text:
+                    yield text
+
+    @staticmethod
+    async def _call_openai(
+        client, model_id, system_prompt, turns, max_tokens, extra_body=None
+    ) -> tuple[str, dict[str, int]]:
+        """通过 OpenAI 兼容接口调用，返回 (文本, usage)。"""
+        kwargs: dict[str, Any] = {
+            "model": model_id,
+            "max_tokens": max_tokens,
+            "messages": [{"role": "system", "content": system_prompt}, *turns],
         }
         if extra_body:
             kwargs["extra_body"] = extra_body
         response = await client.chat.completions.create(**kwargs)
         if not response.choices:
             raise ValueError("OpenAI-compatible API returned empty choices")
-        return response.choices[0].message.content or ""
+        usage_obj = getattr(response, "usage", None)
+        usage = dict.fromkeys(_USAGE_FIELDS, 0)
+        usage["input_tokens"] = getattr(usage_obj, "prompt_tokens", None) or 0
+        usage["output_tokens"] = getattr(usage_obj, "completion_tokens", None) or 0
+        return response.choices[0].message.content or "", usage
 
 
 class MockLLMClient(BaseLLMClient):
@@ -182,16 +715,44 @@ class MockLLMClient(BaseLLMClient):
 
     async def complete(
         self,
-        system_prompt: str,
+        system_prompt: str | list[dict],
         user_message: str,
         model: str = "qwen",
         max_tokens: int = 2000,
+        *,
+        cache: bool = False,
+        priority: str = INTERACTIVE,
+        attempt_timeout: float | None = None,
+    ) -> str:
+        return await self.complete_messages(
+            system_prompt, [{"role": "user", "content": user_message}],
+            model=model, max_tokens=max_tokens, cache=cache, priority=priority,
+            attempt_timeout=attempt_timeout,
+        )
+
+    async def complete_messages(
+        self,
+        system_prompt: str | list[dict],
+        messages: list[dict],
+        model: str = "qwen",
+        max_tokens: int = 2000,
+        *,
+        cache: bool = False,
+        priority: str = INTERACTIVE,
+        attempt_timeout: float | None = None,
     ) -> str:
+        turns = chat_messages(messages)
+        user_message = turns[-1]["content"] if turns else ""
         self.calls.append({
-            "system_prompt": system_prompt,
+            "system_prompt": system_text(system_prompt),
+            "system_blocks": None if isinstance(system_prompt, str) else system_prompt,
+            "messages": turns,
             "user_message": user_message,
             "model": model,
             "max_tokens": max_tokens,
+            "cache": cache,
+            "priority": priority,
+            "attempt_timeout": attempt_timeout,
         })
         if model in self.responses:
             return self.responses[model]
@@ -0,0 +1,209 @@
+"""Provider 级并发与速率限制 — 优先级并发闸门 + RPM/TPM 令牌桶。
+
+每个 provider 一个 ProviderLimiter，按 ``llm.providers.<name>`` 中的可选字段配置：
+
+- max_concurrency: 同时在途的请求数上限；
+- max_background: 后台请求最多占用的并发数（默认 max_concurrency - 1，为对话留一个位置）；
+- rpm / tpm: 每分钟请求数 / token 数上限（令牌桶，允许一分钟额度内的突发）。
+
+未配置的限制不生效。请求分两条优先级通道：interactive（用户对话）与 background
+（反思、观察、架构师等后台任务）；并发位释放、令牌补充时总是先满足 interactive 的等待者。
+TPM 按「输入估算 + max_tokens」预占，调用结束后按真实 usage 退还多占的部分。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+
+class TokenBucket:
+    """每分钟 rate 个令牌的令牌桶，容量等于 rate；等待者按优先级排队（interactive 优先）。"""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = self.capacity / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._waiters: dict[str, deque[asyncio.Event]] = {p: deque() for p in PRIORITIES}
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _head(self) -> asyncio.Event | None:
+        """下一个取令牌的等待者：interactive 队首优先于 background 队首。"""
+        for priority in PRIORITIES:
+            if self._waiters[priority]:
+                return self._waiters[priority][0]
+        return None
+
+    def _wake_head(self) -> None:
+        head = self._head()
+        if head is not None:
+            head.set()
+
+    async def acquire(self, amount: float = 1.0, priority: str = INTERACTIVE) -> None:
+        """取出 amount 个令牌（超过容量按容量计），不足时按优先级排队等待补充。"""
+        amount = min(amount, self.capacity)
+        self._refill()
+        ahead = self._waiters[INTERACTIVE] if priority == INTERACTIVE else self._head()
+        if not ahead and self._tokens >= amount:
+            self._tokens -= amount
+            return
+        event = asyncio.Event()
+        waiters = self._waiters[priority]
+        waiters.append(event)
+        try:
+            while True:
+                self._refill()
+                if self._head() is not event:
+                    # 排在其它等待者之后：等轮到自己时被唤醒
+                    event.clear()
+                    await event.wait()
+                elif self._tokens >= amount:
+                    waiters.popleft()
+                    self._tokens -= amount
+                    self._wake_head()
+                    return
+                else:
+                    await asyncio.sleep((amount - self._tokens) / self.rate)
+        except asyncio.CancelledError:
+            if event in waiters:
+                waiters.remove(event)
+            self._wake_head()
+            raise
+
+    def refund(self, amount: float) -> None:
+        """退还预占多出的令牌。"""
+        if amount <= 0:
+            return
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + amount)
+        self._wake_head()
+
+
+class PriorityGate:
+    """带优先级的并发闸门：interactive 等待者优先于 background。"""
+
+    def __init__(self, limit: int, background_limit: int | None = None):
+        """
+        Args:
+            limit: 并发上限
+            background_limit: background 请求的并发上限（默认等于 limit）
+        """
+        self.limit = limit
+        self.background_limit = limit if background_limit is None else background_limit
+        self.active = 0
+        self.active_background = 0
+        self._waiters: dict[str, deque[asyncio.Future]] = {p: deque() for p in PRIORITIES}
+
+    def _can_enter(self, priority: str) -> bool:
+        if self.active >= self.limit:
+            return False
+        if priority == BACKGROUND:
+            return not self._waiters[INTERACTIVE] and self.active_background < self.background_limit
+        return True
+
+    def _enter(self, priority: str) -> None:
+        self.active += 1
+        if priority == BACKGROUND:
+            self.active_background += 1
+
+    async def acquire(self, priority: str = INTERACTIVE) -> None:
+        if not self._waiters[priority] and self._can_enter(priority):
+            self._enter(priority)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已被授予位置后才取消：交还位置
+                self.release(priority)
+            elif future in self._waiters[priority]:
+                self._waiters[priority].remove(future)
+            raise
+
+    def release(self, priority: str = INTERACTIVE) -> None:
+        self.active -= 1
+        if priority == BACKGROUND:
+            self.active_background -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        for priority in PRIORITIES:
+            waiters = self._waiters[priority]
+            while waiters and self._can_enter(priority):
+                future = waiters.popleft()
+                if future.done():
+                    continue
+                self._enter(priority)
+                future.set_result(None)
+
+
+class ProviderLimiter:
+    """单个 provider 的并发闸门与 RPM/TPM 令牌桶。"""
+
+    def __init__(
+        self,
+        *,
+        max_concurrency: int | None = None,
+        max_background: int | None = None,
+        rpm: float | None = None,
+        tpm: float | None = None,
+    ):
+        self.gate = None
+        if max_concurrency:
+            if max_background is None:
+                max_background = max(1, max_concurrency - 1)
+            self.gate = PriorityGate(max_concurrency, min(max_background, max_concurrency))
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> ProviderLimiter:
+        """从 provider 配置字典读取 max_concurrency / max_background / rpm / tpm。"""
+        return cls(
+            max_concurrency=config.get("max_concurrency"),
+            max_background=config.get("max_background"),
+            rpm=config.get("rpm"),
+            tpm=config.get("tpm"),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.gate or self.requests or self.tokens)
+
+    @asynccontextmanager
+    async def slot(self, priority: str = INTERACTIVE, tokens: int = 0) -> AsyncIterator[list[int]]:
+        """占用一个请求位置。
+
+        产出一个单元素列表，调用方在结束前写入真实消耗的 token 数，
+        多预占的 TPM 额度会被退还；不写入则不退还。
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown LLM priority: {priority!r}")
+        if self.gate:
+            await self.gate.acquire(priority)
+        try:
+            if self.requests:
+                await self.requests.acquire(1, priority)
+            if self.tokens and tokens:
+                await self.tokens.acquire(tokens, priority)
+            used = [tokens]
+            yield used
+            if self.tokens and tokens:
+                self.tokens.refund(tokens - used[0])
+        finally:
+            if self.gate:
+                self.gate.release(priority)
@@ -0,0 +1,125 @@
+"""LLM 调用容错策略 — 重试退避、截止时间、对冲请求与故障转移链。
+
+LLMClient 按 ResiliencePolicy 执行一次逻辑调用：
+
+1. 依次尝试故障转移链上的 provider（主 provider + ``llm.failover.<name>``）；
+2. 每个 provider 对可重试错误（超时、连接错误、429/5xx）按指数退避 + 抖动重试，
+   不可重试错误直接转移到下一个 provider；
+3. 每次尝试有单次超时，整个调用有总截止时间，退避等待不会越过截止时间；
+   两者随 max_tokens 放宽（长输出不会被当作超时），调用方也可逐次指定；
+4. 可选的对冲请求（默认关闭）：interactive 调用的主 provider 超过其近期延迟分位数
+   仍未返回时，向链上服务同一模型的下一个 provider 发出对冲请求，先成功者胜出。
+   跨模型的故障转移只在主 provider 失败（重试耗尽或不可重试错误）后发生。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import random
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+# 可重试的 HTTP 状态码（含 Anthropic 529 overloaded）
+_RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504, 529})
+# SDK 中不带状态码的可重试异常
+_RETRYABLE_NAMES = frozenset({"APIConnectionError", "APITimeoutError"})
+
+
+@dataclass
+class ResiliencePolicy:
+    """容错参数。"""
+
+    max_retries: int = 2              # 每个 provider 的重试次数（不含首次）
+    base_delay: float = 0.5           # 首次退避秒数，之后翻倍
+    max_delay: float = 8.0            # 单次退避上限（也约束 Retry-After）
+    attempt_timeout: float = 30.0     # 单次请求的基础超时（秒），另按 max_tokens 放宽
+    deadline: float = 60.0            # 整个逻辑调用的基础截止时间（秒），与单次超时同比例放宽
+    output_tokens_per_second: float = 20.0  # 按最慢输出速度放宽超时：+ max_tokens / 该值；<= 0 不放宽
+    stream_idle_timeout: float = 30.0  # 流式调用两段文本之间的最长间隔（秒）
+    hedge_quantile: float = 0.0       # 超过该分位延迟时发出对冲请求；<= 0 关闭对冲
+    hedge_min_samples: int = 20       # 延迟样本不足时不对冲
+    failover: dict[str, list[str]] = field(default_factory=dict)
+
+    @classmethod
+    def from_config(cls, data: dict[str, Any] | None, failover: dict[str, list[str]] | None = None) -> ResiliencePolicy:
+        """由 ``llm.resilience`` 与 ``llm.failover`` 配置构造，未知键忽略。"""
+        known = {k: v for k, v in (data or {}).items() if k in cls.__dataclass_fields__ and k != "failover"}
+        return cls(**known, failover={k: list(v) for k, v in (failover or {}).items()})
+
+    def chain(self, name: str) -> list[str]:
+        """provider 的故障转移链（首项为自身，去重）。"""
+        chain = [name]
+        for fallback in self.failover.get(name, []):
+            if fallback not in chain:
+                chain.append(fallback)
+        return chain
+
+    def limits(self, max_tokens: int, attempt_timeout: float | None = None) -> tuple[float, float]:
+        """一次调用的 (单次超时, 总截止时间) 秒数。
+
+        attempt_timeout 为调用方指定的单次超时；未指定时为基础超时 + max_tokens 的输出时间。
+        总截止时间与单次超时保持配置中的比例，至少容纳一次完整尝试。
+        """
+        if attempt_timeout is None:
+            attempt_timeout = self.attempt_timeout
+            if self.output_tokens_per_second > 0:
+                attempt_timeout += max_tokens / self.output_tokens_per_second
+        ratio = self.deadline / self.attempt_timeout if self.attempt_timeout > 0 else 1.0
+        return attempt_timeout, max(attempt_timeout, attempt_timeout * ratio)
+
+    def backoff(self, attempt: int, exc: BaseException | None = None) -> float:
+        """第 attempt 次重试前的等待秒数：优先用 Retry-After，否则指数退避 + 全抖动。"""
+        retry_after = _retry_after(exc)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+def _status_code(exc: BaseException) -> int | None:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(exc: BaseException | None) -> float | None:
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        value = float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+    return value if value >= 0 else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """超时、连接错误与 408/409/429/5xx 可重试；其它错误（参数、鉴权、解析）不可重试。"""
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = _status_code(exc)
+    if status is not None:
+        return status in _RETRYABLE_STATUS
+    return type(exc).__name__ in _RETRYABLE_NAMES
+
+
+class LatencyTracker:
+    """按 provider 记录最近的成功调用耗时，用于计算对冲阈值。"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: dict[str, deque[float]] = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        self._samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, name: str, q: float, min_samples: int = 1) -> float | None:
+        """最近样本的 q 分位数；样本不足 min_samples 时返回 None。"""
+        samples = self._samples.get(name)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+        return ordered[index]
@@ -2,7 +2,7 @@
 
 四层记忆架构：
 - 工作记忆：上下文窗口（由 ContextEngine 管理）
-- 情节记忆：对话记录 (conversations/)
+- 情节记忆：对话记录 (conversations/，分段追加日志，见 core/conversation_log.py)
 - 语义记忆：核心知识 (MEMORY.md, preferences.md, profile.md)
 - 程序性记忆：经验规则 + 技能 (rules/experience/, skills/)
 
@@ -11,33 +11,93 @@
 - 项目级：项目特定 (memory/projects/{project}/)
 """
 
-import json
+import heapq
 import logging
 import re
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 from pathlib import Path
 
+from core import memory_vector
+from core.conversation_log import ConversationLog
+from core.memory_cache import FileCache
+from core.memory_errors import ErrorPatternStore
+from core.memory_index import MemoryIndex, chunk_id_for, extract_terms, is_word_term, split_chunks
+
 logger = logging.getLogger(__name__)
 
 
 class MemoryStore:
     """分级记忆系统 — 存储、检索、注入上下文。
 
-    MVP 阶段使用关键词全文搜索，后续可升级为向量检索。
+    检索基于持久化倒排索引（见 core/memory_index.py）：写入方法同步更新索引，
+    search 只读取命中的候选文件，不再全目录扫描。
+    Markdown 记忆在写入时按标题/段落切成 chunk（内容哈希 ID），检索单位是 chunk，
+    结果只返回相关段落而不是整个文件。
+    get_user_preferences 等整文件读取走进程内读缓存（见 core/memory_cache.py），
+    命中时只需一次 stat。
+    可选 backend="vector" 使用本地哈希向量检索（见 core/memory_vector.py），
+    numpy 不可用或无向量命中时回退关键词检索。
     """
 
-    def __init__(self, workspace_path: str | Path):
+    RANKERS = ("keyword", "bm25")
+    BACKENDS = ("keyword", "vector")
+
+    def __init__(
+        self,
+        workspace_path: str | Path,
+        *,
+        refresh_interval: float = 60.0,
+        ranker: str = "keyword",
+        backend: str = "keyword",
+        vector_dim: int = memory_vector.DEFAULT_DIM,
+    ):
         """
         Args:
             workspace_path: workspace/ 根目录路径
+            refresh_interval: 搜索前对照磁盘校正索引的最小间隔（秒），
+                用于捕获绕过 MemoryStore 的写入（Bootstrap、反思引擎等）
+            ranker: 默认排序器，"keyword"（子串 + bigram 启发式）或 "bm25"
+            backend: 检索后端，"keyword"（倒排索引）或 "vector"（本地向量，需要 numpy）
+            vector_dim: 向量后端的哈希特征维度
         """
+        if ranker not in self.RANKERS:
+            raise ValueError(f"Unknown memory ranker: {ranker!r}")
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown memory backend: {backend!r}")
+        self.ranker = ranker
         self.workspace = Path(workspace_path)
-        self.user_dir = self.workspace / "memory" / "user"
-        self.projects_dir = self.workspace / "memory" / "projects"
-        self.conversations_dir = self.workspace / "memory" / "conversations"
-        self.summaries_dir = self.workspace / "memory" / "daily_summaries"
+        self.memory_dir = self.workspace / "memory"
+        self.user_dir = self.memory_dir / "user"
+        self.projects_dir = self.memory_dir / "projects"
+        self.conversations_dir = self.memory_dir / "conversations"
+        self.summaries_dir = self.memory_dir / "daily_summaries"
         self._ensure_dirs()
 
+        self._cache = FileCache()
+        self.errors = ErrorPatternStore(
+            self.user_dir / "errors", self.user_dir / "error_patterns.md", cache=self._cache
+        )
+        self.errors.load()
+        self.conversations = ConversationLog(self.conversations_dir)
+        self.conversations.load()
+
+        self.refresh_interval = refresh_interval
+        self._last_refresh = 0.0
+        self.index = MemoryIndex(self.memory_dir / "index")
+        self.index.load()
+
+        self.vectors = None
+        if backend == "vector":
+            if memory_vector.is_available():
+                self.vectors = memory_vector.VectorIndex(self.memory_dir / "index", dim=vector_dim)
+                self.vectors.load()
+            else:
+                logger.warning("numpy not installed, vector memory backend falls back to keyword search")
+        self.backend = "vector" if self.vectors is not None else "keyword"
+
+        self.refresh_index()
+
     def _ensure_dirs(self):
         """确保目录结构存在。"""
         for d in [self.user_dir, self.projects_dir,
@@ -68,6 +128,8 @@ class MemoryStore:
         """
         path = self.user_dir / f"{self._safe_filename(key)}.md"
         path.write_text(content, encoding="utf-8")
+        self._cache.store(path, content)
+        self._index_written(path, content)
         logger.info(f"User memory saved: {key} ({len(content)} chars)")
         return path
 
@@ -88,6 +150,8 @@ class MemoryStore:
         proj_dir.mkdir(parents=True, exist_ok=True)
         path = proj_dir / f"{safe_key}.md"
         path.write_text(content, encoding="utf-8")
+        self._cache.store(path, content)
+        self._index_written(path, content)
         logger.info(f"Project memory saved: {project}/{key} ({len(content)} chars)")
         return path
 
@@ -101,34 +165,39 @@ class MemoryStore:
         timestamp = datetime.now().strftime("%Y-%m-%d")
 
         if not path.exists():
-            path.write_text(
-                "# 用户偏好\n\n> 由系统从交互中自动提取。\n\n",
-                encoding="utf-8",
-            )
+            header = "# 用户偏好\n\n> 由系统从交互中自动提取。\n\n"
+            path.write_text(header, encoding="utf-8")
+            self._cache.store(path, header)
+            self._index_written(path, header)
 
-        with open(path, "a", encoding="utf-8") as f:
-            f.write(f"- [{timestamp}] {preference}\n")
+        self._append_indexed(path, f"- [{timestamp}] {preference}\n")
         logger.info(f"Preference appended: {preference[:50]}...")
 
     def append_error_pattern(self, pattern: str, source: str = "") -> None:
         """追加一条错误模式（来自反思引擎）。
 
+        条目写入当天的分片（见 core/memory_errors.py），同时追加到 error_patterns.md 视图。
+
         Args:
             pattern: 错误描述
             source: 来源（如 task_id）
         """
         path = self.user_dir / "error_patterns.md"
         timestamp = datetime.now().strftime("%Y-%m-%d")
+        self.errors.sync()
 
         if not path.exists():
-            path.write_text(
-                "# 已发现的错误模式\n\n> 由反思引擎自动提取。\n\n",
-                encoding="utf-8",
-            )
-
-        with open(path, "a", encoding="utf-8") as f:
-            source_tag = f" (from {source})" if source else ""
-            f.write(f"- [{timestamp}]{source_tag} {pattern}\n")
+            header = "# 已发现的错误模式\n\n> 由反思引擎自动提取。\n\n"
+            path.write_text(header, encoding="utf-8")
+            self._cache.store(path, header)
+            self._index_written(path, header)
+            self.errors.preamble = header.rstrip("\n").split("\n")
+
+        source_tag = f" (from {source})" if source else ""
+        line = f"- [{timestamp}]{source_tag} {pattern}"
+        self.errors.append(timestamp, pattern, source, line)
+        self._append_indexed(path, line + "\n")
+        self.errors.mark_synced()
         logger.info(f"Error pattern appended: {pattern[:50]}...")
 
     def save_conversation(
@@ -137,7 +206,7 @@ class MemoryStore:
         messages: list[dict],
         metadata: dict | None = None,
     ) -> Path:
-        """保存对话记录。
+        """保存对话记录（追加到对话日志，同 ID 重复保存时覆盖旧记录）。
 
         Args:
             conversation_id: 对话 ID
@@ -145,18 +214,17 @@ class MemoryStore:
             metadata: 对话元数据（摘要、标签等）
 
         Returns:
-            保存的文件路径
+            写入的日志段文件路径
         """
-        record = {
-            "conversation_id": conversation_id,
-            "timestamp": datetime.now().isoformat(),
-            "messages": messages,
-            "metadata": metadata or {},
-        }
-        path = self.conversations_dir / f"{self._safe_filename(conversation_id)}.json"
-        path.write_text(json.dumps(record, ensure_ascii=False, indent=2), encoding="utf-8")
+        entry = self.conversations.append(conversation_id, messages, metadata)
+        self._put_chunks(
+            self._conversation_file_id(conversation_id),
+            self._chunk_conversation(self._conversation_text(messages)),
+            mtime_ns=entry["mtime_ns"],
+            size=entry["length"],
+        )
         logger.info(f"Conversation saved: {conversation_id} ({len(messages)} messages)")
-        return path
+        return self.conversations.segment_path(entry["seg"])
 
     def save_daily_summary(self, date: str, summary: str) -> Path:
         """保存每日摘要。
@@ -170,6 +238,8 @@ class MemoryStore:
         """
         path = self.summaries_dir / f"{self._safe_filename(date)}.md"
         path.write_text(summary, encoding="utf-8")
+        self._cache.store(path, summary)
+        self._index_written(path, summary)
         logger.info(f"Daily summary saved: {date}")
         return path
 
@@ -183,50 +253,115 @@ class MemoryStore:
         scope: str = "all",
         project: str | None = None,
         max_results: int = 5,
+        ranker: str | None = None,
     ) -> list[dict]:
         """基于关键词搜索相关记忆。
 
-        MVP 使用子串匹配 + 中文 bigram 重叠评分。
+        两种排序器都先查倒排索引（按 chunk 计分），只读取最终候选 chunk：
+        - keyword：按词项命中粗排，再用子串匹配 + 中文 bigram 重叠精排
+        - bm25：直接用索引中的词频/文档长度/IDF 统计打分，只读取前 max_results 个 chunk
 
         Args:
             query: 搜索查询
             scope: "all" | "user" | "project" | "conversations" | "summaries"
             project: 项目名（scope="project" 时必需）
             max_results: 最大返回数
+            ranker: "keyword" | "bm25"，None 时使用实例默认值
 
         Returns:
-            [{"source": 文件路径, "content": 匹配片段, "score": 相关性分数}]
+            [{"source": 文件路径, "content": 匹配段落, "score": 相关性分数, "chunk_id": chunk ID}]
         """
-        candidates = []
-
+        prefixes = []
         if scope in ("all", "user"):
-            candidates.extend(self._scan_dir(self.user_dir, "*.md"))
-
+            prefixes.append("user/")
         if scope in ("all", "project") and project:
-            proj_dir = self.projects_dir / project
-            if proj_dir.exists():
-                candidates.extend(self._scan_dir(proj_dir, "*.md"))
-
+            prefixes.append(f"projects/{project}/")
         if scope in ("all", "summaries"):
-            candidates.extend(self._scan_dir(self.summaries_dir, "*.md"))
-
+            prefixes.append("daily_summaries/")
         if scope in ("all", "conversations"):
-            candidates.extend(self._scan_conversations(query))
-
-        # 评分并排序
+            prefixes.append("conversations/")
+        if not prefixes or not query:
+            return []
+
+        ranker = ranker or self.ranker
+        if ranker not in self.RANKERS:
+            raise ValueError(f"Unknown memory ranker: {ranker!r}")
+
+        self._maybe_refresh_index()
+        query_terms = extract_terms(query)
+        if self.vectors is not None:
+            results = self._search_vector(query, query_terms, tuple(prefixes), max_results)
+            if results:
+                return results
+        if ranker == "bm25":
+            return self._search_bm25(query, query_terms, tuple(prefixes), max_results)
+
+        hits = self.index.lookup(query_terms, tuple(prefixes))
+        shortlist = heapq.nlargest(
+            max(max_results * 4, 20),
+            hits.items(),
+            key=lambda item: self._coarse_score(item[1]),
+        )
+
+        # 精排：只读取候选 chunk
         scored = []
-        for candidate in candidates:
+        for doc_id, matched in shortlist:
+            candidate = self._load_candidate(doc_id, query, matched)
+            if candidate is None:
+                continue
             score = self._relevance_score(query, candidate["content"])
             if score > 0:
-                scored.append({
-                    "source": candidate["source"],
-                    "content": candidate["content"],
-                    "score": score,
-                })
+                candidate["score"] = score
+                scored.append(candidate)
 
         scored.sort(key=lambda x: x["score"], reverse=True)
         return scored[:max_results]
 
+    def _search_bm25(
+        self,
+        query: str,
+        query_terms: dict[str, int],
+        prefixes: tuple[str, ...],
+        max_results: int,
+    ) -> list[dict]:
+        """BM25 排序：分数完全来自索引统计，只读取入选 chunk。"""
+        scores = self.index.bm25(query_terms, prefixes)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+        results = []
+        for doc_id, score in ranked:
+            if len(results) >= max_results:
+                break
+            doc = self.index.get(doc_id) or {}
+            matched = {t: doc["terms"][t] for t in query_terms if t in doc.get("terms", {})}
+            candidate = self._load_candidate(doc_id, query, matched)
+            if candidate is None:
+                continue
+            candidate["score"] = score
+            results.append(candidate)
+        return results
+
+    def _search_vector(
+        self,
+        query: str,
+        query_terms: dict[str, int],
+        prefixes: tuple[str, ...],
+        max_results: int,
+    ) -> list[dict]:
+        """向量检索：余弦相似度 top-k，只读取入选 chunk。"""
+        results = []
+        for doc_id, score in self.vectors.search(query, max_results * 2, prefixes, min_score=0.05):
+            if len(results) >= max_results:
+                break
+            doc = self.index.get(doc_id) or {}
+            matched = {t: doc["terms"][t] for t in query_terms if t in doc.get("terms", {})}
+            candidate = self._load_candidate(doc_id, query, matched)
+            if candidate is None:
+                continue
+            candidate["score"] = score
+            results.append(candidate)
+        return results
+
     def get_relevant_memories(
         self,
         query: str,
@@ -250,24 +385,15 @@ class MemoryStore:
 
     def get_user_preferences(self) -> str:
         """获取用户偏好摘要（用于上下文注入）。"""
-        path = self.user_dir / "preferences.md"
-        if not path.exists():
-            return ""
-        return path.read_text(encoding="utf-8")
+        return self._cache.read_text(self.user_dir / "preferences.md") or ""
 
     def get_user_profile(self) -> str:
         """获取用户画像。"""
-        path = self.user_dir / "profile.md"
-        if not path.exists():
-            return ""
-        return path.read_text(encoding="utf-8")
+        return self._cache.read_text(self.user_dir / "profile.md") or ""
 
     def get_semantic_memory(self) -> str:
         """获取核心语义记忆 (MEMORY.md)。"""
-        path = self.user_dir / "MEMORY.md"
-        if not path.exists():
-            return ""
-        return path.read_text(encoding="utf-8")
+        return self._cache.read_text(self.user_dir / "MEMORY.md") or ""
 
     def get_recent_errors(self, days: int = 7) -> str:
         """获取最近 N 天的错误模式。
@@ -278,120 +404,296 @@ class MemoryStore:
         Returns:
             最近的错误模式文本
         """
-        path = self.user_dir / "error_patterns.md"
-        if not path.exists():
+        self.errors.sync()
+        if not self.errors.view_path.exists():
             return ""
 
-        content = path.read_text(encoding="utf-8")
-        cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
-
-        # 过滤最近 N 天的条目
-        recent_lines = []
-        for line in content.split("\n"):
-            # 匹配 - [YYYY-MM-DD] 格式
-            match = re.match(r"^- \[(\d{4}-\d{2}-\d{2})\]", line)
-            if match:
-                if match.group(1) >= cutoff:
-                    recent_lines.append(line)
-            elif not line.startswith("- ["):
-                # 保留标题和非条目行
-                recent_lines.append(line)
-
-        return "\n".join(recent_lines).strip()
+        # 标题和非条目行 + 最近 N 天的条目（只读取对应日期的分片）
+        preamble = "\n".join(self.errors.preamble).strip()
+        entries = "\n".join(entry["line"] for entry in self.errors.recent(days))
+        return "\n\n".join(part for part in (preamble, entries) if part)
 
     def get_project_context(self, project: str) -> str:
         """获取项目上下文。"""
-        path = self.projects_dir / project / "context.md"
-        if not path.exists():
-            return ""
-        return path.read_text(encoding="utf-8")
+        return self._cache.read_text(self.projects_dir / project / "context.md") or ""
 
     def get_daily_summary(self, date: str) -> str | None:
         """获取某日摘要。"""
-        path = self.summaries_dir / f"{date}.md"
-        if not path.exists():
-            return None
-        return path.read_text(encoding="utf-8")
+        return self._cache.read_text(self.summaries_dir / f"{date}.md")
 
     def list_conversations(self, limit: int = 20) -> list[dict]:
-        """列出最近的对话记录。
+        """列出最近的对话记录（只读内存 manifest，不读取对话内容）。
 
         Returns:
             [{"conversation_id": "...", "timestamp": "...", "message_count": N}]
         """
-        files = sorted(
-            self.conversations_dir.glob("*.json"),
-            key=lambda f: f.stat().st_mtime,
-            reverse=True,
-        )[:limit]
-
-        result = []
-        for f in files:
-            try:
-                data = json.loads(f.read_text(encoding="utf-8"))
-                result.append({
-                    "conversation_id": data.get("conversation_id", f.stem),
-                    "timestamp": data.get("timestamp", ""),
-                    "message_count": len(data.get("messages", [])),
-                    "metadata": data.get("metadata", {}),
-                })
-            except (json.JSONDecodeError, KeyError):
-                logger.warning(f"Skipping malformed conversation file: {f}")
-        return result
+        return [
+            {
+                "conversation_id": entry["id"],
+                "timestamp": entry["timestamp"],
+                "message_count": entry["message_count"],
+                "metadata": entry["metadata"],
+            }
+            for entry in self.conversations.recent(limit)
+        ]
+
+    def get_conversation(self, conversation_id: str) -> dict | None:
+        """读取完整对话记录。
+
+        Returns:
+            {"conversation_id", "timestamp", "messages", "metadata"}，不存在时返回 None
+        """
+        return self.conversations.get(conversation_id)
 
     # ──────────────────────────────────────
     #  内部方法
     # ──────────────────────────────────────
 
-    def _scan_dir(self, directory: Path, pattern: str) -> list[dict]:
-        """扫描目录下的文件，返回内容列表。"""
-        results = []
-        for f in directory.glob(pattern):
-            try:
-                content = f.read_text(encoding="utf-8")
-                if content.strip():
-                    results.append({
-                        "source": str(f),
-                        "content": content,
-                    })
-            except Exception as e:
-                logger.warning(f"Failed to read {f}: {e}")
-        return results
+    def _file_id(self, path: Path) -> str:
+        """索引文件 ID：相对 memory/ 的 POSIX 路径。"""
+        return path.relative_to(self.memory_dir).as_posix()
 
-    def _scan_conversations(self, query: str) -> list[dict]:
-        """扫描对话记录，提取与查询相关的片段。"""
-        results = []
-        for f in sorted(
-            self.conversations_dir.glob("*.json"),
-            key=lambda f: f.stat().st_mtime,
-            reverse=True,
-        )[:50]:  # 只看最近 50 个对话
+    @staticmethod
+    def _conversation_file_id(conversation_id: str) -> str:
+        """对话在索引中的文件 ID（对话存于日志段中，没有独立文件）。"""
+        return f"conversations/{conversation_id}"
+
+    @staticmethod
+    def _conversation_text(messages: list[dict]) -> str:
+        """拼接对话内容做检索。"""
+        return "\n".join(str(m.get("content", "") or "") for m in messages)
+
+    def _iter_memory_files(self):
+        """遍历所有可检索的记忆文件。"""
+        yield from self.user_dir.glob("*.md")
+        yield from self.projects_dir.glob("*/*.md")
+        yield from self.summaries_dir.glob("*.md")
+
+    def _read_document(self, path: Path) -> str | None:
+        """读取文档的可检索文本，损坏或不可读时返回 None。"""
+        try:
+            return path.read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning(f"Failed to read {path}: {e}")
+            return None
+
+    @staticmethod
+    def _chunk_conversation(text: str) -> list[tuple[str, str, int, int]]:
+        """对话记录整篇作为一个 chunk（不记录字节区间）。"""
+        return [(chunk_id_for(text, set()), text, 0, 0)] if text.strip() else []
+
+    def _put_chunks(self, file_id: str, chunks: list, *, mtime_ns: int, size: int) -> None:
+        """更新文件的 chunk 列表，并让向量库与倒排索引保持同一组 chunk。
+
+        chunk 内容不变则 ID 不变，只有新增 chunk 需要切词/向量化。
+        """
+        added, removed = self.index.put_file(file_id, chunks, mtime_ns=mtime_ns, size=size)
+        if self.vectors is None:
+            return
+        for doc_id in removed:
+            self.vectors.remove(doc_id)
+        for chunk_id, chunk_text, _, _ in chunks:
+            doc_id = f"{file_id}#{chunk_id}"
+            if chunk_text is not None and self.vectors.get(doc_id) is None:
+                self.vectors.put(doc_id, chunk_text, mtime_ns=mtime_ns, size=size)
+
+    def _put_document(self, path: Path, text: str, st) -> None:
+        """整文档重新切分并更新所有检索结构。"""
+        self._put_chunks(
+            self._file_id(path), split_chunks(text), mtime_ns=st.st_mtime_ns, size=st.st_size
+        )
+
+    def _drop_document(self, file_id: str) -> None:
+        for doc_id in self.index.remove_file(file_id):
+            if self.vectors is not None:
+                self.vectors.remove(doc_id)
+
+    def _index_written(self, path: Path, text: str) -> None:
+        """写入文件后同步整文档索引。"""
+        try:
+            st = path.stat()
+        except OSError:
+            return
+        self._put_document(path, text, st)
+
+    def _append_indexed(self, path: Path, text: str) -> None:
+        """追加写入文件并增量更新索引。
+
+        切分是从左到右贪心的，追加只会改变最后一个 chunk 及其之后的部分：
+        从最后一个 chunk 的起点重新切分尾部，前面的 chunk 原样保留。
+        文件若被外部修改过（索引记录的大小与追加前不一致），退化为整文档重建。
+        """
+        file_id = self._file_id(path)
+        record = self.index.get_file(file_id)
+        try:
+            size_before = path.stat().st_size
+        except OSError:
+            size_before = -1
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(text)
+        self._cache.append(path, text, size_before)
+        st = path.stat()
+
+        if record is not None and record["size"] == size_before and record["chunks"]:
+            prefix = record["chunks"][:-1]
+            tail_start = record["chunks"][-1][1]
             try:
-                data = json.loads(f.read_text(encoding="utf-8"))
-                messages = data.get("messages", [])
-                # 拼接对话内容做搜索
-                full_text = "\n".join(
-                    m.get("content", "") for m in messages
+                with open(path, "rb") as f:
+                    f.seek(tail_start)
+                    tail = f.read().decode("utf-8")
+            except (OSError, UnicodeDecodeError):
+                tail = None
+            if tail is not None:
+                chunks = [(chunk_id, None, start, end) for chunk_id, start, end in prefix]
+                chunks += split_chunks(
+                    tail, base_byte=tail_start, seen={chunk_id for chunk_id, _, _ in prefix}
                 )
-                if full_text.strip():
-                    # 提取匹配片段而非全文
-                    snippet = self._extract_snippet(full_text, query, max_chars=500)
-                    if snippet:
-                        results.append({
-                            "source": str(f),
-                            "content": snippet,
-                        })
-            except (json.JSONDecodeError, KeyError):
-                pass
-        return results
+                self._put_chunks(file_id, chunks, mtime_ns=st.st_mtime_ns, size=st.st_size)
+                return
 
-    def _extract_snippet(self, text: str, query: str, max_chars: int = 500) -> str | None:
-        """从文本中提取与查询最相关的片段。"""
+        full_text = self._read_document(path)
+        if full_text is not None:
+            self._put_document(path, full_text, st)
+
+    def refresh_index(self) -> dict:
+        """对照磁盘校正索引：重建变化的文件，删除已不存在的文件。
+
+        只 stat 文件，未变化的文件不读取内容；对话记录对照内存 manifest，
+        只读取索引记录过期的对话。
+
+        Returns:
+            {"updated": N, "removed": N, "total": N}（按文件计数）
+        """
+        seen = set()
+        updated = 0
+        for path in self._iter_memory_files():
+            file_id = self._file_id(path)
+            seen.add(file_id)
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            if self._is_current(file_id, st.st_mtime_ns, st.st_size):
+                continue
+            text = self._read_document(path)
+            if text is None:
+                continue
+            self._put_document(path, text, st)
+            updated += 1
+
+        for entry in self.conversations.entries():
+            file_id = self._conversation_file_id(entry["id"])
+            seen.add(file_id)
+            if self._is_current(file_id, entry["mtime_ns"], entry["length"]):
+                continue
+            record = self.conversations.get(entry["id"])
+            if record is None:
+                continue
+            text = self._conversation_text(record.get("messages", []))
+            self._put_chunks(
+                file_id, self._chunk_conversation(text),
+                mtime_ns=entry["mtime_ns"], size=entry["length"],
+            )
+            updated += 1
+
+        removed = [file_id for file_id in self.index.file_ids() if file_id not in seen]
+        for file_id in removed:
+            self._drop_document(file_id)
+        if self.vectors is not None:
+            live = set(self.index.doc_ids())
+            for doc_id in self.vectors.doc_ids():
+                if doc_id not in live:
+                    self.vectors.remove(doc_id)
+
+        self._last_refresh = time.monotonic()
+        if updated or removed:
+            logger.info(f"Memory index refreshed: {updated} updated, {len(removed)} removed")
+        return {"updated": updated, "removed": len(removed), "total": len(self.index.file_ids())}
+
+    def _is_current(self, file_id: str, mtime_ns: int, size: int) -> bool:
+        """索引记录与文件 mtime/size 一致，且（启用时）向量库覆盖了全部 chunk。"""
+        record = self.index.get_file(file_id)
+        if record is None or record["mtime_ns"] != mtime_ns or record["size"] != size:
+            return False
+        if self.vectors is not None:
+            return all(self.vectors.get(f"{file_id}#{c[0]}") is not None for c in record["chunks"])
+        return True
+
+    def _maybe_refresh_index(self) -> None:
+        if time.monotonic() - self._last_refresh >= self.refresh_interval:
+            self.refresh_index()
+
+    @staticmethod
+    def _coarse_score(matched: dict[str, int]) -> float:
+        """索引粗排分：英文词命中 2.0，中文 bigram 命中 0.3。"""
+        return sum(2.0 if is_word_term(term) else 0.3 for term in matched)
+
+    def _load_candidate(self, doc_id: str, query: str, matched: dict[str, int]) -> dict | None:
+        """读取候选 chunk 内容；对话记录只截取命中位置附近的片段。
+
+        Markdown chunk 按索引记录的字节区间读取；文件在上次索引后被改动时
+        先重新切分，chunk 已不存在则跳过（下次检索会命中新的 chunk）。
+        """
+        file_id, _, chunk_id = doc_id.rpartition("#")
+        path = self.memory_dir / file_id
+
+        if file_id.startswith("conversations/"):
+            record = self.conversations.get(file_id.split("/", 1)[1])
+            if record is None:
+                self._drop_document(file_id)
+                return None
+            text = self._conversation_text(record.get("messages", []))
+            if not text.strip():
+                return None
+            pos = min(matched.values()) if matched else None
+            text = self._extract_snippet(text, query, max_chars=500, pos=pos)
+            if not text:
+                return None
+            return {"source": str(path), "content": text, "chunk_id": chunk_id}
+
+        try:
+            st = path.stat()
+        except OSError:
+            self._drop_document(file_id)
+            return None
+        if not self._is_current(file_id, st.st_mtime_ns, st.st_size):
+            full_text = self._read_document(path)
+            if full_text is None:
+                return None
+            self._put_document(path, full_text, st)
+        span = self.index.chunk_range(doc_id)
+        if span is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                f.seek(span[0])
+                text = f.read(span[1] - span[0]).decode("utf-8").strip()
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning(f"Failed to read {path}: {e}")
+            return None
+        if not text:
+            return None
+        return {"source": str(path), "content": text, "chunk_id": chunk_id}
+
+    def _extract_snippet(
+        self,
+        text: str,
+        query: str,
+        max_chars: int = 500,
+        pos: int | None = None,
+    ) -> str | None:
+        """从文本中提取与查询最相关的片段。
+
+        Args:
+            pos: 已知的命中位置（来自索引偏移），优先使用完整查询的位置
+        """
         query_lower = query.lower()
         text_lower = text.lower()
 
         # 查找查询在文本中的位置
-        pos = text_lower.find(query_lower)
+        full_pos = text_lower.find(query_lower)
+        if full_pos >= 0 or pos is None or not 0 <= pos < len(text):
+            pos = full_pos
         if pos == -1:
             # 尝试查找查询中的单个词
             for word in query_lower.split():
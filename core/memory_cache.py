@@ -0,0 +1,143 @@
+"""记忆文件读缓存 — 按路径 + (mtime_ns, size, inode) 校验的进程内 LRU。
+
+命中时只需一次 stat，不读文件；文件被外部修改（mtime/size/inode 任一变化）后
+自动失效。MemoryStore 自己的写入通过 store()/append() 直接更新缓存（write-through），
+之后的读取仍然只需 stat。
+
+除原文外还可缓存派生结果（如解析后的错误条目），随原文一起失效。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("signature", "text", "nbytes", "derived")
+
+    def __init__(self, signature: tuple[int, int, int], text: str):
+        self.signature = signature
+        self.text = text
+        self.nbytes = signature[1]
+        self.derived: dict[str, Any] = {}
+
+
+def _signature(st: os.stat_result) -> tuple[int, int, int]:
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class FileCache:
+    """带条目数与字节上限的 LRU 文本缓存。"""
+
+    def __init__(self, *, max_entries: int = 64, max_bytes: int = 4 * 1024 * 1024):
+        """
+        Args:
+            max_entries: 最多缓存的文件数
+            max_bytes: 缓存文本总字节上限（超过单文件上限的文件不缓存）
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    # ──────────────────────────────────────
+    #  读取
+    # ──────────────────────────────────────
+
+    def _lookup(self, path: Path) -> _Entry | None:
+        """stat 一次并返回仍然有效的缓存条目；文件不存在返回 None。"""
+        key = str(path)
+        try:
+            st = path.stat()
+        except OSError:
+            self.invalidate(path)
+            return None
+
+        entry = self._entries.get(key)
+        if entry is not None and entry.signature == _signature(st):
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        try:
+            text = path.read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning(f"Failed to read {path}: {e}")
+            self.invalidate(path)
+            return None
+        return self._put(key, _Entry(_signature(st), text))
+
+    def read_text(self, path: Path) -> str | None:
+        """读取文件文本（命中时只 stat）。文件不存在或不可读返回 None。"""
+        entry = self._lookup(path)
+        return entry.text if entry is not None else None
+
+    def derived(self, path: Path, name: str, compute: Callable[[str], Any]) -> Any:
+        """返回基于文件文本的派生结果，文本未变时复用。文件不存在返回 None。"""
+        entry = self._lookup(path)
+        if entry is None:
+            return None
+        if name not in entry.derived:
+            entry.derived[name] = compute(entry.text)
+        return entry.derived[name]
+
+    # ──────────────────────────────────────
+    #  写入同步
+    # ──────────────────────────────────────
+
+    def store(self, path: Path, text: str) -> None:
+        """整文件写入后更新缓存（调用方刚写完 path）。"""
+        try:
+            st = path.stat()
+        except OSError:
+            self.invalidate(path)
+            return
+        self._put(str(path), _Entry(_signature(st), text))
+
+    def append(self, path: Path, text: str, size_before: int) -> None:
+        """追加写入后更新缓存：缓存的是追加前的完整内容时拼接，否则失效。"""
+        key = str(path)
+        entry = self._entries.get(key)
+        if entry is None or entry.signature[1] != size_before:
+            self.invalidate(path)
+            return
+        try:
+            st = path.stat()
+        except OSError:
+            self.invalidate(path)
+            return
+        self._put(key, _Entry(_signature(st), entry.text + text))
+
+    def invalidate(self, path: Path) -> None:
+        entry = self._entries.pop(str(path), None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def _put(self, key: str, entry: _Entry) -> _Entry:
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.nbytes
+        if entry.nbytes > self.max_bytes:
+            return entry
+        self._entries[key] = entry
+        self._bytes += entry.nbytes
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,168 @@
+"""错误模式存储 — 按日期分片的 JSONL，error_patterns.md 作为渲染视图。
+
+磁盘格式（workspace/memory/user/errors/）：
+- YYYY-MM-DD.jsonl：当天的错误条目，每行 {"date", "pattern", "source", "line"}
+- state.json：{"view_signature": [mtime_ns, size], "preamble": [...]}，
+  记录 error_patterns.md 最近一次与分片同步时的签名，以及视图中的非条目行（标题、说明）
+
+"最近 N 天" 查询只读取 N+1 个分片，与历史长度无关。
+error_patterns.md 仍然追加写入，供人阅读和记忆检索；若它被外部改写
+（签名与记录不一致，包括首次启用时的旧文件），从视图重建全部分片。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from core.memory_cache import FileCache
+
+logger = logging.getLogger(__name__)
+
+_ENTRY_RE = re.compile(r"^- \[(\d{4}-\d{2}-\d{2})\]")
+
+
+def _parse_shard(text: str) -> list[dict]:
+    entries = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return entries
+
+
+class ErrorPatternStore:
+    """按日期分片的错误模式存储。"""
+
+    def __init__(self, shard_dir: str | Path, view_path: str | Path, *, cache: FileCache | None = None):
+        """
+        Args:
+            shard_dir: 分片目录（memory/user/errors/）
+            view_path: 渲染视图 error_patterns.md
+            cache: 分片读缓存（与 MemoryStore 共用），None 时新建
+        """
+        self.shard_dir = Path(shard_dir)
+        self.view_path = Path(view_path)
+        self.state_path = self.shard_dir / "state.json"
+        self._cache = cache or FileCache()
+        self._view_signature: list[int] | None = None
+        self.preamble: list[str] = []
+
+    def load(self) -> None:
+        """读取同步状态。"""
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+            self._view_signature = state.get("view_signature")
+            self.preamble = state.get("preamble", [])
+        except (OSError, json.JSONDecodeError, AttributeError):
+            self._view_signature = None
+            self.preamble = []
+
+    def shard_path(self, date: str) -> Path:
+        return self.shard_dir / f"{date}.jsonl"
+
+    # ──────────────────────────────────────
+    #  与视图同步
+    # ──────────────────────────────────────
+
+    def _current_signature(self) -> list[int] | None:
+        try:
+            st = self.view_path.stat()
+        except OSError:
+            return None
+        return [st.st_mtime_ns, st.st_size]
+
+    def sync(self) -> None:
+        """视图被外部修改（或删除）时从视图重建分片。只需一次 stat。"""
+        signature = self._current_signature()
+        if signature == self._view_signature:
+            return
+        self.rebuild()
+
+    def mark_synced(self) -> None:
+        """调用方刚把条目同时写入分片和视图，记录视图新签名。"""
+        self._view_signature = self._current_signature()
+        self._save_state()
+
+    def rebuild(self) -> None:
+        """解析整个视图文件，重写全部分片。"""
+        by_date: dict[str, list[dict]] = {}
+        preamble: list[str] = []
+        if self.view_path.exists():
+            try:
+                content = self.view_path.read_text(encoding="utf-8")
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"Failed to read {self.view_path}: {e}")
+                return
+            for line in content.split("\n"):
+                match = _ENTRY_RE.match(line)
+                if match:
+                    date = match.group(1)
+                    pattern = line[match.end():].strip()
+                    by_date.setdefault(date, []).append(
+                        {"date": date, "pattern": pattern, "source": "", "line": line}
+                    )
+                elif not line.startswith("- ["):
+                    preamble.append(line)
+
+        for shard in self.shard_dir.glob("*.jsonl"):
+            if shard.stem not in by_date:
+                shard.unlink(missing_ok=True)
+                self._cache.invalidate(shard)
+        for date, entries in by_date.items():
+            shard = self.shard_path(date)
+            tmp = shard.with_suffix(".tmp")
+            tmp.write_text(
+                "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries), encoding="utf-8"
+            )
+            os.replace(tmp, shard)
+            self._cache.invalidate(shard)
+
+        while preamble and not preamble[-1].strip():
+            preamble.pop()
+        self.preamble = preamble
+        self.mark_synced()
+        if by_date:
+            logger.info(f"Error pattern shards rebuilt from view: {len(by_date)} days")
+
+    def _save_state(self) -> None:
+        state = {"view_signature": self._view_signature, "preamble": self.preamble}
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.state_path)
+
+    # ──────────────────────────────────────
+    #  读写
+    # ──────────────────────────────────────
+
+    def append(self, date: str, pattern: str, source: str, line: str) -> None:
+        """追加一条条目到当天分片（视图由调用方追加）。"""
+        shard = self.shard_path(date)
+        entry = {"date": date, "pattern": pattern, "source": source, "line": line}
+        try:
+            size_before = shard.stat().st_size
+        except OSError:
+            size_before = 0
+        text = json.dumps(entry, ensure_ascii=False) + "\n"
+        with shard.open("a", encoding="utf-8") as f:
+            f.write(text)
+        self._cache.append(shard, text, size_before)
+
+    def recent(self, days: int) -> list[dict]:
+        """最近 N 天（含今天）的条目，按日期升序。只读取对应日期的分片。"""
+        today = datetime.now().date()
+        entries: list[dict] = []
+        for offset in range(days, -1, -1):
+            date = (today - timedelta(days=offset)).strftime("%Y-%m-%d")
+            shard_entries = self._cache.derived(self.shard_path(date), "entries", _parse_shard)
+            if shard_entries:
+                entries.extend(shard_entries)
+        return entries
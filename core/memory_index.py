@@ -0,0 +1,447 @@
+"""记忆倒排索引 — 词项 → 倒排列表，增量更新并持久化到磁盘。
+
+索引单位是 chunk：Markdown 记忆文件在写入时按标题/段落切分
+（见 split_chunks），chunk ID 为内容哈希，内容不变则 ID 不变，
+重写文件时只需为新增/变化的 chunk 重新切词。对话记录整篇作为一个 chunk。
+
+同时维护 BM25 所需的文档统计（词频、文档长度、文档频率），
+随 chunk 增删增量更新，IDF 按需计算并缓存。
+
+词项切分规则（与 MemoryStore 评分保持一致）：
+- 英文/数字：连续的 [a-z0-9] 串，长度 ≥ 2
+- 中文：连续汉字串切成字符 bigram（单字串保留单字）
+
+磁盘格式（workspace/memory/index/）：
+- snapshot.json：完整索引快照
+- journal.jsonl：快照之后的增量操作（file / del），加载时重放
+journal 超过阈值后自动合并进快照。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+from pathlib import Path
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+_FORMAT_VERSION = 3
+DEFAULT_CHUNK_CHARS = 600
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]+")
+
+
+def _is_cjk(ch: str) -> bool:
+    return "\u4e00" <= ch <= "\u9fff"
+
+
+def analyze(text: str, base_offset: int = 0) -> tuple[dict[str, int], dict[str, int]]:
+    """切分文本为词项。
+
+    Args:
+        text: 原始文本
+        base_offset: 偏移量基准（追加写入时为原文件长度）
+
+    Returns:
+        ({词项: 首次出现的字符偏移}, {词项: 出现次数})
+    """
+    offsets: dict[str, int] = {}
+    counts: dict[str, int] = {}
+    if not text:
+        return offsets, counts
+    for match in _TOKEN_RE.finditer(text.lower()):
+        token = match.group()
+        start = base_offset + match.start()
+        if _is_cjk(token[0]):
+            if len(token) == 1:
+                pieces = [(token, start)]
+            else:
+                pieces = [(token[i:i + 2], start + i) for i in range(len(token) - 1)]
+        elif len(token) >= 2:
+            pieces = [(token, start)]
+        else:
+            continue
+        for term, pos in pieces:
+            offsets.setdefault(term, pos)
+            counts[term] = counts.get(term, 0) + 1
+    return offsets, counts
+
+
+def extract_terms(text: str, base_offset: int = 0) -> dict[str, int]:
+    """切分文本为词项，返回 {词项: 首次出现的字符偏移}。"""
+    return analyze(text, base_offset)[0]
+
+
+def is_word_term(term: str) -> bool:
+    """英文/数字词项（评分权重高于中文 bigram）。"""
+    return not _is_cjk(term[0])
+
+
+def chunk_id_for(text: str, seen: set[str]) -> str:
+    """内容哈希 chunk ID；同一文件内重复内容追加序号。"""
+    base = hashlib.sha1(text.strip().encode("utf-8")).hexdigest()[:12]
+    chunk_id = base
+    n = 2
+    while chunk_id in seen:
+        chunk_id = f"{base}-{n}"
+        n += 1
+    seen.add(chunk_id)
+    return chunk_id
+
+
+def split_chunks(
+    text: str,
+    *,
+    base_byte: int = 0,
+    max_chars: int = DEFAULT_CHUNK_CHARS,
+    seen: set[str] | None = None,
+) -> list[tuple[str, str, int, int]]:
+    """把 Markdown 文本切成标题/段落级 chunk。
+
+    规则：标题行开启新 chunk；空行处若当前 chunk 已达 max_chars/3 则断开；
+    累计超过 max_chars 时在行边界断开（长列表如 preferences.md 按行打包）。
+    切分是从左到右贪心的，因此追加写入只影响最后一个 chunk 之后的部分。
+
+    Args:
+        text: 文件文本（或从某个 chunk 起点开始的尾部）
+        base_byte: text 在文件中的起始字节偏移
+        max_chars: 单个 chunk 的目标上限（字符）
+        seen: 已占用的 chunk ID（尾部重切时传入前缀 chunk 的 ID）
+
+    Returns:
+        [(chunk_id, chunk_text, start_byte, end_byte)]，字节偏移相对文件
+    """
+    seen = set() if seen is None else set(seen)
+    chunks: list[tuple[str, str, int, int]] = []
+    lines: list[str] = []
+    chars = 0
+    start = pos = base_byte
+
+    def close() -> None:
+        nonlocal lines, chars, start
+        chunk_text = "".join(lines)
+        if chunk_text.strip():
+            chunks.append((chunk_id_for(chunk_text, seen), chunk_text, start, pos))
+        lines = []
+        chars = 0
+        start = pos
+
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        if lines and (
+            stripped.startswith("#")
+            or chars + len(line) > max_chars
+        ):
+            close()
+        lines.append(line)
+        chars += len(line)
+        pos += len(line.encode("utf-8"))
+        if not stripped and chars >= max_chars // 3:
+            close()
+    close()
+    return chunks
+
+
+class MemoryIndex:
+    """记忆文件的持久化倒排索引。
+
+    - 文件以相对 memory/ 的路径作为 ID（如 ``user/profile.md``），
+      记录 mtime_ns/size 用于判断是否需要重建，以及 chunk 列表（ID + 字节区间）
+    - 被检索的文档是 chunk，文档 ID 为 ``{file_id}#{chunk_id}``
+    """
+
+    def __init__(self, index_dir: str | Path, *, journal_limit: int = 500):
+        """
+        Args:
+            index_dir: 索引文件目录
+            journal_limit: journal 条数超过该值时合并进快照
+        """
+        self.index_dir = Path(index_dir)
+        self.snapshot_path = self.index_dir / "snapshot.json"
+        self.journal_path = self.index_dir / "journal.jsonl"
+        self.journal_limit = journal_limit
+        self._reset()
+
+    def _reset(self) -> None:
+        self._files: dict[str, dict] = {}
+        self._docs: dict[str, dict] = {}
+        self._postings: dict[str, dict[str, int]] = {}
+        self._journal_entries = 0
+        self._total_length = 0
+        self._idf_cache: dict[str, float] = {}
+
+    # ──────────────────────────────────────
+    #  持久化
+    # ──────────────────────────────────────
+
+    def load(self) -> None:
+        """从快照 + journal 恢复索引。损坏时丢弃，由调用方重建。"""
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self._reset()
+
+        if self.snapshot_path.exists():
+            try:
+                data = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+                if data.get("version") == _FORMAT_VERSION:
+                    for doc_id, doc in data.get("docs", {}).items():
+                        self._add_doc(doc_id, doc)
+                    self._files = data.get("files", {})
+                else:
+                    logger.info("Memory index format changed, rebuilding")
+                    self.journal_path.unlink(missing_ok=True)
+            except (json.JSONDecodeError, OSError, AttributeError, KeyError) as e:
+                logger.warning(f"Memory index snapshot unreadable, rebuilding: {e}")
+                self._reset()
+
+        if self.journal_path.exists():
+            try:
+                with self.journal_path.open("r", encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            self._apply(json.loads(line))
+                        except (json.JSONDecodeError, KeyError, TypeError):
+                            continue
+                        self._journal_entries += 1
+            except OSError as e:
+                logger.warning(f"Memory index journal unreadable: {e}")
+
+    def compact(self) -> None:
+        """把 journal 合并进快照（原子替换）。"""
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        payload = {"version": _FORMAT_VERSION, "files": self._files, "docs": self._docs}
+        tmp = self.snapshot_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.snapshot_path)
+        self.journal_path.write_text("", encoding="utf-8")
+        self._journal_entries = 0
+
+    def _log(self, entry: dict) -> None:
+        """追加一条 journal 记录，必要时触发合并。"""
+        try:
+            with self.journal_path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._journal_entries += 1
+            if self._journal_entries >= self.journal_limit:
+                self.compact()
+        except OSError as e:
+            logger.warning(f"Failed to persist memory index update: {e}")
+
+    def _apply(self, entry: dict) -> None:
+        """重放一条 journal 记录。"""
+        op = entry["op"]
+        file_id = entry["id"]
+        old_ids = self._chunk_doc_ids(file_id)
+        if op == "del":
+            for doc_id in old_ids:
+                self._remove_doc(doc_id)
+            self._files.pop(file_id, None)
+            return
+
+        record = {
+            "mtime_ns": entry.get("mtime_ns", 0),
+            "size": entry.get("size", 0),
+            "chunks": entry["chunks"],
+        }
+        new_ids = {f"{file_id}#{c[0]}" for c in record["chunks"]}
+        for doc_id in old_ids - new_ids:
+            self._remove_doc(doc_id)
+        for doc_id, doc in entry["docs"].items():
+            self._remove_doc(doc_id)
+            self._add_doc(doc_id, {"terms": doc["terms"], "tf": doc["tf"]})
+        self._files[file_id] = record
+
+    # ──────────────────────────────────────
+    #  更新
+    # ──────────────────────────────────────
+
+    def put_file(
+        self,
+        file_id: str,
+        chunks: list[tuple[str, str | None, int, int]],
+        *,
+        mtime_ns: int = 0,
+        size: int = 0,
+    ) -> tuple[list[str], list[str]]:
+        """用新的 chunk 列表替换文件的索引。
+
+        已存在的 chunk（ID 相同即内容相同）直接复用，只为新 chunk 切词。
+
+        Args:
+            file_id: 文件 ID
+            chunks: [(chunk_id, chunk_text, start_byte, end_byte)]；
+                chunk_text 为 None 表示调用方确认该 chunk 未变化
+            mtime_ns: 文件 mtime
+            size: 文件字节数
+
+        Returns:
+            (新增的文档 ID 列表, 删除的文档 ID 列表)
+        """
+        old_ids = self._chunk_doc_ids(file_id)
+        docs = {}
+        for chunk_id, chunk_text, _, _ in chunks:
+            doc_id = f"{file_id}#{chunk_id}"
+            if doc_id in self._docs or chunk_text is None:
+                continue
+            offsets, counts = analyze(chunk_text)
+            docs[doc_id] = {"terms": offsets, "tf": counts}
+
+        entry = {
+            "op": "file",
+            "id": file_id,
+            "mtime_ns": mtime_ns,
+            "size": size,
+            "chunks": [[chunk_id, start, end] for chunk_id, _, start, end in chunks],
+            "docs": docs,
+        }
+        self._apply(entry)
+        self._log(entry)
+        new_ids = {f"{file_id}#{c[0]}" for c in entry["chunks"]}
+        return list(docs), sorted(old_ids - new_ids)
+
+    def remove_file(self, file_id: str) -> list[str]:
+        """从索引中删除文件，返回被删除的文档 ID。"""
+        if file_id not in self._files:
+            return []
+        removed = sorted(self._chunk_doc_ids(file_id))
+        entry = {"op": "del", "id": file_id}
+        self._apply(entry)
+        self._log(entry)
+        return removed
+
+    def _chunk_doc_ids(self, file_id: str) -> set[str]:
+        record = self._files.get(file_id)
+        if record is None:
+            return set()
+        return {f"{file_id}#{c[0]}" for c in record["chunks"]}
+
+    def _add_doc(self, doc_id: str, doc: dict) -> None:
+        doc.setdefault("dl", sum(doc["tf"].values()))
+        self._docs[doc_id] = doc
+        self._total_length += doc["dl"]
+        self._idf_cache.clear()
+        for term, offset in doc["terms"].items():
+            self._postings.setdefault(term, {})[doc_id] = offset
+
+    def _remove_doc(self, doc_id: str) -> None:
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self._total_length -= doc["dl"]
+        self._idf_cache.clear()
+        for term in doc["terms"]:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(doc_id, None)
+            if not posting:
+                del self._postings[term]
+
+    # ──────────────────────────────────────
+    #  查询
+    # ──────────────────────────────────────
+
+    def get_file(self, file_id: str) -> dict | None:
+        """返回文件记录 {"mtime_ns", "size", "chunks": [[chunk_id, start, end], ...]}。"""
+        return self._files.get(file_id)
+
+    def file_ids(self) -> list[str]:
+        return list(self._files)
+
+    def chunk_range(self, doc_id: str) -> tuple[int, int] | None:
+        """返回 chunk 在文件中的字节区间。"""
+        file_id, _, chunk_id = doc_id.rpartition("#")
+        record = self._files.get(file_id)
+        if record is None:
+            return None
+        for cid, start, end in record["chunks"]:
+            if cid == chunk_id:
+                return start, end
+        return None
+
+    def get(self, doc_id: str) -> dict | None:
+        """返回 chunk 文档统计 {"terms", "tf", "dl"}。"""
+        return self._docs.get(doc_id)
+
+    def doc_ids(self) -> list[str]:
+        return list(self._docs)
+
+    def lookup(
+        self,
+        terms: Iterable[str],
+        prefixes: tuple[str, ...] | None = None,
+    ) -> dict[str, dict[str, int]]:
+        """合并查询词项的倒排列表。
+
+        Args:
+            terms: 查询词项
+            prefixes: 只保留 ID 以这些前缀开头的文档（None 表示不过滤）
+
+        Returns:
+            {doc_id: {命中词项: 偏移}}
+        """
+        hits: dict[str, dict[str, int]] = {}
+        for term in terms:
+            posting = self._postings.get(term)
+            if not posting:
+                continue
+            for doc_id, offset in posting.items():
+                if prefixes is not None and not doc_id.startswith(prefixes):
+                    continue
+                hits.setdefault(doc_id, {})[term] = offset
+        return hits
+
+    def idf(self, term: str) -> float:
+        """BM25 IDF（Robertson-Sparck Jones 平滑，恒为正），按需计算并缓存。"""
+        cached = self._idf_cache.get(term)
+        if cached is not None:
+            return cached
+        n = len(self._docs)
+        df = len(self._postings.get(term, ()))
+        value = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+        self._idf_cache[term] = value
+        return value
+
+    def bm25(
+        self,
+        terms: Iterable[str],
+        prefixes: tuple[str, ...] | None = None,
+        *,
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+    ) -> dict[str, float]:
+        """只遍历查询词项的倒排列表计算 BM25 分数。
+
+        Returns:
+            {doc_id: score}，仅包含至少命中一个词项的文档
+        """
+        if not self._docs:
+            return {}
+        avgdl = self._total_length / len(self._docs) or 1.0
+        scores: dict[str, float] = {}
+        for term in set(terms):
+            posting = self._postings.get(term)
+            if not posting:
+                continue
+            idf = self.idf(term)
+            for doc_id in posting:
+                if prefixes is not None and not doc_id.startswith(prefixes):
+                    continue
+                doc = self._docs[doc_id]
+                tf = doc["tf"].get(term, 0)
+                norm = tf + k1 * (1.0 - b + b * doc["dl"] / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1.0) / norm
+        return scores
+
+    def __len__(self) -> int:
+        return len(self._docs)
@@ -0,0 +1,252 @@
+"""本地向量检索后端 — 哈希 n-gram 特征向量 + numpy 矩阵 top-k。
+
+不依赖任何外部 embedding 服务：
+- 向量化：复用 memory_index 的词项切分（英文词 + 中文 bigram），
+  对数词频后按 crc32 哈希到固定维度（带符号哈希减少碰撞偏差），L2 归一化
+- 存储：workspace/memory/index/vectors.f32（float32 行存储，np.memmap 映射）
+  + vectors_rows.jsonl（行号 → 文档 ID、mtime、size），两者均只追加；
+  文档更新时追加新行并作废旧行，作废行过多时重写压缩
+- 检索：一次矩阵乘法得到全部余弦相似度，argpartition 取 top-k
+
+numpy 为可选依赖，未安装时 ``is_available()`` 返回 False，由 MemoryStore 回退关键词检索。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import zlib
+from pathlib import Path
+
+from core.memory_index import analyze
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - 取决于运行环境
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIM = 512
+
+
+def is_available() -> bool:
+    """numpy 是否可用。"""
+    return np is not None
+
+
+def embed(text: str, dim: int = DEFAULT_DIM):
+    """把文本映射为 L2 归一化的哈希特征向量（float32）。"""
+    vec = np.zeros(dim, dtype=np.float32)
+    _, counts = analyze(text)
+    for term, count in counts.items():
+        h = zlib.crc32(term.encode("utf-8"))
+        sign = 1.0 if h & 0x80000000 else -1.0
+        vec[h % dim] += sign * (1.0 + math.log(count))
+    norm = float(np.linalg.norm(vec))
+    if norm > 0:
+        vec /= norm
+    return vec
+
+
+class VectorIndex:
+    """追加写入的本地向量库，按文档 ID 增量更新。"""
+
+    def __init__(self, index_dir: str | Path, *, dim: int = DEFAULT_DIM, compact_ratio: float = 0.5):
+        """
+        Args:
+            index_dir: 存储目录（与倒排索引共用）
+            dim: 向量维度
+            compact_ratio: 作废行占比超过该值时重写压缩
+        """
+        if np is None:
+            raise RuntimeError("numpy is required for the vector memory backend")
+        self.index_dir = Path(index_dir)
+        self.dim = dim
+        self.compact_ratio = compact_ratio
+        self.vectors_path = self.index_dir / "vectors.f32"
+        self.rows_path = self.index_dir / "vectors_rows.jsonl"
+
+        self._rows: list[dict | None] = []      # 行号 → {"id", "mtime_ns", "size"}，作废为 None
+        self._row_of: dict[str, int] = {}        # 文档 ID → 当前有效行号
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+        self._pending: list = []                 # 尚未并入 _matrix 的新行
+
+    # ──────────────────────────────────────
+    #  持久化
+    # ──────────────────────────────────────
+
+    def load(self) -> None:
+        """映射向量文件并重放行表。维度或行数不一致时清空重建。"""
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self._rows = []
+        self._row_of = {}
+        self._pending = []
+        self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+
+        if not self.vectors_path.exists() or not self.rows_path.exists():
+            self._truncate()
+            return
+
+        try:
+            rows = []
+            with self.rows_path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        rows.append(json.loads(line))
+            n_values = self.vectors_path.stat().st_size // 4
+            if n_values != len(rows) * self.dim:
+                raise ValueError("vector file does not match row table")
+            if rows:
+                self._matrix = np.memmap(
+                    self.vectors_path, dtype=np.float32, mode="r", shape=(len(rows), self.dim)
+                )
+        except (OSError, ValueError, json.JSONDecodeError) as e:
+            logger.warning(f"Vector index unreadable, rebuilding: {e}")
+            self._truncate()
+            return
+
+        for i, row in enumerate(rows):
+            previous = self._row_of.get(row["id"])
+            if previous is not None:
+                self._rows[previous] = None
+            if row.get("deleted"):
+                self._rows.append(None)
+                self._row_of.pop(row["id"], None)
+            else:
+                self._rows.append(row)
+                self._row_of[row["id"]] = i
+
+    def _truncate(self) -> None:
+        self.vectors_path.write_bytes(b"")
+        self.rows_path.write_text("", encoding="utf-8")
+
+    def compact(self) -> None:
+        """丢弃作废行，重写向量文件与行表。"""
+        live = [i for i, row in enumerate(self._rows) if row is not None]
+        matrix = self._full_matrix()
+        kept = np.ascontiguousarray(matrix[live]) if live else np.zeros((0, self.dim), dtype=np.float32)
+        rows = [self._rows[i] for i in live]
+
+        tmp_vectors = self.vectors_path.with_suffix(".tmp")
+        tmp_rows = self.rows_path.with_suffix(".tmp")
+        kept.astype(np.float32).tofile(tmp_vectors)
+        tmp_rows.write_text(
+            "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows), encoding="utf-8"
+        )
+        self._matrix = kept
+        self._pending = []
+        os.replace(tmp_vectors, self.vectors_path)
+        os.replace(tmp_rows, self.rows_path)
+
+        self._rows = list(rows)
+        self._row_of = {r["id"]: i for i, r in enumerate(rows)}
+
+    # ──────────────────────────────────────
+    #  更新
+    # ──────────────────────────────────────
+
+    def put(self, doc_id: str, text: str, *, mtime_ns: int = 0, size: int = 0) -> None:
+        """向量化文档并追加为新行，旧行作废。"""
+        vec = embed(text, self.dim)
+        row = {"id": doc_id, "mtime_ns": mtime_ns, "size": size}
+        with self.vectors_path.open("ab") as f:
+            f.write(vec.tobytes())
+        with self.rows_path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+        previous = self._row_of.get(doc_id)
+        if previous is not None:
+            self._rows[previous] = None
+        self._row_of[doc_id] = len(self._rows)
+        self._rows.append(row)
+        self._pending.append(vec)
+        self._maybe_compact()
+
+    def remove(self, doc_id: str) -> None:
+        """作废文档对应的行（追加一条零向量墓碑）。"""
+        row_no = self._row_of.pop(doc_id, None)
+        if row_no is None:
+            return
+        self._rows[row_no] = None
+        with self.vectors_path.open("ab") as f:
+            f.write(np.zeros(self.dim, dtype=np.float32).tobytes())
+        with self.rows_path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps({"id": doc_id, "deleted": True}, ensure_ascii=False) + "\n")
+        self._rows.append(None)
+        self._pending.append(np.zeros(self.dim, dtype=np.float32))
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        dead = len(self._rows) - len(self._row_of)
+        if len(self._rows) >= 64 and dead / len(self._rows) > self.compact_ratio:
+            self.compact()
+
+    # ──────────────────────────────────────
+    #  查询
+    # ──────────────────────────────────────
+
+    def get(self, doc_id: str) -> dict | None:
+        """返回文档的行元数据 {"id", "mtime_ns", "size"}。"""
+        row_no = self._row_of.get(doc_id)
+        return self._rows[row_no] if row_no is not None else None
+
+    def doc_ids(self) -> list[str]:
+        return list(self._row_of)
+
+    def _full_matrix(self):
+        """并入待合并的新行，返回完整矩阵。"""
+        if self._pending:
+            self._matrix = np.vstack([np.asarray(self._matrix), np.stack(self._pending)])
+            self._pending = []
+        return self._matrix
+
+    def search(
+        self,
+        query: str,
+        k: int,
+        prefixes: tuple[str, ...] | None = None,
+        min_score: float = 0.0,
+    ) -> list[tuple[str, float]]:
+        """余弦相似度 top-k（一次矩阵乘法）。
+
+        Returns:
+            [(doc_id, similarity)]，按相似度降序
+        """
+        if not self._row_of or k <= 0:
+            return []
+        q = embed(query, self.dim)
+        if not q.any():
+            return []
+        scores = self._full_matrix() @ q
+
+        # 先取略多于 k 的候选，过滤作废行和 scope 后不足再全量排序
+        candidates = min(len(scores), max(k * 4, 32))
+        while True:
+            if candidates < len(scores):
+                top = np.argpartition(-scores, candidates - 1)[:candidates]
+            else:
+                top = np.arange(len(scores))
+            top = top[np.argsort(-scores[top], kind="stable")]
+
+            results = []
+            for row_no in top:
+                score = float(scores[row_no])
+                if score <= min_score:
+                    return results
+                row = self._rows[row_no]
+                if row is None:
+                    continue
+                if prefixes is not None and not row["id"].startswith(prefixes):
+                    continue
+                results.append((row["id"], score))
+                if len(results) >= k:
+                    return results
+            if candidates >= len(scores):
+                return results
+            candidates = len(scores)
+
+    def __len__(self) -> int:
+        return len(self._row_of)
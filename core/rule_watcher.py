@@ -0,0 +1,170 @@
+"""规则文件变更监听 — 报告 constitution/ 与 experience/ 下变化的 *.md 文件。
+
+RulesInterpreter 据此只重新解析变化的文件，而不是整目录重载。
+
+两种后端：
+- inotify（Linux，经 ctypes 调用 libc，无额外依赖）：非阻塞读取事件队列，
+  无变化时一次 read 系统调用即返回，不访问目录；
+- mtime 轮询（其它平台或 inotify 不可用时）：按 (mtime_ns, size, inode) 对比快照，
+  两次扫描之间有最小间隔。
+
+poll() 是同步非阻塞调用，由使用方在处理消息前调用；不启动线程。
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+RULE_SUBDIRS = ("constitution", "experience")
+
+# inotify 常量（<sys/inotify.h>）
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+# 写入完成（close）、重命名进出和删除；不监听 IN_MODIFY，避免解析写了一半的文件
+_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _InotifyBackend:
+    """基于 inotify 的变更来源。"""
+
+    def __init__(self, directories: list[Path]):
+        self._fd = -1
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._fd = fd
+        self._dirs: dict[int, Path] = {}
+        try:
+            for directory in directories:
+                wd = libc.inotify_add_watch(fd, os.fsencode(directory), _WATCH_MASK)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+                self._dirs[wd] = directory
+        except OSError:
+            self.close()
+            raise
+
+    def poll(self) -> set[Path] | None:
+        """返回变化的文件；事件丢失（队列溢出、目录被移走）时返回 None。"""
+        changed: set[Path] = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & (_IN_Q_OVERFLOW | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_IGNORED):
+                    return None
+                directory = self._dirs.get(wd)
+                if directory is not None and name:
+                    changed.add(directory / os.fsdecode(name))
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def __del__(self):
+        self.close()
+
+
+class _PollingBackend:
+    """按文件签名快照轮询的变更来源。"""
+
+    def __init__(self, directories: list[Path], min_interval: float = 1.0):
+        self._dirs = directories
+        self.min_interval = min_interval
+        self._last_scan = 0.0
+        self._snapshot = self._scan()
+
+    def _scan(self) -> dict[Path, tuple[int, int, int]]:
+        self._last_scan = time.monotonic()
+        snapshot = {}
+        for directory in self._dirs:
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if not entry.name.endswith(".md"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                snapshot[Path(entry.path)] = (st.st_mtime_ns, st.st_size, st.st_ino)
+        return snapshot
+
+    def poll(self) -> set[Path] | None:
+        if time.monotonic() - self._last_scan < self.min_interval:
+            return set()
+        previous, self._snapshot = self._snapshot, self._scan()
+        return {
+            path for path in previous.keys() | self._snapshot.keys()
+            if previous.get(path) != self._snapshot.get(path)
+        }
+
+    def close(self) -> None:
+        pass
+
+
+class RuleWatcher:
+    """监听规则目录，报告自上次 poll() 以来变化的规则文件。"""
+
+    def __init__(self, rules_dir: str | Path, *, poll_interval: float = 1.0, use_inotify: bool = True):
+        """
+        Args:
+            rules_dir: workspace/rules/ 目录路径
+            poll_interval: 轮询后端两次扫描的最小间隔（秒）
+            use_inotify: 是否优先使用 inotify（仅 Linux 且规则子目录都存在时生效）
+        """
+        self.rules_dir = Path(rules_dir)
+        directories = [self.rules_dir / sub for sub in RULE_SUBDIRS]
+        self._backend: _InotifyBackend | _PollingBackend | None = None
+        if use_inotify and sys.platform.startswith("linux") and all(d.is_dir() for d in directories):
+            try:
+                self._backend = _InotifyBackend(directories)
+            except (OSError, AttributeError) as e:
+                logger.info("inotify unavailable, polling rule files instead: %s", e)
+        if self._backend is None:
+            self._backend = _PollingBackend(directories, min_interval=poll_interval)
+
+    @property
+    def backend(self) -> str:
+        """当前后端："inotify" 或 "polling"。"""
+        return "inotify" if isinstance(self._backend, _InotifyBackend) else "polling"
+
+    def poll(self) -> set[Path] | None:
+        """返回变化（新增/修改/删除）的 *.md 规则文件；无法确定变化范围时返回 None，调用方应全量重载。"""
+        changed = self._backend.poll()
+        if changed is None:
+            return None
+        return {path for path in changed if path.suffix == ".md"}
+
+    def close(self) -> None:
+        """释放 inotify 文件描述符。"""
+        self._backend.close()
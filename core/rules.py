@@ -4,12 +4,44 @@
 名称从文件名推断，关键词从内容标题和正文提取。
 """
 
+import hashlib
+import heapq
 import logging
 import re
+from collections import OrderedDict
 from pathlib import Path
 
+from core.rule_watcher import RuleWatcher
+from core.tokens import count_tokens
+
 logger = logging.getLogger(__name__)
 
+_HEADING_RE = re.compile(r"^#+\s+(.+)$", re.MULTILINE)
+# 参与 bigram 相关性计算的规则正文长度
+BIGRAM_PREVIEW_CHARS = 300
+
+
+def char_bigrams(text: str) -> frozenset[str]:
+    """字符 bigram 集合（适用于中文无空格文本）。"""
+    return frozenset(text[i:i + 2] for i in range(len(text) - 1))
+
+
+class RuleFeatures:
+    """规则的预计算匹配特征，打分时只做集合运算与子串判断。"""
+
+    __slots__ = ("content", "keywords", "keywords_lower", "name_readable", "bigrams")
+
+    def __init__(self, rule: "Rule"):
+        self.content = rule.content
+        kws = list(rule.metadata.get("keywords", []))
+        # 从 Markdown 标题提取关键词
+        for match in _HEADING_RE.finditer(rule.content):
+            kws.extend(match.group(1).strip().split())
+        self.keywords: tuple[str, ...] = tuple(kws)
+        self.keywords_lower: tuple[str, ...] = tuple(kw.lower() for kw in kws)
+        self.name_readable = rule.name.replace("_", " ").lower()
+        self.bigrams = char_bigrams(rule.content[:BIGRAM_PREVIEW_CHARS].lower())
+
 
 class Rule:
     """单条规则的数据结构。"""
@@ -27,20 +59,24 @@ class Rule:
         self.level = level  # "constitution" | "experience"
         self.content = content
         self.metadata = metadata or {}
+        self._features: RuleFeatures | None = None
+
+    @property
+    def features(self) -> RuleFeatures:
+        """预计算的匹配特征（首次访问时计算，content 被替换后重新计算）。"""
+        features = self._features
+        if features is None or features.content is not self.content:
+            features = self._features = RuleFeatures(self)
+        return features
 
     @property
     def keywords(self) -> list[str]:
         """从内容中提取关键词（标题词 + metadata 中的 keywords）。"""
-        kws = list(self.metadata.get("keywords", []))
-        # 从 Markdown 标题提取关键词
-        for match in re.finditer(r"^#+\s+(.+)$", self.content, re.MULTILINE):
-            heading = match.group(1).strip()
-            kws.extend(heading.split())
-        return kws
+        return list(self.features.keywords)
 
     def token_estimate(self) -> int:
-        """粗略估算 token 数（中英混合取 len/2）。"""
-        return len(self.content) // 2
+        """估算 token 数（core.tokens 统一计数器，结果按文本缓存）。"""
+        return count_tokens(self.content)
 
     def __repr__(self):
         return f"Rule({self.name}, level={self.level}, ~{self.token_estimate()}tok)"
@@ -71,17 +107,99 @@ def parse_rule_file(file_path: Path) -> Rule | None:
     )
 
 
+# 无任何匹配时的基础分（_score_features 末尾加的常数）
+_BASE_SCORE = 0.01
+
+
+class RuleIndex:
+    """经验规则倒排索引：bigram / 单字符 → 规则序号。
+
+    规则能得到高于基础分的分数，必然与上下文共享至少一个 key：
+    - 正文 bigram 重叠 → 共享正文 bigram；
+    - 关键词/名称是上下文的子串 → 其 bigram（单字符时为该字符）都在上下文中；
+    - 上下文是关键词/名称的子串（上下文长度 ≥ 2）→ 共享上下文的 bigram。
+    因此只需给命中的候选打分，其余规则都是基础分，按加载顺序排在后面。
+    构建后不再修改，重新加载时整体替换。
+    """
+
+    def __init__(self, rules: list[Rule]):
+        self.rules = list(rules)
+        self._postings: dict[str, list[int]] = {}
+        # 含空关键词的规则对任何上下文都得分，始终作为候选
+        self._always: list[int] = []
+        for idx, rule in enumerate(self.rules):
+            features = rule.features
+            keys = set(features.bigrams)
+            for text in (*features.keywords_lower, features.name_readable):
+                if not text:
+                    self._always.append(idx)
+                elif len(text) == 1:
+                    keys.add(text)
+                else:
+                    keys |= char_bigrams(text)
+            for key in keys:
+                self._postings.setdefault(key, []).append(idx)
+
+    def candidates(self, context_lower: str, ctx_bigrams: frozenset[str]) -> set[int]:
+        """返回可能高于基础分的规则序号。"""
+        if len(context_lower) < 2:
+            # 单字符上下文可能是任意关键词的子串，无法用 bigram 剪枝
+            return set(range(len(self.rules)))
+        found = set(self._always)
+        for key in ctx_bigrams:
+            found.update(self._postings.get(key, ()))
+        for char in set(context_lower):
+            found.update(self._postings.get(char, ()))
+        return found
+
+
+class _RankedRules:
+    """一个上下文的候选排序结果，按需从堆中弹出并记住已弹出的顺序，可重复迭代。"""
+
+    __slots__ = ("rules", "ordered", "heap")
+
+    def __init__(self, rules: list[Rule], heap: list[tuple[float, int]]):
+        self.rules = rules
+        self.ordered: list[int] = []
+        heapq.heapify(heap)
+        self.heap = heap
+
+    def __iter__(self):
+        """相关度降序（同分按加载顺序）产出规则；候选之后按加载顺序产出其余基础分规则。"""
+        for idx in self.ordered:
+            yield self.rules[idx]
+        while self.heap:
+            _, idx = heapq.heappop(self.heap)
+            self.ordered.append(idx)
+            yield self.rules[idx]
+        ranked = set(self.ordered)
+        for idx, rule in enumerate(self.rules):
+            if idx not in ranked:
+                yield rule
+
+
 class RulesInterpreter:
     """规则解释器。读取规则文件、按相关性过滤、生成 prompt 片段。"""
 
-    def __init__(self, rules_dir: str):
+    def __init__(self, rules_dir: str, *, watch: bool = False, score_cache_size: int = 32):
         """
         Args:
             rules_dir: workspace/rules/ 目录路径
+            watch: 是否监听规则文件变化；开启后 refresh() 只重新解析变化的文件
+            score_cache_size: 缓存最近多少个上下文的经验规则排序结果
         """
         self.rules_dir = Path(rules_dir)
+        self.watch = watch
+        self._watcher: RuleWatcher | None = None
         self._constitution: list[Rule] = []
         self._experience: list[Rule] = []
+        self._experience_index = RuleIndex([])
+        # 上下文 → 排序结果；同一条消息的多次规则选择（含压缩后重新组装）只打分一次
+        self._score_cache: OrderedDict[str, _RankedRules] = OrderedDict()
+        self.score_cache_size = score_cache_size
+        # 宪法规则内容哈希与渲染结果：(哈希, 预算) → (prompt, tokens, 注入条数)
+        self._constitution_hash: str | None = None
+        self._constitution_blocks: dict[tuple[str, int], tuple[str, int, int]] = {}
         self._loaded = False
 
     def load_rules(self) -> dict:
@@ -92,6 +210,12 @@ class RulesInterpreter:
             {"constitution": [Rule, ...], "experience": [Rule, ...],
              "total_rules": int, "total_tokens": int}
         """
+        if self.watch:
+            # 先开始监听再读取，读取期间的修改会在下次 refresh() 时补上
+            if self._watcher is not None:
+                self._watcher.close()
+            self._watcher = RuleWatcher(self.rules_dir)
+
         self._constitution = []
         self._experience = []
 
@@ -108,8 +232,12 @@ class RulesInterpreter:
             for md_file in sorted(directory.glob("*.md")):
                 rule = parse_rule_file(md_file)
                 if rule and rule.content:
+                    rule.features  # 加载时预计算匹配特征
                     target_list.append(rule)
 
+        self._experience_index = RuleIndex(self._experience)
+        self._score_cache.clear()
+        self._constitution_hash = None
         self._loaded = True
         total_tokens = sum(r.token_estimate() for r in self._constitution + self._experience)
         logger.info(
@@ -149,58 +277,83 @@ class RulesInterpreter:
 
         if not task_context:
             # 无上下文时返回全部（受 token 限制）
-            rules = list(self._experience)
+            rules = iter(self._experience)
         else:
-            # 按相关性排序：关键词匹配得分
-            scored = []
-            for rule in self._experience:
-                score = self._relevance_score(rule, task_context)
-                scored.append((score, rule))
-            scored.sort(key=lambda x: x[0], reverse=True)
-            rules = [rule for _, rule in scored]
-
-        # Token 预算截断
-        if max_tokens is not None:
-            result = []
-            used = 0
-            for rule in rules:
-                est = rule.token_estimate()
-                if used + est > max_tokens:
-                    break
-                result.append(rule)
-                used += est
-            return result
+            rules = self._ranked_experience(task_context)
+
+        if max_tokens is None:
+            return list(rules)
+
+        # Token 预算截断：按相关度依次取出，超出预算即停止
+        result = []
+        used = 0
+        for rule in rules:
+            est = rule.token_estimate()
+            if used + est > max_tokens:
+                break
+            result.append(rule)
+            used += est
+        return result
+
+    def _ranked_experience(self, task_context: str) -> _RankedRules:
+        """按相关度降序（同分按加载顺序）排列的经验规则，结果按上下文缓存。
+
+        只给倒排索引命中的候选打分，用堆按需弹出；未命中的规则都是基础分，
+        之后按加载顺序产出。预算截断提前停止时只需 O(候选数 + k log 候选数)。
+        """
+        ranked = self._score_cache.get(task_context)
+        if ranked is not None:
+            self._score_cache.move_to_end(task_context)
+            return ranked
 
-        return rules
+        index = self._experience_index
+        context_lower = task_context.lower()
+        ctx_bigrams = char_bigrams(context_lower)
+        heap = []
+        for idx in index.candidates(context_lower, ctx_bigrams):
+            score = self._score_features(index.rules[idx].features, context_lower, ctx_bigrams)
+            if score > _BASE_SCORE:
+                heap.append((-score, idx))
+
+        ranked = _RankedRules(index.rules, heap)
+        self._score_cache[task_context] = ranked
+        if len(self._score_cache) > self.score_cache_size:
+            self._score_cache.popitem(last=False)
+        return ranked
 
     def _relevance_score(self, rule: Rule, task_context: str) -> float:
         """计算规则与任务的相关性分数（支持中英文）。"""
-        score = 0.0
         context_lower = task_context.lower()
+        return self._score_features(rule.features, context_lower, char_bigrams(context_lower))
+
+    @staticmethod
+    def _score_features(
+        features: RuleFeatures,
+        context_lower: str,
+        ctx_bigrams: frozenset[str],
+    ) -> float:
+        """用预计算特征打分；上下文的小写形式与 bigram 由调用方每条消息计算一次。"""
+        score = 0.0
 
         # 关键词双向子串匹配
-        for kw in rule.keywords:
-            kw_lower = kw.lower()
+        for kw_lower in features.keywords_lower:
             if kw_lower in context_lower:
                 score += 2.0
             elif context_lower in kw_lower:
                 score += 1.5
 
         # 规则名称匹配
-        name_readable = rule.name.replace("_", " ").lower()
+        name_readable = features.name_readable
         if name_readable in context_lower or context_lower in name_readable:
             score += 1.0
 
         # 字符 bigram 重叠（适用于中文无空格文本）
-        rule_preview = rule.content[:300].lower()
-        ctx_bigrams = {context_lower[i:i+2] for i in range(len(context_lower) - 1)}
-        rule_bigrams = {rule_preview[i:i+2] for i in range(len(rule_preview) - 1)}
-        overlap = len(ctx_bigrams & rule_bigrams)
+        overlap = len(ctx_bigrams & features.bigrams)
         if overlap > 0:
             score += min(overlap * 0.3, 3.0)
 
         # 基础分
-        score += 0.01
+        score += _BASE_SCORE
 
         return score
 
@@ -226,20 +379,14 @@ class RulesInterpreter:
              "experience_prompt": str,
              "constitution_tokens": int,
              "experience_tokens": int,
-             "rules_used": list[str]}
+             "rules_used": list[str],
+             "constitution_hash": str}
         """
-        # 宪法级：全部注入（受预算限制）
+        # 宪法级：全部注入（受预算限制），渲染结果按内容哈希缓存
         constitution_rules = self.get_constitution_rules()
-        constitution_parts = []
-        constitution_tokens = 0
-        if constitution_budget > 0:
-            for rule in constitution_rules:
-                est = rule.token_estimate()
-                if constitution_tokens + est > constitution_budget:
-                    logger.warning(f"Constitution budget exceeded, skipping {rule.name}")
-                    break
-                constitution_parts.append(f"### {rule.name}\n\n{rule.content}")
-                constitution_tokens += est
+        constitution_prompt, constitution_tokens, constitution_count = self.render_constitution(
+            constitution_budget
+        )
 
         # 经验级：按相关性过滤
         experience_rules = self.get_experience_rules(task_context, max_tokens=experience_budget)
@@ -249,15 +396,11 @@ class RulesInterpreter:
             experience_parts.append(f"### {rule.name}\n\n{rule.content}")
             experience_tokens += rule.token_estimate()
 
-        constitution_prompt = ""
-        if constitution_parts:
-            constitution_prompt = "## 核心规则\n\n" + "\n\n".join(constitution_parts)
-
         experience_prompt = ""
         if experience_parts:
             experience_prompt = "## 经验指导\n\n" + "\n\n".join(experience_parts)
 
-        rules_used = [r.name for r in constitution_rules[:len(constitution_parts)]] + \
+        rules_used = [r.name for r in constitution_rules[:constitution_count]] + \
                      [r.name for r in experience_rules]
 
         return {
@@ -266,8 +409,52 @@ class RulesInterpreter:
             "constitution_tokens": constitution_tokens,
             "experience_tokens": experience_tokens,
             "rules_used": rules_used,
+            "constitution_hash": self.constitution_hash,
         }
 
+    @property
+    def constitution_hash(self) -> str:
+        """宪法规则内容哈希（文件名 + 内容，按加载顺序）；哈希不变则渲染出的宪法块逐字节相同。"""
+        if not self._loaded:
+            self.load_rules()
+        if self._constitution_hash is None:
+            digest = hashlib.sha256()
+            for rule in self._constitution:
+                for part in (rule.name, rule.content):
+                    data = part.encode("utf-8")
+                    digest.update(len(data).to_bytes(8, "big"))
+                    digest.update(data)
+            self._constitution_hash = digest.hexdigest()[:16]
+        return self._constitution_hash
+
+    def render_constitution(self, budget: int = 3000) -> tuple[str, int, int]:
+        """渲染宪法规则块。
+
+        Returns:
+            (prompt, token 估算, 注入的规则条数)；同一哈希与预算下返回缓存的同一字符串
+        """
+        key = (self.constitution_hash, budget)
+        cached = self._constitution_blocks.get(key)
+        if cached is not None:
+            return cached
+
+        parts = []
+        tokens = 0
+        if budget > 0:
+            for rule in self._constitution:
+                est = rule.token_estimate()
+                if tokens + est > budget:
+                    logger.warning(f"Constitution budget exceeded, skipping {rule.name}")
+                    break
+                parts.append(f"### {rule.name}\n\n{rule.content}")
+                tokens += est
+        prompt = "## 核心规则\n\n" + "\n\n".join(parts) if parts else ""
+
+        if len(self._constitution_blocks) >= 8:
+            self._constitution_blocks.clear()
+        block = self._constitution_blocks[key] = (prompt, tokens, len(parts))
+        return block
+
     def get_rule_by_name(self, name: str) -> Rule | None:
         """按名称查找规则。"""
         if not self._loaded:
@@ -281,3 +468,61 @@ class RulesInterpreter:
         """重新加载所有规则（规则文件被修改后调用）。"""
         self._loaded = False
         return self.load_rules()
+
+    def refresh(self) -> list[str]:
+        """应用监听到的规则文件变化（未开启 watch 时只确保已加载）。
+
+        Returns:
+            本次重新解析或移除的规则名
+        """
+        if not self._loaded:
+            self.load_rules()
+            return []
+        if self._watcher is None:
+            return []
+        changed = self._watcher.poll()
+        if changed is None:
+            logger.warning("Rule watcher lost events, reloading all rules")
+            self.reload()
+            return []
+        if not changed:
+            return []
+        return self.apply_changes(changed)
+
+    def apply_changes(self, paths) -> list[str]:
+        """只重新解析给定的规则文件，并整体替换规则列表与经验索引。
+
+        文件不存在或内容为空时移除对应规则；不在 constitution/ 或 experience/ 下的路径忽略。
+
+        Returns:
+            重新解析或移除的规则名
+        """
+        levels = {
+            "constitution": {r.file_path: r for r in self._constitution},
+            "experience": {r.file_path: r for r in self._experience},
+        }
+        touched = []
+        for path in paths:
+            path = Path(path)
+            level = path.parent.name
+            if level not in levels or path.parent.parent != self.rules_dir or path.suffix != ".md":
+                continue
+            rules = levels[level]
+            rules.pop(str(path), None)
+            rule = parse_rule_file(path) if path.exists() else None
+            if rule and rule.content:
+                rule.features  # 预计算匹配特征
+                rules[str(path)] = rule
+            touched.append(path.stem)
+
+        if not touched:
+            return []
+        constitution = [levels["constitution"][k] for k in sorted(levels["constitution"])]
+        experience = [levels["experience"][k] for k in sorted(levels["experience"])]
+        index = RuleIndex(experience) if experience != self._experience else self._experience_index
+        # 新对象构建完成后一次性替换
+        self._constitution, self._experience, self._experience_index = constitution, experience, index
+        self._score_cache.clear()
+        self._constitution_hash = None
+        logger.info("Rules updated: %s", ", ".join(sorted(touched)))
+        return touched
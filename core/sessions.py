@@ -0,0 +1,161 @@
+"""会话状态管理 — 按 (channel, user_id) 隔离对话历史、任务计数与压缩状态。
+
+SessionManager 在内存中保留最近活跃的 max_active 个会话（LRU）。超出时把最久未用的
+空闲会话写入 ``workspace/sessions/<key 哈希>.json`` 并从内存移除；再次收到该会话的消息时
+从文件懒加载。进程退出前调用 flush() 持久化所有内存中的会话。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from core.context import ConversationHistory
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNEL = "default"
+DEFAULT_USER = "default"
+
+
+class Session:
+    """单个会话的对话状态。"""
+
+    def __init__(self, channel: str, user_id: str):
+        self.channel = channel
+        self.user_id = user_id
+        self.history = ConversationHistory()
+        self.task_counter = 0
+        # 压缩状态：次数、最近一次时间与前后 token 数
+        self.compaction: dict = {"count": 0, "last_at": None, "last_tokens": None}
+        self.last_active = time.time()
+        # 同一会话的消息串行处理；in_use > 0（处理中或排队中）的会话不会被换出
+        self.lock = asyncio.Lock()
+        self.in_use = 0
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return self.channel, self.user_id
+
+    @property
+    def is_default(self) -> bool:
+        return self.key == (DEFAULT_CHANNEL, DEFAULT_USER)
+
+    @property
+    def slug(self) -> str:
+        """会话键的短哈希，用于文件名和任务 ID。"""
+        return hashlib.sha256(f"{self.channel}\0{self.user_id}".encode("utf-8")).hexdigest()[:12]
+
+    def next_task_id(self) -> str:
+        """分配任务 ID；默认会话保持 task_0001 格式，其它会话带会话前缀避免冲突。"""
+        self.task_counter += 1
+        if self.is_default:
+            return f"task_{self.task_counter:04d}"
+        return f"task_{self.slug}_{self.task_counter:04d}"
+
+    def to_dict(self) -> dict:
+        return {
+            "channel": self.channel,
+            "user_id": self.user_id,
+            "history": list(self.history),
+            "task_counter": self.task_counter,
+            "compaction": self.compaction,
+            "last_active": self.last_active,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Session:
+        session = cls(str(data["channel"]), str(data["user_id"]))
+        session.history = ConversationHistory(data.get("history") or [])
+        session.task_counter = int(data.get("task_counter", 0))
+        session.compaction.update(data.get("compaction") or {})
+        session.last_active = float(data.get("last_active", session.last_active))
+        return session
+
+
+class SessionManager:
+    """内存 LRU + 磁盘换出的会话表。"""
+
+    def __init__(self, store_dir: str | Path, *, max_active: int = 64):
+        """
+        Args:
+            store_dir: 换出会话的存放目录（workspace/sessions/）
+            max_active: 内存中最多保留的会话数
+        """
+        self.store_dir = Path(store_dir)
+        self.max_active = max(1, max_active)
+        self._sessions: OrderedDict[tuple[str, str], Session] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        return key in self._sessions
+
+    def get(self, channel: str = DEFAULT_CHANNEL, user_id: str = DEFAULT_USER) -> Session:
+        """返回会话（必要时从磁盘加载或新建），并标记为最近使用。"""
+        key = (str(channel), str(user_id))
+        session = self._sessions.get(key)
+        if session is None:
+            session = self._load(key) or Session(*key)
+            self._sessions[key] = session
+            self._evict()
+        else:
+            self._sessions.move_to_end(key)
+        session.last_active = time.time()
+        return session
+
+    def _path(self, session: Session) -> Path:
+        return self.store_dir / f"{session.slug}.json"
+
+    def _load(self, key: tuple[str, str]) -> Session | None:
+        path = self._path(Session(*key))
+        if not path.exists():
+            return None
+        try:
+            session = Session.from_dict(json.loads(path.read_text(encoding="utf-8")))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Failed to load session %s: %s", path, e)
+            return None
+        logger.debug("Session rehydrated: %s/%s", *key)
+        return session
+
+    def save(self, session: Session) -> None:
+        """把会话写入磁盘（原子替换）。"""
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(session)
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(session.to_dict(), ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def _evict(self) -> None:
+        """超出上限时换出最久未用的空闲会话（处理中的会话跳过）。"""
+        if len(self._sessions) <= self.max_active:
+            return
+        # 最新加入的会话正在被调用方使用，不参与换出
+        for key, session in list(self._sessions.items())[:-1]:
+            if len(self._sessions) <= self.max_active:
+                break
+            if session.in_use:
+                continue
+            try:
+                self.save(session)
+            except OSError as e:
+                logger.error("Failed to persist session %s/%s: %s", *key, e)
+                continue
+            del self._sessions[key]
+            logger.debug("Session evicted: %s/%s", *key)
+
+    def flush(self) -> None:
+        """持久化所有内存中的会话（关闭前调用）。"""
+        for key, session in self._sessions.items():
+            try:
+                self.save(session)
+            except OSError as e:
+                logger.error("Failed to persist session %s/%s: %s", *key, e)
@@ -0,0 +1,312 @@
+"""持久化的任务后处理队列 — 追加写 spool 文件 + 固定数量的 worker。
+
+每条任务轨迹入队时先追加一条 ``{"op": "put", "id", "item"}`` 到 spool（JSONL），
+处理完成后追加 ``{"op": "done", "id"}``。启动时重放 spool：有 put 没有 done 的条目
+重新入队，并把 spool 重写为只含未完成条目。
+
+- 并发：workers 个协程消费队列；
+- 背压：内存中待处理条目达到 max_pending 时 submit() 等待 worker 释放空位；
+  submit_nowait() 不等待，已满时条目只写入 spool（延后），worker 空闲时从 spool 补充；
+- 停止：stop() 先等待队列清空（最多 timeout 秒），再取消 worker，未完成的条目留在 spool 中，
+  下次启动时重放。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], Awaitable[Any]]
+
+# 已完成记录超过该数量时重写 spool
+_COMPACT_AFTER = 1000
+
+
+class PersistentTaskQueue:
+    """spool 持久化、有界、多 worker 的异步任务队列。"""
+
+    def __init__(
+        self,
+        spool_path: str | Path,
+        handler: Handler,
+        *,
+        workers: int = 2,
+        max_pending: int = 1000,
+    ):
+        """
+        Args:
+            spool_path: spool 文件路径（JSONL，父目录自动创建）
+            handler: 处理单个条目的协程函数；抛出的异常记录日志后视为完成
+            workers: 并发 worker 数
+            max_pending: 内存中待处理条目上限，达到时 submit() 等待、submit_nowait() 延后
+        """
+        self.spool_path = Path(spool_path)
+        self._handler = handler
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._queue: asyncio.Queue | None = None
+        self._space: asyncio.Condition | None = None
+        self._worker_tasks: list[asyncio.Task] = []
+        self._done_records = 0
+        # 已入内存队列或处理中的条目（压缩 spool 时保留）
+        self._active: dict[str, dict] = {}
+        # 只在 spool 中、尚未进入内存队列的条目：(ID, put 记录在 spool 中的字节偏移)
+        self._deferred: deque[tuple[str, int]] = deque()
+        # 指标
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.replayed = 0
+        self.blocked_submits = 0
+        self.blocked_seconds = 0.0
+        self.high_watermark = 0
+
+    # ──────────────────────────────────────
+    #  生命周期
+    # ──────────────────────────────────────
+
+    @property
+    def deferred(self) -> int:
+        """只在 spool 中、等待补充进内存队列的条目数。"""
+        return len(self._deferred)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._worker_tasks)
+
+    def start(self) -> None:
+        """重放 spool 中未完成的条目并启动 worker（需在事件循环中调用；重复调用无效）。"""
+        if self.running:
+            return
+        # 重放条目不受 max_pending 约束，避免启动时丢失
+        self._queue = asyncio.Queue()
+        self._space = asyncio.Condition()
+        self._active.clear()
+        self._deferred.clear()
+        pending = self._load_spool()
+        self._rewrite_spool(pending)
+        for item_id, item in pending:
+            self._enqueue(item_id, item)
+        self.replayed += len(pending)
+        if pending:
+            logger.info("Replaying %d unfinished post-task items", len(pending))
+        self.high_watermark = max(self.high_watermark, self._queue.qsize())
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(), name=f"post-task-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self, timeout: float | None = 30.0) -> bool:
+        """等待队列处理完（最多 timeout 秒）后停止 worker。全部完成返回 True。"""
+        if not self.running:
+            return True
+        drained = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            drained = False
+            logger.warning(
+                "Post-task queue stopped with %d items unfinished; they will be replayed on restart",
+                self.pending,
+            )
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        if drained:
+            self._compact()
+        self._active.clear()
+        return drained
+
+    # ──────────────────────────────────────
+    #  入队与处理
+    # ──────────────────────────────────────
+
+    async def submit(self, item: dict) -> str:
+        """持久化并入队一个条目，返回条目 ID；队列满时等待 worker 释放空位（背压）。"""
+        self.start()
+        async with self._space:
+            if not self._has_space():
+                self.blocked_submits += 1
+                started = time.monotonic()
+                await self._space.wait_for(self._has_space)
+                self.blocked_seconds += time.monotonic() - started
+            # 检查与入队之间没有 await，被同一空位唤醒的其它 submit 会重新等待
+            item_id = uuid.uuid4().hex
+            self._append({"op": "put", "id": item_id, "item": item})
+            self._enqueue(item_id, item)
+        return item_id
+
+    def submit_nowait(self, item: dict) -> str:
+        """持久化一个条目并立即返回 ID，不等待空位。
+
+        队列已满时条目只写入 spool（延后），worker 清空内存队列后从 spool 补充，
+        进程退出前未处理的条目在下次启动时重放。
+        """
+        self.start()
+        item_id = uuid.uuid4().hex
+        offset = self._append({"op": "put", "id": item_id, "item": item})
+        if self._has_space() and not self._deferred:
+            self._enqueue(item_id, item)
+        else:
+            self._deferred.append((item_id, offset))
+        return item_id
+
+    def _has_space(self) -> bool:
+        return self.pending < self.max_pending
+
+    def _enqueue(self, item_id: str, item: dict) -> None:
+        self._active[item_id] = item
+        self._queue.put_nowait((item_id, item))
+        self.high_watermark = max(self.high_watermark, self.pending)
+
+    async def join(self) -> None:
+        """等待当前所有条目处理完。"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def _worker(self) -> None:
+        while True:
+            item_id, item = await self._queue.get()
+            self.in_flight += 1
+            try:
+                await self._handler(item)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error("Post-task item %s failed: %s", item_id, e, exc_info=True)
+            finally:
+                self.in_flight -= 1
+            # 取消发生在处理中途时不写 done，下次启动重放
+            self._active.pop(item_id, None)
+            self._mark_done(item_id)
+            if self._deferred and self._queue.empty():
+                self._refill()
+            self._queue.task_done()
+            async with self._space:
+                self._space.notify()
+
+    def _refill(self) -> None:
+        """按偏移从 spool 读回延后的条目补充进内存队列（不超过 max_pending）。"""
+        while self._deferred and self._has_space():
+            item_id, offset = self._deferred.popleft()
+            item = self._read_put(item_id, offset)
+            if item is None:
+                logger.error("Deferred post-task item %s missing from spool, dropped", item_id)
+                continue
+            self._enqueue(item_id, item)
+
+    # ──────────────────────────────────────
+    #  指标
+    # ──────────────────────────────────────
+
+    @property
+    def pending(self) -> int:
+        """排队中与处理中的条目数。"""
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return queued + self.in_flight
+
+    def stats(self) -> dict[str, Any]:
+        """队列深度与背压指标。"""
+        return {
+            "pending": self.pending,
+            "in_flight": self.in_flight,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "high_watermark": self.high_watermark,
+            "deferred": self.deferred,
+            "processed": self.processed,
+            "failed": self.failed,
+            "replayed": self.replayed,
+            "blocked_submits": self.blocked_submits,
+            "blocked_seconds": round(self.blocked_seconds, 3),
+        }
+
+    # ──────────────────────────────────────
+    #  spool 文件
+    # ──────────────────────────────────────
+
+    def _append(self, record: dict) -> int:
+        """追加一条记录，返回其在 spool 中的字节偏移。"""
+        self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.spool_path, "ab") as f:
+            offset = f.tell()
+            f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        return offset
+
+    def _read_put(self, item_id: str, offset: int) -> dict | None:
+        """读取 offset 处的 put 记录；ID 不符或损坏时返回 None。"""
+        try:
+            with open(self.spool_path, "rb") as f:
+                f.seek(offset)
+                record = json.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+        if record.get("op") != "put" or record.get("id") != item_id:
+            return None
+        return record.get("item") or {}
+
+    def _mark_done(self, item_id: str) -> None:
+        try:
+            self._append({"op": "done", "id": item_id})
+        except OSError as e:
+            logger.error("Failed to record post-task completion: %s", e)
+            return
+        self._done_records += 1
+        if self._done_records >= _COMPACT_AFTER:
+            self._compact()
+
+    def _compact(self) -> None:
+        """把 spool 重写为只含仍未完成的条目（内存中的条目在前，延后条目在后）。"""
+        pending = list(self._active.items())
+        deferred_ids = []
+        for item_id, offset in self._deferred:
+            item = self._read_put(item_id, offset)
+            if item is None:
+                logger.error("Deferred post-task item %s missing from spool, dropped", item_id)
+                continue
+            pending.append((item_id, item))
+            deferred_ids.append(item_id)
+        offsets = self._rewrite_spool(pending)
+        self._deferred = deque(zip(deferred_ids, offsets[len(self._active):]))
+
+    def _load_spool(self) -> list[tuple[str, dict]]:
+        """读取 spool，返回按入队顺序排列的未完成条目；损坏的行跳过。"""
+        if not self.spool_path.exists():
+            return []
+        pending: dict[str, dict] = {}
+        with open(self.spool_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("op") == "put" and "id" in record:
+                    pending[record["id"]] = record.get("item") or {}
+                elif record.get("op") == "done":
+                    pending.pop(record.get("id"), None)
+        return list(pending.items())
+
+    def _rewrite_spool(self, pending: list[tuple[str, dict]]) -> list[int]:
+        """把 spool 重写为只含给定未完成条目，返回各条 put 记录的字节偏移。"""
+        self._done_records = 0
+        if not pending and not self.spool_path.exists():
+            return []
+        self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.spool_path.with_suffix(".tmp")
+        offsets = []
+        with open(tmp, "wb") as f:
+            for item_id, item in pending:
+                offsets.append(f.tell())
+                record = {"op": "put", "id": item_id, "item": item}
+                f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        tmp.replace(self.spool_path)
+        return offsets
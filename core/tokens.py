@@ -0,0 +1,113 @@
+"""统一 token 计数 — 近似 BPE 的本地估算 + LRU 缓存 + 按真实 usage 校准。
+
+估算规则模仿 BPE 分词的大致切分：
+- CJK / 假名 / 韩文字符：每字 1 token；
+- 拉丁字母词：每 4 个字符约 1 token（至少 1）；
+- 数字：每 3 位 1 token；
+- 其它标点符号：每个 1 token；空白并入相邻词，换行每段 1 token。
+
+原始估算按文本哈希缓存（LRU）。LLMClient 拿到 provider 返回的真实 input token 数后
+调用 calibrate()，用指数滑动平均维护「真实 / 估算」比例；count() 返回校准后的值。
+比例按 provider 分别记录，只有参考 provider（对话主模型）的比例参与换算，
+因为 TokenBudget 与压缩阈值都是按主模型窗口设定的。
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from collections import OrderedDict
+
+_PIECE_RE = re.compile(
+    r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]"  # CJK 单字
+    r"|[A-Za-z]+"
+    r"|\d+"
+    r"|\n+"
+    r"|[^\sA-Za-z\d]"
+)
+
+# 校准比例的上下限与滑动平均权重
+_MIN_RATIO = 0.5
+_MAX_RATIO = 2.0
+_EMA_WEIGHT = 0.2
+
+
+def _raw_estimate(text: str) -> int:
+    tokens = 0
+    for piece in _PIECE_RE.findall(text):
+        first = piece[0]
+        if first.isascii() and first.isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        elif first.isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        else:
+            tokens += 1
+    return tokens
+
+
+class TokenCounter:
+    """带缓存与校准的 token 计数器。"""
+
+    def __init__(self, *, cache_size: int = 4096, reference_provider: str = "opus"):
+        """
+        Args:
+            cache_size: 缓存的文本条数上限
+            reference_provider: 其校准比例用于 count() 的 provider 名
+        """
+        self.cache_size = cache_size
+        self.reference_provider = reference_provider
+        self.ratios: dict[str, float] = {}
+        self._cache: OrderedDict[tuple[int, int], int] = OrderedDict()
+
+    @property
+    def ratio(self) -> float:
+        """当前生效的校准比例（未校准时为 1.0）。"""
+        return self.ratios.get(self.reference_provider, 1.0)
+
+    def estimate(self, text: str) -> int:
+        """未校准的本地估算（带 LRU 缓存）。"""
+        if not text:
+            return 0
+        key = (hash(text), len(text))
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
+        tokens = _raw_estimate(text)
+        self._cache[key] = tokens
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return tokens
+
+    def count(self, text: str) -> int:
+        """校准后的 token 数；非空文本至少为 1。"""
+        raw = self.estimate(text)
+        if raw == 0:
+            return 0
+        return max(1, round(raw * self.ratio))
+
+    def calibrate(self, estimated: int, actual: int, provider: str | None = None) -> None:
+        """用一次调用的真实 input token 数更新比例。
+
+        Args:
+            estimated: 同一请求的 estimate() 结果之和（未校准）
+            actual: provider 返回的 input token 总数（含 cache 读写）
+            provider: provider 名，默认为参考 provider
+        """
+        if estimated <= 0 or actual <= 0:
+            return
+        provider = provider or self.reference_provider
+        sample = min(_MAX_RATIO, max(_MIN_RATIO, actual / estimated))
+        previous = self.ratios.get(provider)
+        if previous is None:
+            self.ratios[provider] = sample
+        else:
+            self.ratios[provider] = previous + _EMA_WEIGHT * (sample - previous)
+
+
+default_counter = TokenCounter()
+
+
+def count_tokens(text: str) -> int:
+    """用进程级默认计数器计算 token 数。"""
+    return default_counter.count(text)
@@ -8,6 +8,7 @@ from datetime import datetime
 from pathlib import Path
 
 from core.llm_client import BaseLLMClient
+from core.tokens import count_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -57,15 +58,24 @@ class CompactionEngine:
             return False
         return (current_tokens / budget) >= 0.85
 
-    async def compact(self, conversation_history: list[dict], keep_recent: int = 5) -> dict:
+    async def compact(
+        self,
+        conversation_history: list[dict],
+        keep_recent: int = 5,
+        *,
+        original_tokens: int | None = None,
+    ) -> dict:
         """
         Compact conversation history and preserve recent rounds.
 
         Args:
             conversation_history: full message history.
             keep_recent: keep last N rounds (1 round = user + assistant).
+            original_tokens: token count of the history if the caller already
+                tracks it; estimated from the messages otherwise.
         """
-        original_tokens = self._estimate_messages_tokens(conversation_history)
+        if original_tokens is None:
+            original_tokens = self._estimate_messages_tokens(conversation_history)
         keep_recent = max(keep_recent, 0)
         keep_count = keep_recent * 2
 
@@ -147,6 +157,7 @@ class CompactionEngine:
                 user_message=user_message,
                 model="gemini-flash",
                 max_tokens=800,
+                cache=True,
             )
             extracted = self._parse_json_array(raw)
         except Exception as exc:  # pragma: no cover - defensive logging
@@ -229,6 +240,7 @@ class CompactionEngine:
                 user_message=text,
                 model="gemini-flash",
                 max_tokens=1200,
+                cache=True,
             )
             summary = (raw or "").strip()
             if summary:
@@ -250,21 +262,8 @@ class CompactionEngine:
 
     @staticmethod
     def _estimate_messages_tokens(messages: list[dict]) -> int:
-        """Estimate tokens from message contents using a lightweight heuristic."""
-        total_chars = 0
-        non_ascii_chars = 0
-        for msg in messages:
-            text = str(msg.get("content", "") or "")
-            total_chars += len(text)
-            non_ascii_chars += sum(1 for ch in text if ord(ch) > 127)
-
-        if total_chars == 0:
-            return 0
-
-        # Heuristic: mostly ASCII -> /4, mixed/CJK -> /2
-        if non_ascii_chars / total_chars > 0.2:
-            return max(1, total_chars // 2)
-        return max(1, total_chars // 4)
+        """Estimate tokens of message contents with the shared token counter."""
+        return sum(count_tokens(str(msg.get("content", "") or "")) for msg in messages)
 
     @staticmethod
     def _parse_json_array(raw: str) -> list[dict]:
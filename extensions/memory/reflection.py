@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 from datetime import datetime
@@ -20,6 +21,14 @@ _VALID_ROOT_CAUSES = {
     "knowledge_gap",
 }
 
+_CLASSIFICATION_RULES = """分类规则：
+- ERROR: 有正确答案但做错了（错误假设、遗漏关键考虑、工具误用、知识不足）
+- PREFERENCE: 没有标准答案，只是不符合用户习惯（回复太长、格式不合口味、语气偏差）
+- NONE: 无异常
+
+如果是 ERROR，必须填写 root_cause。
+如果是 PREFERENCE 或 NONE，root_cause 填 null。"""
+
 _SYSTEM_PROMPT = """你是一个反思引擎。分析以下任务执行轨迹，提取教训。
 
 请严格按以下 JSON 格式输出（不要添加任何其他文字）：
@@ -31,13 +40,28 @@ _SYSTEM_PROMPT = """你是一个反思引擎。分析以下任务执行轨迹，
   "reusable_experience": "可复用的经验，或 null"
 }
 
-分类规则：
-- ERROR: 有正确答案但做错了（错误假设、遗漏关键考虑、工具误用、知识不足）
-- PREFERENCE: 没有标准答案，只是不符合用户习惯（回复太长、格式不合口味、语气偏差）
-- NONE: 无异常
+""" + _CLASSIFICATION_RULES
 
-如果是 ERROR，必须填写 root_cause。
-如果是 PREFERENCE 或 NONE，root_cause 填 null。"""
+_BATCH_SYSTEM_PROMPT = """你是一个反思引擎，同时兼任 Observer 的轻量模式。下面有多条任务执行轨迹，请逐条分析。
+
+请严格输出一个 JSON 数组（不要添加任何其他文字），每条任务一个对象：
+[
+  {
+    "task_id": "与输入一致的任务ID",
+    "type": "ERROR 或 PREFERENCE 或 NONE",
+    "outcome": "SUCCESS 或 PARTIAL 或 FAILURE",
+    "lesson": "一句话总结教训",
+    "root_cause": "wrong_assumption 或 missed_consideration 或 tool_misuse 或 knowledge_gap 或 null",
+    "reusable_experience": "可复用的经验，或 null",
+    "note": "一行观察笔记（不超过 100 字）：异常、模式、值得注意的点；完全正常则为 \"正常完成\""
+  }
+]
+
+""" + _CLASSIFICATION_RULES
+
+# Per-task output budget for batched reflection.
+_BATCH_TOKENS_PER_TASK = 250
+_BATCH_MAX_TOKENS = 4000
 
 
 class ReflectionEngine:
@@ -68,22 +92,7 @@ class ReflectionEngine:
         The method always returns a valid dict and never raises.
         """
         task_id = str(task_trace.get("task_id", "unknown_task"))
-        user_message = str(task_trace.get("user_message", "") or "")
-        system_response = str(task_trace.get("system_response", "") or "")
-        user_feedback = task_trace.get("user_feedback")
-        tools_used = task_trace.get("tools_used", [])
-        tokens_used = task_trace.get("tokens_used", 0)
-        duration_ms = task_trace.get("duration_ms", 0)
-
-        user_prompt = (
-            f"任务ID: {task_id}\n"
-            f"用户消息: {user_message}\n"
-            f"系统回复: {system_response[:500]}\n"
-            f"用户反馈: {user_feedback if user_feedback is not None else '无'}\n"
-            f"使用工具: {tools_used}\n"
-            f"消耗 token: {tokens_used}\n"
-            f"耗时: {duration_ms}ms"
-        )
+        user_prompt = self._format_trace(task_trace)
 
         fallback = self._fallback_result(task_id)
 
@@ -93,6 +102,7 @@ class ReflectionEngine:
                 user_message=user_prompt,
                 model="gemini-flash",
                 max_tokens=500,
+                priority="background",
             )
         except Exception as exc:  # pragma: no cover - defensive logging
             logger.error("Reflection LLM call failed: %s", exc)
@@ -109,6 +119,54 @@ class ReflectionEngine:
         self.write_reflection(result)
         return result
 
+    async def reflect_batch(self, task_traces: list[dict]) -> list[tuple[dict, str | None]]:
+        """
+        Reflect on several task traces with a single LLM call.
+
+        The model returns one JSON object per task, keyed by ``task_id``, holding
+        the reflection fields plus a one-line observation ``note``. Reflections
+        are persisted like :meth:`lightweight_reflect`. Tasks missing from the
+        reply fall back to an individual :meth:`lightweight_reflect` call and
+        get ``None`` as note.
+
+        Returns:
+            ``(reflection, note)`` pairs in input order. Never raises.
+        """
+        if not task_traces:
+            return []
+        user_prompt = "\n\n".join(
+            f"### 任务 {i}\n{self._format_trace(trace)}" for i, trace in enumerate(task_traces, 1)
+        )
+        max_tokens = min(_BATCH_MAX_TOKENS, _BATCH_TOKENS_PER_TASK * len(task_traces) + 200)
+
+        by_task_id: dict[str, dict] = {}
+        try:
+            llm_raw = await self.llm_client.complete(
+                system_prompt=_BATCH_SYSTEM_PROMPT,
+                user_message=user_prompt,
+                model="gemini-flash",
+                max_tokens=max_tokens,
+                priority="background",
+            )
+            for item in self._parse_llm_array(llm_raw) or []:
+                if isinstance(item, dict) and item.get("task_id") is not None:
+                    by_task_id[str(item["task_id"])] = item
+        except Exception as exc:  # pragma: no cover - defensive logging
+            logger.error("Batch reflection LLM call failed: %s", exc)
+
+        results: list[tuple[dict, str | None]] = []
+        for trace in task_traces:
+            task_id = str(trace.get("task_id", "unknown_task"))
+            item = by_task_id.get(task_id)
+            if item is None:
+                results.append((await self.lightweight_reflect(trace), None))
+                continue
+            reflection = self._normalize_result(task_id, item)
+            self.write_reflection(reflection)
+            note = str(item.get("note", "") or "").strip() or None
+            results.append((reflection, note))
+        return results
+
     def write_reflection(self, reflection: dict) -> None:
         """
         Persist reflection outputs by type.
@@ -161,6 +219,20 @@ class ReflectionEngine:
             except Exception as exc:  # pragma: no cover - defensive logging
                 logger.error("Failed to write error_patterns.md: %s", exc)
 
+    @staticmethod
+    def _format_trace(task_trace: dict) -> str:
+        """Render a task trace as the reflection prompt body."""
+        user_feedback = task_trace.get("user_feedback")
+        return (
+            f"任务ID: {task_trace.get('task_id', 'unknown_task')}\n"
+            f"用户消息: {task_trace.get('user_message', '') or ''}\n"
+            f"系统回复: {str(task_trace.get('system_response', '') or '')[:500]}\n"
+            f"用户反馈: {user_feedback if user_feedback is not None else '无'}\n"
+            f"使用工具: {task_trace.get('tools_used', [])}\n"
+            f"消耗 token: {task_trace.get('tokens_used', 0)}\n"
+            f"耗时: {task_trace.get('duration_ms', 0)}ms"
+        )
+
     @staticmethod
     def _fallback_result(task_id: str) -> dict:
         """Default reflection payload when LLM output is invalid."""
@@ -196,6 +268,22 @@ class ReflectionEngine:
             return None
         return data if isinstance(data, dict) else None
 
+    @staticmethod
+    def _parse_llm_array(text: str) -> list | None:
+        """Parse a JSON array response, tolerating surrounding text."""
+        if not text:
+            return None
+        stripped = text.strip()
+        start = stripped.find("[")
+        end = stripped.rfind("]")
+        if start == -1 or end == -1 or end <= start:
+            return None
+        try:
+            data = json.loads(stripped[start : end + 1])
+        except json.JSONDecodeError:
+            return None
+        return data if isinstance(data, list) else None
+
     @staticmethod
     def _normalize_result(task_id: str, parsed: dict) -> dict:
         """Normalize parsed LLM JSON to strict schema."""
@@ -228,3 +316,68 @@ class ReflectionEngine:
             "root_cause": root_cause,
             "reusable_experience": reusable_experience,
         }
+
+
+class ReflectionBatcher:
+    """
+    Coalesce concurrent reflection requests into batched LLM calls.
+
+    Traces submitted while a batch is open are collected until ``max_items``
+    are pending or ``max_wait_ms`` has passed since the first one, then
+    reflected together via :meth:`ReflectionEngine.reflect_batch`. Each caller
+    gets its own ``(reflection, note)`` back.
+    """
+
+    def __init__(self, engine: ReflectionEngine, *, max_items: int = 8, max_wait_ms: int = 2000):
+        """
+        Args:
+            engine: reflection engine used for the batched call.
+            max_items: flush as soon as this many traces are pending.
+            max_wait_ms: flush at most this long after the first pending trace.
+        """
+        self.engine = engine
+        self.max_items = max(1, max_items)
+        self.max_wait = max(0, max_wait_ms) / 1000
+        self._pending: list[tuple[dict, asyncio.Future]] = []
+        self._timer: asyncio.Task | None = None
+        self._flushes: set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+
+    async def reflect(self, task_trace: dict) -> tuple[dict, str | None]:
+        """Queue one trace and wait for its share of the next batch."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((task_trace, future))
+        if len(self._pending) >= self.max_items:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            task = asyncio.create_task(self._flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.max_wait)
+        self._timer = None
+        await self._flush()
+
+    async def _flush(self) -> None:
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await self.engine.reflect_batch([trace for trace, _ in batch])
+        except Exception as exc:  # pragma: no cover - reflect_batch never raises
+            logger.error("Batch reflection failed: %s", exc)
+            results = [
+                (self.engine._fallback_result(str(trace.get("task_id", "unknown_task"))), None)
+                for trace, _ in batch
+            ]
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,318 @@
+"""Retention/compaction for append-only memory files.
+
+Several memory files only ever grow: ``preferences.md`` and the error pattern
+views are appended to by ``MemoryStore`` and ``ReflectionEngine``, and the
+JSONL logs (reflections, error log, compaction flush) by the reflection and
+compaction engines. ``RetentionEngine.run()`` bounds them:
+
+1. dedupe near-identical entries (normalized text, character-bigram Jaccard),
+   keeping the newest occurrence;
+2. roll dated entries older than ``max_age_days`` into monthly archives under
+   ``memory/archive/<relative path without suffix>/YYYY-MM.<ext>``, indexed by a ``SUMMARY.md`` that
+   rolls each month up into its distinct lessons (one line each, with counts);
+3. archive the oldest remaining dated entries until the file fits ``max_bytes``
+   (files with ``max_bytes=None`` are never archived for size).
+
+Headings and undated lines are never archived, only deduped.
+
+Files are rewritten atomically (tmp + ``os.replace``). ``run()`` is synchronous
+and never awaits, so inside the asyncio process no append can interleave
+between reading and replacing a file. Readers (``MemoryStore`` caches, the
+error shard store, the search index) detect the rewrite through mtime/size.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+_MD_DATE_RE = re.compile(r"^- \[?(\d{4}-\d{2}-\d{2})")
+# Date/timestamp prefix and bracketed tags such as ``[task_0001]``, ``(from x)``
+_NOISE_RE = re.compile(
+    r"^- \[?\d{4}-\d{2}-\d{2}(?:T[\d:.]+)?\]?|\[[^\]]*\]|\((?:from [^)]*|[a-z_]+|None)\)"
+)
+_PUNCT_RE = re.compile(r"[\s\W_]+")
+# JSONL fields tried, in order, for an archived entry's one-line gist
+_GIST_FIELDS = ("lesson", "content", "summary", "reusable_experience")
+_GIST_MAX_CHARS = 120
+
+
+@dataclass
+class RetentionPolicy:
+    """Retention settings for one file, path relative to the workspace."""
+
+    path: str
+    kind: str = "markdown"            # "markdown" (``- `` entry lines) | "jsonl"
+    max_age_days: int | None = None   # None: never archive by age
+    max_bytes: int | None = 64 * 1024  # None: never archive for size
+    dedupe: bool = True
+    dedupe_field: str = "content"     # jsonl only: field compared for duplicates
+
+
+DEFAULT_POLICIES = [
+    # Preferences stay valid until superseded and are read whole by
+    # get_user_preferences(), so they are only deduped, never archived.
+    RetentionPolicy("memory/user/preferences.md", max_bytes=None),
+    RetentionPolicy("memory/user/error_patterns.md", max_age_days=90, max_bytes=32 * 1024),
+    RetentionPolicy("rules/experience/error_patterns.md", max_age_days=90, max_bytes=32 * 1024),
+    RetentionPolicy("memory/user/reflections.jsonl", kind="jsonl", max_age_days=30,
+                    max_bytes=512 * 1024, dedupe=False),
+    RetentionPolicy("memory/user/error_log.jsonl", kind="jsonl", max_age_days=90,
+                    max_bytes=256 * 1024, dedupe_field="lesson"),
+    RetentionPolicy("memory/user/compaction_flush.jsonl", kind="jsonl", max_age_days=90,
+                    max_bytes=256 * 1024),
+]
+
+
+def normalize_entry(text: str) -> str:
+    """Strip dates, tags and punctuation so reworded timestamps do not defeat dedupe."""
+    return _PUNCT_RE.sub("", _NOISE_RE.sub("", text)).lower()
+
+
+def _bigrams(text: str) -> set[str]:
+    if len(text) < 2:
+        return {text}
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class _Entry:
+    __slots__ = ("raw", "date", "key", "grams")
+
+    def __init__(self, raw: str, date: str | None, key: str):
+        self.raw = raw
+        self.date = date
+        self.key = key
+        self.grams: set[str] | None = None
+
+
+class RetentionEngine:
+    """Dedupe, age out and size-bound append-only memory files."""
+
+    def __init__(
+        self,
+        workspace_path: str | Path,
+        *,
+        policies: list[RetentionPolicy] | None = None,
+        similarity: float = 0.9,
+        dedupe_window: int = 200,
+    ):
+        """
+        Args:
+            workspace_path: ``workspace/`` root.
+            policies: Per-file policies (defaults to ``DEFAULT_POLICIES``).
+            similarity: Bigram Jaccard threshold above which entries are duplicates.
+            dedupe_window: Number of most recent kept entries compared fuzzily
+                (exact normalized duplicates are always removed).
+        """
+        self.workspace = Path(workspace_path)
+        self.archive_dir = self.workspace / "memory" / "archive"
+        self.policies = list(DEFAULT_POLICIES if policies is None else policies)
+        self.similarity = similarity
+        self.dedupe_window = dedupe_window
+
+    def run(self, now: datetime | None = None) -> dict[str, dict]:
+        """Apply every policy once.
+
+        Returns:
+            ``{path: {"deduped": N, "archived": N, "bytes_before": N, "bytes_after": N}}``
+            for files that exist.
+        """
+        now = now or datetime.now()
+        report = {}
+        for policy in self.policies:
+            path = self.workspace / policy.path
+            if not path.exists():
+                continue
+            try:
+                report[policy.path] = self._apply(path, policy, now)
+            except Exception as exc:  # pragma: no cover - defensive logging
+                logger.error("Retention failed for %s: %s", policy.path, exc)
+        changed = {k: v for k, v in report.items() if v["deduped"] or v["archived"]}
+        if changed:
+            logger.info("Memory retention: %s", changed)
+        return report
+
+    # ──────────────────────────────────────
+    #  Per-file processing
+    # ──────────────────────────────────────
+
+    def _apply(self, path: Path, policy: RetentionPolicy, now: datetime) -> dict:
+        content = path.read_text(encoding="utf-8")
+        bytes_before = len(content.encode("utf-8"))
+        items = self._parse(content, policy)
+        entries = [item for item in items if isinstance(item, _Entry)]
+
+        dropped: set[int] = set()
+        deduped = 0
+        if policy.dedupe:
+            kept = {id(e) for e in self._dedupe(entries)}
+            duplicates = {id(e) for e in entries if id(e) not in kept}
+            deduped = len(duplicates)
+            dropped |= duplicates
+
+        # Only dated entries are aged out or archived for size; undated lines
+        # (headings, hand-written notes) always stay.
+        dated = [e for e in entries if e.date is not None and id(e) not in dropped]
+        archived: list[_Entry] = []
+        if policy.max_age_days is not None:
+            cutoff = (now - timedelta(days=policy.max_age_days)).strftime("%Y-%m-%d")
+            archived = [e for e in dated if e.date < cutoff]
+
+        # Size budget: archive the oldest remaining dated entries until the file fits.
+        size = bytes_before - sum(
+            len(e.raw.encode("utf-8")) + 1 for e in entries if id(e) in dropped
+        ) - sum(len(e.raw.encode("utf-8")) + 1 for e in archived)
+        aged = {id(e) for e in archived}
+        remaining = sorted((e for e in dated if id(e) not in aged), key=lambda e: e.date)
+        for entry in remaining:
+            if policy.max_bytes is None or size <= policy.max_bytes:
+                break
+            archived.append(entry)
+            size -= len(entry.raw.encode("utf-8")) + 1
+        dropped |= {id(e) for e in archived}
+
+        if not dropped:
+            return {"deduped": 0, "archived": 0, "bytes_before": bytes_before,
+                    "bytes_after": bytes_before}
+
+        self._archive(path, policy, archived, now)
+        rendered = "".join(
+            (item.raw if isinstance(item, _Entry) else item) + "\n"
+            for item in items
+            if not (isinstance(item, _Entry) and id(item) in dropped)
+        )
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(rendered, encoding="utf-8")
+        os.replace(tmp, path)
+        return {
+            "deduped": deduped,
+            "archived": len(archived),
+            "bytes_before": bytes_before,
+            "bytes_after": len(rendered.encode("utf-8")),
+        }
+
+    @staticmethod
+    def _parse(content: str, policy: RetentionPolicy) -> list[str | _Entry]:
+        """Split a file into lines, with entry lines wrapped as ``_Entry``.
+
+        Other lines (headings, notes, unparseable JSONL) are kept verbatim and in place.
+        """
+        items: list[str | _Entry] = []
+        for line in content.splitlines():
+            if policy.kind == "jsonl":
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    record = None
+                if not isinstance(record, dict):
+                    items.append(line)
+                    continue
+                date = str(record.get("timestamp") or "")[:10] or None
+                key = normalize_entry(str(record.get(policy.dedupe_field) or line))
+                items.append(_Entry(line, date, key))
+            elif line.startswith("- "):
+                match = _MD_DATE_RE.match(line)
+                items.append(_Entry(line, match.group(1) if match else None, normalize_entry(line)))
+            else:
+                items.append(line)
+        return items
+
+    def _dedupe(self, entries: list[_Entry]) -> list[_Entry]:
+        """Drop near-identical entries, keeping the newest (last) occurrence."""
+        kept: list[_Entry] = []
+        exact: set[str] = set()
+        for entry in reversed(entries):
+            if not entry.key:
+                kept.append(entry)
+                continue
+            if entry.key in exact:
+                continue
+            entry.grams = _bigrams(entry.key)
+            duplicate = False
+            for other in kept[-self.dedupe_window:]:
+                if other.grams is None:
+                    continue
+                union = len(entry.grams | other.grams)
+                if union and len(entry.grams & other.grams) / union >= self.similarity:
+                    duplicate = True
+                    break
+            if duplicate:
+                continue
+            exact.add(entry.key)
+            kept.append(entry)
+        kept.reverse()
+        return kept
+
+    def _archive(self, path: Path, policy: RetentionPolicy, archived: list[_Entry], now: datetime) -> None:
+        """Append archived entries to monthly files and refresh their summary headers."""
+        if not archived:
+            return
+        # Keyed by the full relative path: two files with the same name (the
+        # memory/ and rules/ error_patterns.md) must not share an archive.
+        target_dir = self.archive_dir / Path(policy.path).with_suffix("")
+        target_dir.mkdir(parents=True, exist_ok=True)
+        ext = ".jsonl" if policy.kind == "jsonl" else ".md"
+
+        by_month: dict[str, list[_Entry]] = {}
+        for entry in archived:
+            month = entry.date[:7] if entry.date else now.strftime("%Y-%m")
+            by_month.setdefault(month, []).append(entry)
+
+        for month, entries in by_month.items():
+            target = target_dir / f"{month}{ext}"
+            with target.open("a", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(entry.raw + "\n")
+
+        self._write_summary(target_dir, policy.path)
+
+    @staticmethod
+    def _write_summary(target_dir: Path, source_path: str) -> None:
+        """Rewrite ``SUMMARY.md``: per archived month, its entry count and distinct gists."""
+        lines = [f"# Archive of {source_path}", ""]
+        for archive in sorted(target_dir.glob("????-??.*")):
+            gists: dict[str, list] = {}
+            count = 0
+            with archive.open("r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    count += 1
+                    gist = _gist(line.rstrip("\n"))
+                    key = normalize_entry(gist) or gist
+                    if key in gists:
+                        gists[key][1] += 1
+                    else:
+                        gists[key] = [gist, 1]
+            lines.append(f"## {archive.stem}: {count} entries ({archive.name})")
+            lines.append("")
+            for gist, n in gists.values():
+                lines.append(f"- {gist}" + (f" (×{n})" if n > 1 else ""))
+            lines.append("")
+        (target_dir / "SUMMARY.md").write_text("\n".join(lines), encoding="utf-8")
+
+
+def _gist(raw: str) -> str:
+    """One-line gist of an archived entry: the lesson/content field or the entry text."""
+    text = raw
+    if raw.lstrip().startswith("{"):
+        try:
+            record = json.loads(raw)
+        except json.JSONDecodeError:
+            record = None
+        if isinstance(record, dict):
+            text = next((str(record[k]) for k in _GIST_FIELDS if record.get(k)), raw)
+    lines = _NOISE_RE.sub("", text).strip(" -").splitlines()
+    text = (lines[0].strip() if lines else "") or raw.strip()
+    if len(text) > _GIST_MAX_CHARS:
+        text = text[:_GIST_MAX_CHARS - 1] + "…"
+    return text
@@ -87,13 +87,20 @@ class ObserverEngine:
         self.signals_path.parent.mkdir(parents=True, exist_ok=True)
         self.signals_path.touch(exist_ok=True)
 
-    async def lightweight_observe(self, task_trace: dict, reflection_output: dict | None = None) -> dict:
+    async def lightweight_observe(
+        self,
+        task_trace: dict,
+        reflection_output: dict | None = None,
+        *,
+        note: str | None = None,
+    ) -> dict:
         """
         Write one lightweight observation log after each task.
 
         Args:
             task_trace: task execution trace.
             reflection_output: optional reflection output.
+            note: precomputed one-line note (batched reflection); skips the LLM call.
 
         Returns:
             Lightweight observation payload:
@@ -130,18 +137,23 @@ class ObserverEngine:
             f"反思输出: {reflection_output if reflection_output is not None else '无'}"
         )
 
-        note = "正常完成"
-        try:
-            llm_note = await self.llm_client.complete(
-                system_prompt=_LIGHT_SYSTEM_PROMPT,
-                user_message=user_prompt,
-                model=self.light_model,
-                max_tokens=120,
-            )
-            if llm_note and llm_note.strip():
-                note = llm_note.strip().splitlines()[0][:100]
-        except Exception as exc:  # pragma: no cover - defensive logging
-            logger.error("Lightweight observe call failed: %s", exc)
+        if note is not None:
+            # Note already produced by batched reflection; no LLM call needed.
+            note = note.strip().splitlines()[0][:100] if note.strip() else "正常完成"
+        else:
+            note = "正常完成"
+            try:
+                llm_note = await self.llm_client.complete(
+                    system_prompt=_LIGHT_SYSTEM_PROMPT,
+                    user_message=user_prompt,
+                    model=self.light_model,
+                    max_tokens=120,
+                    priority="background",
+                )
+                if llm_note and llm_note.strip():
+                    note = llm_note.strip().splitlines()[0][:100]
+            except Exception as exc:  # pragma: no cover - defensive logging
+                logger.error("Lightweight observe call failed: %s", exc)
 
         now = datetime.now().replace(microsecond=0)
         patterns_noticed = list(signals)
@@ -211,6 +223,7 @@ class ObserverEngine:
                 user_message=user_message,
                 model=self.deep_model,
                 max_tokens=2000,
+                priority="background",
             )
             parsed = self._parse_json_object(raw)
         except Exception as exc:  # pragma: no cover - defensive logging
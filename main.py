@@ -27,12 +27,17 @@ from core.architect import ArchitectEngine
 from core.bootstrap import BootstrapFlow
 from core.channels.bus import MessageBus, InboundMessage, OutboundMessage
 from core.channels.cron import CronService
+from core.channels.dispatcher import SessionDispatcher
 from core.channels.heartbeat import HeartbeatService
 from core.channels.manager import ChannelManager
-from core.channels.telegram import TelegramInboundChannel
+from core.channels.telegram import TelegramInboundChannel, split_message as _split_message
 from core.config import EvoConfig
+from core.llm_cache import ResponseCache
 from core.llm_client import LLMClient
+from core.llm_resilience import ResiliencePolicy
 from core.telegram import TelegramChannel
+from core.tokens import default_counter
+from extensions.memory.retention import RetentionEngine
 
 logger = logging.getLogger("evo-agent")
 
@@ -43,13 +48,36 @@ logger = logging.getLogger("evo-agent")
 def build_app(config: EvoConfig, workspace: Path, *, telegram_enabled: bool = True) -> dict:
     """初始化所有模块，返回模块字典。"""
     # LLM 客户端（单实例，多 Provider）
-    llm = LLMClient(providers=config.providers, aliases=config.aliases)
+    response_cache = None
+    if config.llm_response_cache_enabled:
+        response_cache = ResponseCache(
+            workspace / "cache" / "llm_responses.sqlite",
+            ttl_seconds=config.llm_response_cache_ttl_hours * 3600,
+            max_entries=config.llm_response_cache_max_entries,
+        )
+    llm = LLMClient(
+        providers=config.providers,
+        aliases=config.aliases,
+        response_cache=response_cache,
+        resilience=ResiliencePolicy.from_config(config.llm_resilience, config.llm_failover),
+    )
+    # token 预算按对话主模型设定，按其真实 usage 校准估算
+    default_counter.reference_provider = config.aliases.get(
+        config.agent_loop_model, config.agent_loop_model
+    )
 
     # Agent Loop（核心中枢）
     agent_loop = AgentLoop(
         workspace_path=str(workspace),
         llm_client=llm,
         model=config.agent_loop_model,
+        memory_backend=config.memory_backend,
+        memory_ranker=config.memory_ranker,
+        max_active_sessions=config.agent_loop_max_active_sessions,
+        post_task_workers=config.post_task_workers,
+        post_task_max_pending=config.post_task_max_pending,
+        reflection_batch_size=config.post_task_batch_max_items if config.post_task_batch_enabled else 0,
+        reflection_batch_wait_ms=config.post_task_batch_max_wait_ms,
     )
 
     # Bootstrap
@@ -158,7 +186,7 @@ async def _parse_bootstrap_input(app: dict, stage: str, user_text: str) -> dict:
     if not prompt or not llm:
         return {"raw_input": user_text}
     try:
-        raw = await llm.complete(system_prompt=prompt, user_message=user_text, model="qwen")
+        raw = await llm.complete(system_prompt=prompt, user_message=user_text, model="qwen", cache=True)
         # 去掉可能的 markdown 代码块
         raw = raw.strip().strip("```json").strip("```").strip()
         return _json.loads(raw)
@@ -171,103 +199,133 @@ async def _parse_bootstrap_input(app: dict, stage: str, user_text: str) -> dict:
 #  Bus 桥接循环（新架构）
 # ──────────────────────────────────────
 
-async def run_bus_bridge(app: dict, stop_event: asyncio.Event):
-    """Bus 桥接循环：消费 inbound 消息，路由到处理器，回复用户。"""
+async def run_bus_bridge(app: dict, stop_event: asyncio.Event, *, drain_timeout: float = 30.0):
+    """Bus 桥接循环：消费 inbound 消息，交给 SessionDispatcher 并发处理。
+
+    不同用户的消息并发处理（受 bus.max_workers 限制），同一用户的消息严格按顺序处理；
+    审批回调走快速通道，不等待工作位。停止时等待在途消息处理完（最多 drain_timeout 秒）。
+    """
     bus: MessageBus = app["bus"]
+    config = app.get("config")
+    max_workers = config.bus_max_workers if config else 8
+    dispatcher = SessionDispatcher(lambda msg: _handle_inbound(app, msg), max_workers=max_workers)
+    app["dispatcher"] = dispatcher
+
+    try:
+        while not stop_event.is_set():
+            try:
+                msg: InboundMessage = await asyncio.wait_for(
+                    bus.consume_inbound(), timeout=1.0
+                )
+            except asyncio.TimeoutError:
+                continue
+            except Exception as e:
+                logger.error("Unexpected error consuming message: %s", e)
+                continue
+            dispatcher.submit(msg)
+
+        if not await dispatcher.drain(timeout=drain_timeout):
+            logger.warning("Bus bridge stopped with %d messages unfinished", dispatcher.pending)
+    except asyncio.CancelledError:
+        logger.info("Bus bridge cancelled")
+    finally:
+        await dispatcher.cancel()
+
+
+async def _handle_inbound(app: dict, msg: InboundMessage):
+    """处理一条 inbound 消息：审批回调、Bootstrap 或正常对话，并回复用户。"""
     agent_loop: AgentLoop = app["agent_loop"]
     bootstrap: BootstrapFlow = app["bootstrap"]
     channel_manager: ChannelManager = app["channel_manager"]
     telegram_outbound = app["telegram"]  # 旧出站通知模块
     architect: ArchitectEngine = app["architect"]
 
-    while not stop_event.is_set():
-        try:
-            msg: InboundMessage = await asyncio.wait_for(
-                bus.consume_inbound(), timeout=1.0
-            )
-        except asyncio.TimeoutError:
-            continue
-        except asyncio.CancelledError:
-            logger.info("Bus bridge cancelled")
-            break
-        except Exception as e:
-            logger.error("Unexpected error consuming message: %s", e)
-            continue
+    tg_channel = channel_manager.get_channel("telegram")
 
-        tg_channel = channel_manager.get_channel("telegram")
-
-        # --- 审批回调处理 ---
-        if msg.metadata.get("callback_data"):
-            callback_data = msg.metadata["callback_data"]
-            if not telegram_outbound:
-                logger.warning("No outbound channel for callback handling")
-                continue
-            try:
-                result = await telegram_outbound.handle_callback(callback_data)
-                if not result:
-                    continue
-                action = result.get("action")
-                proposal_id = result.get("proposal_id")
-                if not action or not proposal_id:
-                    logger.error("Callback missing action/proposal_id: %s", result)
-                    continue
-                if action == "approve":
-                    proposal = architect._load_proposal(proposal_id)
-                    if proposal:
-                        exec_result = await architect.execute_proposal(proposal)
-                        reply = f"✅ 提案 {proposal_id} 已执行。状态: {exec_result['status']}"
-                    else:
-                        reply = f"❌ 找不到提案 {proposal_id}"
-                elif action == "reject":
-                    architect._update_proposal_status(proposal_id, "rejected")
-                    reply = f"❌ 提案 {proposal_id} 已拒绝。"
-                elif action == "discuss":
-                    reply = f"💬 提案 {proposal_id} 标记为讨论中。请在对话中说明你的想法。"
+    # --- 审批回调处理 ---
+    if msg.metadata.get("callback_data"):
+        callback_data = msg.metadata["callback_data"]
+        if not telegram_outbound:
+            logger.warning("No outbound channel for callback handling")
+            return
+        try:
+            result = await telegram_outbound.handle_callback(callback_data)
+            if not result:
+                return
+            action = result.get("action")
+            proposal_id = result.get("proposal_id")
+            if not action or not proposal_id:
+                logger.error("Callback missing action/proposal_id: %s", result)
+                return
+            if action == "approve":
+                proposal = architect._load_proposal(proposal_id)
+                if proposal:
+                    exec_result = await architect.execute_proposal(proposal)
+                    reply = f"✅ 提案 {proposal_id} 已执行。状态: {exec_result['status']}"
                 else:
-                    reply = None
-                if reply and tg_channel:
-                    await tg_channel.send_message(msg.user_id, reply)
-            except Exception as e:
-                logger.error("Callback handling failed: %s", e)
-            continue
+                    reply = f"❌ 找不到提案 {proposal_id}"
+            elif action == "reject":
+                architect._update_proposal_status(proposal_id, "rejected")
+                reply = f"❌ 提案 {proposal_id} 已拒绝。"
+            elif action == "discuss":
+                reply = f"💬 提案 {proposal_id} 标记为讨论中。请在对话中说明你的想法。"
+            else:
+                reply = None
+            if reply and tg_channel:
+                await tg_channel.send_message(msg.user_id, reply)
+        except Exception as e:
+            logger.error("Callback handling failed: %s", e)
+        return
 
-        # --- Bootstrap 流程 ---
-        if not bootstrap.is_bootstrapped():
-            stage = bootstrap.get_current_stage()
-            if stage == "not_started":
-                bootstrap._save_state({
-                    "current_stage": "background",
-                    "completed_stages": [],
-                    "started_at": datetime.now().isoformat(),
-                    "completed_at": None,
-                })
-                prompt = bootstrap.get_stage_prompt("background")
-                if tg_channel:
-                    await tg_channel.send_message(msg.user_id, prompt)
-                continue
-            parsed = await _parse_bootstrap_input(app, stage, msg.text)
-            result = await bootstrap.process_stage(stage, parsed)
+    # --- Bootstrap 流程 ---
+    if not bootstrap.is_bootstrapped():
+        stage = bootstrap.get_current_stage()
+        if stage == "not_started":
+            bootstrap._save_state({
+                "current_stage": "background",
+                "completed_stages": [],
+                "started_at": datetime.now().isoformat(),
+                "completed_at": None,
+            })
+            prompt = bootstrap.get_stage_prompt("background")
             if tg_channel:
-                await tg_channel.send_message(msg.user_id, result["prompt"])
-            continue
+                await tg_channel.send_message(msg.user_id, prompt)
+            return
+        parsed = await _parse_bootstrap_input(app, stage, msg.text)
+        result = await bootstrap.process_stage(stage, parsed)
+        if tg_channel:
+            await tg_channel.send_message(msg.user_id, result["prompt"])
+        return
 
-        # --- 正常消息处理 ---
-        try:
-            trace = await agent_loop.process_message(msg.text)
-            response = trace.get("system_response", "处理完成，但无回复内容。")
-        except Exception as e:
-            logger.error("process_message failed: %s", e, exc_info=True)
-            response = "处理消息时出错，请稍后重试。"
+    # --- 正常消息处理 ---
+    # 支持流式的通道先发占位消息，随生成进度编辑
+    stream = None
+    if tg_channel and tg_channel.supports_streaming:
+        stream = tg_channel.open_stream(msg.user_id)
+        if stream:
+            await stream.start()
+    try:
+        session = {"channel": msg.channel, "user_id": msg.user_id}
+        if stream:
+            trace = await agent_loop.process_message(msg.text, on_delta=stream.append, **session)
+        else:
+            trace = await agent_loop.process_message(msg.text, **session)
+        response = trace.get("system_response", "处理完成，但无回复内容。")
+    except Exception as e:
+        logger.error("process_message failed: %s", e, exc_info=True)
+        response = "处理消息时出错，请稍后重试。"
 
-        if not response or not response.strip():
-            response = "处理完成，但无回复内容。"
+    if not response or not response.strip():
+        response = "处理完成，但无回复内容。"
 
-        if tg_channel:
-            for chunk in _split_message(response, 4000):
-                try:
-                    await tg_channel.send_message(msg.user_id, chunk)
-                except Exception as e:
-                    logger.error("Failed to send chunk to %s: %s", msg.user_id, e)
+    if stream:
+        await stream.finish(response)
+    elif tg_channel:
+        for chunk in _split_message(response, 4000):
+            try:
+                await tg_channel.send_message(msg.user_id, chunk)
+            except Exception as e:
+                logger.error("Failed to send chunk to %s: %s", msg.user_id, e)
 
 
 # ──────────────────────────────────────
@@ -472,6 +530,7 @@ async def run_dry_mode(app: dict):
     agent_loop: AgentLoop = app["agent_loop"]
     bootstrap: BootstrapFlow = app["bootstrap"]
 
+    agent_loop.post_task_queue.start()
     print("=== evo-agent dry-run 模式 ===")
     print("输入消息与 Agent 交互，Ctrl+C 退出\n")
 
@@ -506,6 +565,9 @@ async def run_dry_mode(app: dict):
         response = trace.get("system_response", "(无回复)")
         print(f"Agent: {response}\n")
 
+    # 处理完排队中的后处理任务并持久化会话
+    await agent_loop.shutdown()
+
 
 # ──────────────────────────────────────
 #  主入口
@@ -585,6 +647,17 @@ async def async_main(args):
     cron_service.register("observer_deep", config.observer_cron, _observer_deep)
     cron_service.register("architect_run", config.architect_cron, _architect_run)
     cron_service.register("daily_briefing", config.briefing_cron, _daily_briefing)
+    if config.memory_retention_enabled:
+        retention = RetentionEngine(app["workspace"])
+
+        async def _memory_retention():
+            logger.info("Cron: Running memory retention...")
+            retention.run()
+
+        cron_service.register("memory_retention", config.memory_retention_cron, _memory_retention)
+
+    # 任务后处理队列：重放上次未完成的条目
+    app["agent_loop"].post_task_queue.start()
 
     # Bus 桥接循环
     bridge_task = asyncio.create_task(run_bus_bridge(app, stop_event))
@@ -598,15 +671,17 @@ async def async_main(args):
     # 等待停止信号
     await stop_event.wait()
 
-    # 清理：先取消 task，等待其完成，再停止通道
-    bridge_task.cancel()
+    # 清理：等待 bus 桥接处理完在途消息（超时后取消），再停止通道
     try:
-        await asyncio.gather(bridge_task, return_exceptions=True)
-    except asyncio.CancelledError:
+        await asyncio.wait_for(bridge_task, timeout=35.0)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
         pass
+    except Exception as e:
+        logger.error("Bus bridge exited with error: %s", e)
     await cron_service.stop()
     await heartbeat_service.stop()
     await channel_manager.stop_all()
+    await app["agent_loop"].shutdown()
     logger.info("evo-agent stopped.")
 
 
@@ -646,23 +721,5 @@ def _in_window(now: datetime, target: dt_time, minutes: int = 30) -> bool:
     return delta < minutes * 60 / 2
 
 
-def _split_message(text: str, max_len: int = 4000) -> list[str]:
-    """将长消息分段。"""
-    if len(text) <= max_len:
-        return [text]
-    chunks = []
-    while text:
-        if len(text) <= max_len:
-            chunks.append(text)
-            break
-        # 在 max_len 附近找换行符
-        split_at = text.rfind("\n", 0, max_len)
-        if split_at == -1:
-            split_at = max_len
-        chunks.append(text[:split_at])
-        text = text[split_at:].lstrip("\n")
-    return chunks
-
-
 if __name__ == "__main__":
     main()
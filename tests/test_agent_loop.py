@@ -7,7 +7,7 @@ from pathlib import Path
 import pytest
 
 from core.agent_loop import AgentLoop
-from core.llm_client import MockLLMClient
+from core.llm_client import MockLLMClient, StreamInterrupted
 
 
 @pytest.fixture
@@ -102,6 +102,41 @@ class TestBasicFlow:
         assert len(agent.get_conversation_history()) == 0
 
 
+class TestSessions:
+    @pytest.mark.asyncio
+    async def test_sessions_isolated(self, agent):
+        """不同 (channel, user_id) 的历史与任务 ID 互不干扰。"""
+        a = await agent.process_message("我是A", channel="telegram", user_id="1")
+        b = await agent.process_message("我是B", channel="telegram", user_id="2")
+        await agent.process_message("本地")
+
+        assert a["task_id"] != b["task_id"]
+        assert a["task_id"].endswith("_0001") and b["task_id"].endswith("_0001")
+        history_a = agent.get_conversation_history(channel="telegram", user_id="1")
+        assert [m["content"] for m in history_a if m["role"] == "user"] == ["我是A"]
+        assert len(agent.get_conversation_history()) == 2
+        # 第二个会话的请求不包含第一个会话的历史
+        second_call = [c for c in agent.llm.calls if c["user_message"] == "我是B"][0]
+        assert all("我是A" not in m["content"] for m in second_call["messages"])
+
+    @pytest.mark.asyncio
+    async def test_evicted_session_rehydrates(self, loop_workspace, mock_responses):
+        """超出内存上限的会话换出到磁盘，再次使用时恢复历史与计数。"""
+        agent = AgentLoop(
+            workspace_path=loop_workspace,
+            llm_client=MockLLMClient(responses=mock_responses),
+            max_active_sessions=1,
+        )
+        await agent.process_message("第一条", channel="telegram", user_id="1")
+        await agent.process_message("别的会话", channel="telegram", user_id="2")
+        assert ("telegram", "1") not in agent.sessions
+
+        trace = await agent.process_message("第二条", channel="telegram", user_id="1")
+        assert trace["task_id"].endswith("_0002")
+        history = agent.get_conversation_history(channel="telegram", user_id="1")
+        assert [m["content"] for m in history if m["role"] == "user"] == ["第一条", "第二条"]
+
+
 # ──────────────────────────────────────
 #  规则集成测试
 # ──────────────────────────────────────
@@ -231,6 +266,65 @@ class TestHistoryManagement:
         history = agent.get_conversation_history()
         assert len(history) == 6  # 3 rounds × 2
 
+    @pytest.mark.asyncio
+    async def test_streaming_forwards_deltas(self, loop_workspace, mock_responses):
+        """传入 on_delta 时流式调用，增量拼接为最终回复。"""
+        class StreamingLLM(MockLLMClient):
+            async def stream_messages(self, system_prompt, messages, model="opus", max_tokens=2000):
+                for piece in ["流式", "回复"]:
+                    yield piece
+
+        deltas = []
+
+        async def on_delta(delta):
+            deltas.append(delta)
+
+        agent = AgentLoop(workspace_path=loop_workspace, llm_client=StreamingLLM(responses=mock_responses))
+        trace = await agent.process_message("你好", on_delta=on_delta)
+
+        assert deltas == ["流式", "回复"]
+        assert trace["system_response"] == "流式回复"
+        assert agent.get_conversation_history()[-1]["content"] == "流式回复"
+
+    @pytest.mark.asyncio
+    async def test_stream_interrupted_midway(self, loop_workspace, mock_responses):
+        """流式中途失败：回复带中断提示，不完整文本不作为正常回复写入历史。"""
+        class BrokenStreamLLM(MockLLMClient):
+            async def stream_messages(self, system_prompt, messages, model="opus", max_tokens=2000):
+                yield "前半段"
+                raise StreamInterrupted("connection reset")
+
+        deltas = []
+
+        async def on_delta(delta):
+            deltas.append(delta)
+
+        agent = AgentLoop(workspace_path=loop_workspace, llm_client=BrokenStreamLLM(responses=mock_responses))
+        trace = await agent.process_message("你好", on_delta=on_delta)
+
+        assert deltas == ["前半段"]
+        assert trace["interrupted"] is True
+        assert trace["system_response"].startswith("前半段")
+        assert "回复生成中断" in trace["system_response"]
+        history = agent.get_conversation_history()
+        assert history[-1]["role"] == "assistant"
+        assert "前半段" not in history[-1]["content"]
+
+    @pytest.mark.asyncio
+    async def test_history_sent_as_messages(self, loop_workspace, mock_responses):
+        """历史作为多轮消息发送，当前消息在最后。"""
+        llm = MockLLMClient(responses=mock_responses)
+        agent = AgentLoop(workspace_path=loop_workspace, llm_client=llm)
+        await agent.process_message("第一条")
+        await agent.process_message("第二条")
+
+        main_calls = [c for c in llm.calls if c["model"] == agent.model]
+        messages = main_calls[-1]["messages"]
+        assert [m["role"] for m in messages] == ["user", "assistant", "user"]
+        assert messages[0]["content"] == "第一条"
+        assert messages[-1]["content"] == "第二条"
+        assert "第一条" not in main_calls[-1]["system_prompt"]
+
 
 # ──────────────────────────────────────
 #  错误恢复测试
@@ -244,6 +338,9 @@ class TestErrorRecovery:
             async def complete(self, **kwargs):
                 raise RuntimeError("LLM unavailable")
 
+            async def complete_messages(self, **kwargs):
+                raise RuntimeError("LLM unavailable")
+
         agent = AgentLoop(
             workspace_path=loop_workspace,
             llm_client=FailingLLM(),
@@ -282,3 +379,80 @@ class TestDailySummary:
         summary = await agent.get_daily_summary()
         assert summary is not None
         assert "tasks" in summary
+
+
+class TestPostTaskQueue:
+    @pytest.mark.asyncio
+    async def test_pipeline_runs_via_queue_and_drains_on_shutdown(self, agent, loop_workspace):
+        """后处理链经持久化队列执行，shutdown 等待其完成并清空 spool。"""
+        await agent.process_message("你好")
+        await agent.shutdown(timeout=5)
+
+        stats = agent.post_task_queue.stats()
+        assert stats["processed"] == 1
+        assert stats["pending"] == 0
+        spool = loop_workspace / "queue" / "post_task.jsonl"
+        assert not spool.exists() or spool.read_text(encoding="utf-8") == ""
+
+
+    @pytest.mark.asyncio
+    async def test_full_queue_does_not_delay_reply(self, loop_workspace, mock_responses):
+        """后处理队列已满时回复不等待后台处理，超出的任务延后执行。"""
+        agent = AgentLoop(
+            workspace_path=loop_workspace,
+            llm_client=MockLLMClient(responses=mock_responses),
+            model="opus",
+            post_task_workers=1,
+            post_task_max_pending=1,
+        )
+        release = asyncio.Event()
+        pipeline = agent._post_task_pipeline
+
+        async def slow_pipeline(task_trace):
+            await release.wait()
+            await pipeline(task_trace)
+
+        agent.post_task_queue._handler = slow_pipeline
+        for text in ("一", "二", "三"):
+            await asyncio.wait_for(agent.process_message(text), timeout=1)
+
+        assert agent.post_task_queue.stats()["deferred"] == 2
+        release.set()
+        await agent.shutdown(timeout=5)
+        assert agent.post_task_queue.stats()["processed"] == 3
+
+
+class TestReflectionBatching:
+    @pytest.mark.asyncio
+    async def test_batched_pipeline_fans_out(self, loop_workspace, mock_responses):
+        """批量模式：多条任务一次反思调用，Observer 不再单独调用，指标逐任务记录。"""
+        mock_responses["gemini-flash"] = json.dumps([
+            {
+                "task_id": f"task_{i:04d}",
+                "type": "NONE",
+                "outcome": "SUCCESS",
+                "lesson": "正常完成",
+                "root_cause": None,
+                "reusable_experience": None,
+                "note": "正常完成",
+            }
+            for i in (1, 2, 3)
+        ])
+        llm = MockLLMClient(responses=mock_responses)
+        agent = AgentLoop(
+            workspace_path=loop_workspace,
+            llm_client=llm,
+            model="opus",
+            reflection_batch_size=3,
+            reflection_batch_wait_ms=5000,
+        )
+        for text in ("一", "二", "三"):
+            await agent.process_message(text)
+        await agent.shutdown(timeout=5)
+
+        background = [c for c in llm.calls if c["priority"] == "background"]
+        assert len(background) == 1
+        assert agent._reflection_batcher.batches == 1
+        assert agent.post_task_queue.stats()["processed"] == 3
+        summary = await agent.get_daily_summary()
+        assert summary["tasks"]["total"] == 3
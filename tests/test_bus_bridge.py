@@ -32,6 +32,7 @@ def mock_app(bus):
     mock_channel = MagicMock()
     mock_channel.name = "telegram"
     mock_channel.send_message = AsyncMock()
+    mock_channel.supports_streaming = False
     mock_channel.is_running = True
     channel_manager._channels = [mock_channel]
 
@@ -67,11 +68,48 @@ class TestBusBridge:
         asyncio.create_task(stop_after_processing())
         await run_bus_bridge(mock_app, stop_event)
 
-        mock_app["agent_loop"].process_message.assert_awaited_once_with("你好")
+        mock_app["agent_loop"].process_message.assert_awaited_once_with(
+            "你好", channel="telegram", user_id="111"
+        )
         # 验证回复被发送
         mock_channel = mock_app["channel_manager"].get_channel("telegram")
         mock_channel.send_message.assert_awaited_once_with("111", "回复内容")
 
+    @pytest.mark.asyncio
+    async def test_streaming_channel_gets_progressive_reply(self, bus, mock_app):
+        """支持流式的通道：先发占位，增量转发给 stream，结束时写入最终回复。"""
+        from main import run_bus_bridge
+
+        stream = MagicMock()
+        stream.start = AsyncMock()
+        stream.append = AsyncMock()
+        stream.finish = AsyncMock()
+        mock_channel = mock_app["channel_manager"].get_channel("telegram")
+        mock_channel.supports_streaming = True
+        mock_channel.open_stream = MagicMock(return_value=stream)
+
+        async def fake_process(text, on_delta=None, **session):
+            await on_delta("回复")
+            await on_delta("内容")
+            return {"system_response": "回复内容"}
+
+        mock_app["agent_loop"].process_message = AsyncMock(side_effect=fake_process)
+        stop_event = asyncio.Event()
+        await bus.publish_inbound(InboundMessage(channel="telegram", user_id="111", text="你好"))
+
+        async def stop_after_processing():
+            await asyncio.sleep(0.1)
+            stop_event.set()
+
+        asyncio.create_task(stop_after_processing())
+        await run_bus_bridge(mock_app, stop_event)
+
+        mock_channel.open_stream.assert_called_once_with("111")
+        stream.start.assert_awaited_once()
+        assert [c.args[0] for c in stream.append.await_args_list] == ["回复", "内容"]
+        stream.finish.assert_awaited_once_with("回复内容")
+        mock_channel.send_message.assert_not_awaited()
+
     @pytest.mark.asyncio
     async def test_callback_routed_to_approval(self, bus, mock_app):
         """callback_data 消息路由到审批处理。"""
@@ -168,3 +206,33 @@ class TestBusBridge:
         mock_app["bootstrap"]._save_state.assert_called_once()
         mock_channel = mock_app["channel_manager"].get_channel("telegram")
         mock_channel.send_message.assert_awaited_once_with("111", "欢迎！请介绍你自己。")
+
+    @pytest.mark.asyncio
+    async def test_slow_user_does_not_block_others(self, bus, mock_app):
+        """一个用户的慢调用不阻塞其他用户；停止时等待在途消息处理完。"""
+        from main import run_bus_bridge
+
+        replied = []
+
+        async def fake_process(text, **session):
+            if text == "慢":
+                await asyncio.sleep(0.3)
+            replied.append(text)
+            return {"system_response": text}
+
+        mock_app["agent_loop"].process_message = AsyncMock(side_effect=fake_process)
+        stop_event = asyncio.Event()
+        await bus.publish_inbound(InboundMessage(channel="telegram", user_id="111", text="慢"))
+        await bus.publish_inbound(InboundMessage(channel="telegram", user_id="222", text="快"))
+
+        snapshot = []
+
+        async def stop_after():
+            await asyncio.sleep(0.1)
+            snapshot.extend(replied)
+            stop_event.set()
+        asyncio.create_task(stop_after())
+        await run_bus_bridge(mock_app, stop_event)
+
+        assert snapshot == ["快"]
+        assert replied == ["快", "慢"]
@@ -128,6 +128,63 @@ class TestEvoConfigProperties:
         assert cfg.quiet_hours == ("23:00", "07:00")
         assert cfg.evolution_strategy == "balanced"
 
+    def test_memory_retrieval(self, tmp_path):
+        """记忆检索后端和排序器默认 keyword，可由 YAML 覆盖。"""
+        cfg = EvoConfig()
+        assert cfg.memory_backend == "keyword"
+        assert cfg.memory_ranker == "keyword"
+
+        config_file = tmp_path / "cfg.yaml"
+        data = {"memory": {"retrieval": {"backend": "vector", "ranker": "bm25"}}}
+        config_file.write_text(yaml.safe_dump(data), encoding="utf-8")
+        cfg = EvoConfig(config_file)
+        assert cfg.memory_backend == "vector"
+        assert cfg.memory_ranker == "bm25"
+
+    def test_memory_retention(self, tmp_path):
+        """记忆整理任务默认开启，cron 可由 YAML 覆盖。"""
+        cfg = EvoConfig()
+        assert cfg.memory_retention_enabled is True
+        assert cfg.memory_retention_cron == "30 3 * * *"
+
+        config_file = tmp_path / "cfg.yaml"
+        data = {"memory": {"retention": {"enabled": False, "cron": "0 4 * * 0"}}}
+        config_file.write_text(yaml.safe_dump(data), encoding="utf-8")
+        cfg = EvoConfig(config_file)
+        assert cfg.memory_retention_enabled is False
+        assert cfg.memory_retention_cron == "0 4 * * 0"
+
+    def test_llm_response_cache(self, tmp_path):
+        """响应缓存默认开启，TTL 与条目上限可由 YAML 覆盖。"""
+        cfg = EvoConfig()
+        assert cfg.llm_response_cache_enabled is True
+        assert cfg.llm_response_cache_ttl_hours == 168
+        assert cfg.llm_response_cache_max_entries == 5000
+
+        config_file = tmp_path / "cfg.yaml"
+        data = {"llm": {"response_cache": {"enabled": False, "ttl_hours": 1, "max_entries": 10}}}
+        config_file.write_text(yaml.safe_dump(data), encoding="utf-8")
+        cfg = EvoConfig(config_file)
+        assert cfg.llm_response_cache_enabled is False
+        assert cfg.llm_response_cache_ttl_hours == 1
+        assert cfg.llm_response_cache_max_entries == 10
+
+    def test_post_task_batch(self, tmp_path):
+        """批量反思默认关闭，批大小与等待时间可由 YAML 覆盖。"""
+        cfg = EvoConfig()
+        assert cfg.post_task_batch_enabled is False
+        assert cfg.post_task_batch_max_items == 8
+        assert cfg.post_task_batch_max_wait_ms == 2000
+
+        config_file = tmp_path / "cfg.yaml"
+        data = {"agent_loop": {"post_task": {"batch": {"enabled": True, "max_items": 4, "max_wait_ms": 500}}}}
+        config_file.write_text(yaml.safe_dump(data), encoding="utf-8")
+        cfg = EvoConfig(config_file)
+        assert cfg.post_task_batch_enabled is True
+        assert cfg.post_task_batch_max_items == 4
+        assert cfg.post_task_batch_max_wait_ms == 500
+        assert cfg.post_task_workers == 2
+
 
 class TestEvoConfigApprovalLevels:
     def test_level_0(self):
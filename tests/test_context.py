@@ -3,7 +3,7 @@
 import pytest
 from core.rules import RulesInterpreter
 from core.context import (
-    ContextEngine, TokenBudget, estimate_tokens, truncate_to_tokens
+    ContextEngine, ConversationHistory, TokenBudget, estimate_tokens, truncate_to_tokens
 )
 
 
@@ -223,3 +223,85 @@ class TestContextEngine:
         engine = ContextEngine(interpreter, budget=budget)
 
         assert engine.budget.get_budget("system_identity") == int(45000 * 0.20)
+
+    def test_rules_scored_once_per_message(self, tmp_path, monkeypatch):
+        """一次组装只选一次规则；同一消息重新组装时复用排序结果。"""
+        rules_dir = _setup_rules(tmp_path)
+        interpreter = RulesInterpreter(rules_dir)
+        engine = ContextEngine(interpreter)
+
+        calls = []
+        original = interpreter.build_system_prompt_section
+        monkeypatch.setattr(
+            interpreter, "build_system_prompt_section",
+            lambda **kw: calls.append(kw) or original(**kw),
+        )
+        scored = []
+        original_score = RulesInterpreter._score_features
+        monkeypatch.setattr(
+            RulesInterpreter, "_score_features",
+            staticmethod(lambda *a: scored.append(a) or original_score(*a)),
+        )
+
+        first = engine.assemble(user_message="分析任务")
+        second = engine.assemble(user_message="分析任务")
+
+        assert len(calls) == 2
+        assert len(scored) == 1
+        assert "核心规则" in first.system_prompt
+        assert "经验指导" in first.system_prompt
+        assert first.system_prompt == second.system_prompt
+
+    def test_system_blocks_cache_prefix(self, tmp_path):
+        """只有宪法块带断点，按消息选出的经验规则与其它动态区段合并在后；文本与 system_prompt 一致。"""
+        rules_dir = _setup_rules(tmp_path)
+        engine = ContextEngine(RulesInterpreter(rules_dir))
+        engine.set_task_anchor("写单元测试")
+
+        ctx = engine.assemble(user_message="分析任务", memories=["记忆片段"])
+
+        blocks = ctx.system_blocks
+        assert [("cache_control" in b) for b in blocks] == [True, False]
+        assert blocks[0]["text"].startswith("## 核心规则")
+        assert "## 经验指导" in blocks[1]["text"]
+        assert "当前任务" in blocks[1]["text"] and "记忆片段" in blocks[1]["text"]
+        assert "\n\n".join(b["text"] for b in blocks) == ctx.system_prompt
+
+
+class TestConversationHistory:
+    def _messages(self, sizes):
+        return [{"role": "user", "content": "字" * n} for n in sizes]
+
+    def test_tail_matches_linear_trim(self, tmp_path):
+        """前缀和二分裁剪结果与逐条裁剪一致。"""
+        engine = ContextEngine(RulesInterpreter(_setup_rules(tmp_path)))
+        messages = self._messages([5, 100, 1, 30, 0, 7, 60, 2])
+        history = ConversationHistory(messages)
+        for budget in [-1, 0, 1, 2, 9, 50, 69, 70, 200, 1000]:
+            expected = engine._trim_history(messages, budget)
+            tail, tokens = history.tail_within(budget)
+            assert tail == expected
+            assert tokens == sum(estimate_tokens(m["content"]) for m in expected)
+
+    def test_keep_last_and_replace(self):
+        """裁剪与替换后 token 总数同步。"""
+        history = ConversationHistory(self._messages([10, 20, 30]))
+        assert history.total_tokens == 60
+        history.keep_last(2)
+        assert [len(m["content"]) for m in history] == [20, 30]
+        assert history.total_tokens == 50
+        history.append({"role": "assistant", "content": "字" * 5})
+        assert history.tail_within(35) == (list(history)[1:], 35)
+        history.replace(self._messages([4]))
+        assert len(history) == 1 and history.total_tokens == 4
+
+    def test_assemble_uses_history_object(self, tmp_path):
+        """assemble 接受 ConversationHistory，结果与列表一致。"""
+        engine = ContextEngine(RulesInterpreter(_setup_rules(tmp_path)))
+        messages = self._messages([3000] * 20)
+        from_list = engine.assemble(user_message="继续", conversation_history=messages)
+        from_history = engine.assemble(
+            user_message="继续", conversation_history=ConversationHistory(messages)
+        )
+        assert from_history.conversation_history == from_list.conversation_history
+        assert from_history.budget_usage["history"] == from_list.budget_usage["history"]
@@ -0,0 +1,112 @@
+"""SessionDispatcher 测试：会话内有序、会话间并发、回调快速通道。"""
+import asyncio
+
+import pytest
+
+from core.channels.bus import InboundMessage
+from core.channels.dispatcher import SessionDispatcher
+
+
+def _msg(user_id, text, **metadata):
+    return InboundMessage(channel="telegram", user_id=user_id, text=text, metadata=metadata)
+
+
+class TestSessionDispatcher:
+    @pytest.mark.asyncio
+    async def test_same_user_processed_in_order(self):
+        seen = []
+
+        async def handler(msg):
+            await asyncio.sleep(0.01 if msg.text == "1" else 0)
+            seen.append(msg.text)
+
+        dispatcher = SessionDispatcher(handler, max_workers=4)
+        for text in ["1", "2", "3"]:
+            dispatcher.submit(_msg("111", text))
+        assert await dispatcher.drain(timeout=1)
+        assert seen == ["1", "2", "3"]
+        assert dispatcher.processed == 3
+        assert dispatcher.sessions == 0
+
+    @pytest.mark.asyncio
+    async def test_users_run_concurrently(self):
+        release = asyncio.Event()
+        seen = []
+
+        async def handler(msg):
+            if msg.user_id == "slow":
+                await release.wait()
+            seen.append(msg.user_id)
+
+        dispatcher = SessionDispatcher(handler, max_workers=2)
+        dispatcher.submit(_msg("slow", "a"))
+        dispatcher.submit(_msg("fast", "b"))
+        await asyncio.sleep(0.01)
+        assert seen == ["fast"]
+        release.set()
+        assert await dispatcher.drain(timeout=1)
+        assert seen == ["fast", "slow"]
+
+    @pytest.mark.asyncio
+    async def test_worker_pool_is_bounded(self):
+        running = [0]
+        peak = [0]
+
+        async def handler(msg):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+
+        dispatcher = SessionDispatcher(handler, max_workers=2)
+        for i in range(6):
+            dispatcher.submit(_msg(str(i), "x"))
+        assert await dispatcher.drain(timeout=1)
+        assert peak[0] == 2
+
+    @pytest.mark.asyncio
+    async def test_callback_bypasses_busy_pool(self):
+        release = asyncio.Event()
+        seen = []
+
+        async def handler(msg):
+            if not msg.metadata.get("callback_data"):
+                await release.wait()
+            seen.append(msg.text)
+
+        dispatcher = SessionDispatcher(handler, max_workers=1)
+        dispatcher.submit(_msg("111", "chat"))
+        dispatcher.submit(_msg("111", "approve", callback_data="approve:p1"))
+        await asyncio.sleep(0.01)
+        assert seen == ["approve"]
+        release.set()
+        assert await dispatcher.drain(timeout=1)
+
+    @pytest.mark.asyncio
+    async def test_handler_error_does_not_stop_lane(self):
+        seen = []
+
+        async def handler(msg):
+            if msg.text == "bad":
+                raise RuntimeError("boom")
+            seen.append(msg.text)
+
+        dispatcher = SessionDispatcher(handler)
+        dispatcher.submit(_msg("111", "bad"))
+        dispatcher.submit(_msg("111", "good"))
+        assert await dispatcher.drain(timeout=1)
+        assert seen == ["good"]
+        assert dispatcher.failed == 1
+
+    @pytest.mark.asyncio
+    async def test_drain_timeout_and_cancel(self):
+        async def handler(msg):
+            await asyncio.sleep(10)
+
+        dispatcher = SessionDispatcher(handler)
+        dispatcher.submit(_msg("111", "x"))
+        dispatcher.submit(_msg("111", "y"))
+        assert not await dispatcher.drain(timeout=0.01)
+        assert dispatcher.pending == 2
+        await dispatcher.cancel()
+        assert dispatcher.pending == 0
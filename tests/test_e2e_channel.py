@@ -85,6 +85,7 @@ def _make_mock_app(bus: MessageBus, channel: TelegramInboundChannel | None = Non
         mock_ch = MagicMock()
         mock_ch.name = "telegram"
         mock_ch.send_message = AsyncMock()
+        mock_ch.supports_streaming = False
         channel_manager._channels = [mock_ch]
 
     return {
@@ -138,7 +139,9 @@ class TestFullMessageFlow:
         await _run_bridge_then_stop(app)
 
         # 验证 AgentLoop 被调用
-        app["agent_loop"].process_message.assert_awaited_once_with("你好，Agent")
+        app["agent_loop"].process_message.assert_awaited_once_with(
+            "你好，Agent", channel="telegram", user_id="111"
+        )
 
         # 验证通道发送了回复（send_message 已在 _make_mock_app 中被替换为 AsyncMock）
         tg_ch = app["channel_manager"].get_channel("telegram")
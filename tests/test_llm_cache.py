@@ -0,0 +1,149 @@
+"""LLM 响应缓存测试。"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from core.llm_cache import ResponseCache
+from core.llm_client import LLMClient
+from core.llm_resilience import ResiliencePolicy
+from core.tokens import TokenCounter
+
+
+def _key(cache, text="问题", max_tokens=100):
+    return cache.make_key("qwen", "qwen-test", "sys", [{"role": "user", "content": text}], max_tokens)
+
+
+class TestResponseCache:
+    def test_key_covers_all_fields(self):
+        make = ResponseCache.make_key
+        base = make("qwen", "m", "sys", [{"role": "user", "content": "a"}], 100)
+        assert base == make("qwen", "m", "sys", [{"role": "user", "content": "a"}], 100)
+        assert base != make("opus", "m", "sys", [{"role": "user", "content": "a"}], 100)
+        assert base != make("qwen", "m2", "sys", [{"role": "user", "content": "a"}], 100)
+        assert base != make("qwen", "m", "sys2", [{"role": "user", "content": "a"}], 100)
+        assert base != make("qwen", "m", "sys", [{"role": "user", "content": "b"}], 100)
+        assert base != make("qwen", "m", "sys", [{"role": "user", "content": "a"}], 200)
+
+    def test_hit_and_miss_counters(self, tmp_path):
+        cache = ResponseCache(tmp_path / "cache.sqlite")
+        key = _key(cache)
+        assert cache.get(key) is None
+        cache.put(key, "答案")
+        assert cache.get(key) == "答案"
+        assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+    def test_persists_across_instances(self, tmp_path):
+        path = tmp_path / "sub" / "cache.sqlite"
+        cache = ResponseCache(path)
+        cache.put(_key(cache), "答案")
+        cache.close()
+        assert ResponseCache(path).get(_key(cache)) == "答案"
+
+    def test_empty_response_not_cached(self):
+        cache = ResponseCache(":memory:")
+        cache.put(_key(cache), "")
+        assert len(cache) == 0
+
+    def test_ttl_expiry(self, monkeypatch):
+        clock = [1000.0]
+        monkeypatch.setattr("core.llm_cache.time.time", lambda: clock[0])
+        cache = ResponseCache(":memory:", ttl_seconds=60)
+        key = _key(cache)
+        cache.put(key, "答案")
+        clock[0] += 61
+        assert cache.get(key) is None
+        assert len(cache) == 0
+
+    def test_evicts_least_recently_used(self, monkeypatch):
+        clock = [1000.0]
+        monkeypatch.setattr("core.llm_cache.time.time", lambda: clock[0])
+        cache = ResponseCache(":memory:", max_entries=2)
+        keys = [_key(cache, text) for text in "abc"]
+        for key in keys[:2]:
+            clock[0] += 1
+            cache.put(key, key)
+        clock[0] += 1
+        cache.get(keys[0])
+        clock[0] += 1
+        cache.put(keys[2], keys[2])
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[0]) == keys[0]
+        assert cache.get(keys[2]) == keys[2]
+
+    def test_evicts_by_total_bytes(self):
+        cache = ResponseCache(":memory:", max_bytes=10)
+        cache.put(_key(cache, "a"), "x" * 6)
+        cache.put(_key(cache, "b"), "y" * 6)
+        assert len(cache) == 1
+        assert cache.get(_key(cache, "b")) == "y" * 6
+
+
+class TestClientIntegration:
+    def _client(self, cache):
+        calls = []
+
+        class _Completions:
+            async def create(self, **kwargs):
+                calls.append(kwargs)
+                return SimpleNamespace(
+                    choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))],
+                    usage=SimpleNamespace(prompt_tokens=10, completion_tokens=1),
+                )
+
+        client = LLMClient(
+            providers={"qwen": {"type": "openai", "model_id": "qwen-test"}},
+            token_counter=TokenCounter(),
+            response_cache=cache,
+        )
+        client._clients["qwen"] = SimpleNamespace(chat=SimpleNamespace(completions=_Completions()))
+        return client, calls
+
+    @pytest.mark.asyncio
+    async def test_opt_in_calls_are_cached(self):
+        cache = ResponseCache(":memory:")
+        client, calls = self._client(cache)
+        assert await client.complete("sys", "问题", model="qwen", cache=True) == "ok"
+        assert await client.complete("sys", "问题", model="qwen", cache=True) == "ok"
+        assert len(calls) == 1
+        assert cache.hits == 1
+
+    @pytest.mark.asyncio
+    async def test_calls_without_opt_in_bypass_cache(self):
+        cache = ResponseCache(":memory:")
+        client, calls = self._client(cache)
+        await client.complete("sys", "问题", model="qwen")
+        await client.complete("sys", "问题", model="qwen")
+        assert len(calls) == 2
+        assert len(cache) == 0
+
+    @pytest.mark.asyncio
+    async def test_alias_shares_entry(self):
+        """别名解析后的 provider 参与键计算，别名与原名命中同一条目。"""
+        cache = ResponseCache(":memory:")
+        client, calls = self._client(cache)
+        client._aliases = {"gemini-flash": "qwen"}
+        await client.complete("sys", "问题", model="qwen", cache=True)
+        await client.complete("sys", "问题", model="gemini-flash", cache=True)
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_failover_response_not_cached(self):
+        """主模型失败、由其它模型给出的响应不写入主模型的缓存键。"""
+        class _Down:
+            async def create(self, **kwargs):
+                raise ValueError("primary down")
+
+        cache = ResponseCache(":memory:")
+        client, calls = self._client(cache)
+        client._providers = {
+            "opus": {"type": "openai", "model_id": "opus-test"},
+            "qwen": {"type": "openai", "model_id": "qwen-test"},
+        }
+        client.resilience = ResiliencePolicy(failover={"opus": ["qwen"]})
+        client._clients["opus"] = SimpleNamespace(chat=SimpleNamespace(completions=_Down()))
+
+        assert await client.complete("sys", "问题", model="opus", cache=True) == "ok"
+        assert await client.complete("sys", "问题", model="opus", cache=True) == "ok"
+        assert len(calls) == 2
+        assert len(cache) == 0
@@ -1,8 +1,13 @@
 """测试 LLM 客户端（Mock）。"""
 
 import json
+from types import SimpleNamespace
+
 import pytest
-from core.llm_client import MockLLMClient
+from core.llm_client import (
+    BaseLLMClient, LLMClient, MockLLMClient, chat_messages, system_block, system_text,
+)
+from core.tokens import TokenCounter
 
 
 class TestMockLLMClient:
@@ -39,3 +44,250 @@ class TestMockLLMClient:
         assert len(client.calls) == 2
         assert client.calls[0]["model"] == "opus"
         assert client.calls[1]["model"] == "gemini-flash"
+
+
+class _FakeMessages:
+    def __init__(self, usage):
+        self.usage = usage
+        self.kwargs = None
+
+    async def create(self, **kwargs):
+        self.kwargs = kwargs
+        return SimpleNamespace(
+            content=[SimpleNamespace(text="ok")],
+            usage=SimpleNamespace(**self.usage),
+        )
+
+
+def _anthropic_client(usage):
+    client = LLMClient(
+        providers={"opus": {"type": "anthropic", "model_id": "claude-test"}},
+        token_counter=TokenCounter(),
+    )
+    fake = SimpleNamespace(messages=_FakeMessages(usage))
+    client._clients["opus"] = fake
+    return client, fake.messages
+
+
+class TestPromptCaching:
+    @pytest.mark.asyncio
+    async def test_blocks_sent_with_cache_control(self):
+        """结构化 system 块原样发送，空块被丢弃。"""
+        client, messages = _anthropic_client({"input_tokens": 10, "output_tokens": 5})
+        blocks = [system_block("宪法", cache=True), system_block(""), system_block("记忆")]
+
+        assert await client.complete(blocks, "hi") == "ok"
+
+        system = messages.kwargs["system"]
+        assert [b["text"] for b in system] == ["宪法", "记忆"]
+        assert system[0]["cache_control"] == {"type": "ephemeral"}
+        assert "cache_control" not in system[1]
+
+    @pytest.mark.asyncio
+    async def test_breakpoints_capped(self):
+        """cache 断点最多保留最后 4 个。"""
+        client, messages = _anthropic_client({})
+        blocks = [system_block(f"b{i}", cache=True) for i in range(6)]
+        await client.complete(blocks, "hi")
+        marked = [b["text"] for b in messages.kwargs["system"] if "cache_control" in b]
+        assert marked == ["b2", "b3", "b4", "b5"]
+
+    @pytest.mark.asyncio
+    async def test_cache_usage_recorded(self):
+        """记录 cache 读写 token，按 provider 累计。"""
+        client, _ = _anthropic_client({
+            "input_tokens": 20,
+            "output_tokens": 7,
+            "cache_creation_input_tokens": None,
+            "cache_read_input_tokens": 1500,
+        })
+        await client.complete("sys", "hi")
+        await client.complete("sys", "hi")
+
+        assert client.last_usage["cache_read_input_tokens"] == 1500
+        assert client.last_usage["cache_creation_input_tokens"] == 0
+        assert client.usage["opus"]["cache_read_input_tokens"] == 3000
+        assert client.usage["opus"]["output_tokens"] == 14
+
+    @pytest.mark.asyncio
+    async def test_mock_flattens_blocks(self):
+        """Mock 记录展平后的 system 文本。"""
+        client = MockLLMClient()
+        blocks = [system_block("A", cache=True), system_block("B")]
+        await client.complete(blocks, "msg")
+        assert client.calls[0]["system_prompt"] == system_text(blocks) == "A\n\nB"
+        assert client.calls[0]["system_blocks"] == blocks
+
+    @pytest.mark.asyncio
+    async def test_usage_calibrates_counter(self):
+        """真实 input token 数用于校准本地估算（含 cache 读写）。"""
+        client, _ = _anthropic_client({
+            "input_tokens": 4,
+            "output_tokens": 1,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 8,
+        })
+        counter = client.token_counter
+        estimated = counter.estimate("system prompt") + counter.estimate("hello there")
+        await client.complete("system prompt", "hello there")
+        assert counter.ratios["opus"] == pytest.approx(min(2.0, 12 / estimated))
+
+
+class TestMultiTurn:
+    def test_chat_messages_normalized(self):
+        """摘要转为 user，相邻同角色合并，开头 assistant 与空消息丢弃。"""
+        turns = chat_messages([
+            {"role": "assistant", "content": "孤立回复"},
+            {"role": "system", "type": "summary", "content": "之前讨论了部署", "timestamp": "t"},
+            {"role": "user", "content": "继续"},
+            {"role": "assistant", "content": ""},
+            {"role": "assistant", "content": "好的"},
+            {"role": "user", "content": "下一步？"},
+        ])
+        assert turns == [
+            {"role": "user", "content": "[对话摘要]\n之前讨论了部署\n\n继续"},
+            {"role": "assistant", "content": "好的"},
+            {"role": "user", "content": "下一步？"},
+        ]
+
+    @pytest.mark.asyncio
+    async def test_anthropic_history_breakpoint(self):
+        """system 使用 cache 断点时，历史末尾也设断点，总数不超过 4。"""
+        client, messages = _anthropic_client({})
+        system = [system_block(f"s{i}", cache=True) for i in range(4)]
+        history = [
+            {"role": "user", "content": "问1"},
+            {"role": "assistant", "content": "答1"},
+            {"role": "user", "content": "问2"},
+        ]
+        await client.complete_messages(system, history)
+
+        sent = messages.kwargs["messages"]
+        assert sent[0] == {"role": "user", "content": "问1"}
+        assert sent[1]["content"] == [system_block("答1", cache=True)]
+        assert sent[2] == {"role": "user", "content": "问2"}
+        marked = [b["text"] for b in messages.kwargs["system"] if "cache_control" in b]
+        assert marked == ["s1", "s2", "s3"]
+        assert history[1]["content"] == "答1"
+
+    @pytest.mark.asyncio
+    async def test_openai_messages(self):
+        """OpenAI 兼容后端：system 消息 + 多轮消息。"""
+        captured = {}
+
+        class _Completions:
+            async def create(self, **kwargs):
+                captured.update(kwargs)
+                return SimpleNamespace(
+                    choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))],
+                    usage=SimpleNamespace(prompt_tokens=30, completion_tokens=2),
+                )
+
+        client = LLMClient(providers={"qwen": {"type": "openai"}}, token_counter=TokenCounter())
+        client._clients["qwen"] = SimpleNamespace(chat=SimpleNamespace(completions=_Completions()))
+        result = await client.complete_messages(
+            [system_block("规则", cache=True)],
+            [{"role": "user", "content": "a"}, {"role": "assistant", "content": "b"},
+             {"role": "user", "content": "c"}],
+            model="qwen",
+        )
+
+        assert result == "ok"
+        assert [m["role"] for m in captured["messages"]] == ["system", "user", "assistant", "user"]
+        assert captured["messages"][0]["content"] == "规则"
+        assert client.usage["qwen"]["input_tokens"] == 30
+
+    @pytest.mark.asyncio
+    async def test_base_fallback_flattens_history(self):
+        """未原生支持多轮的客户端把历史展平进用户消息。"""
+        class SingleTurn(BaseLLMClient):
+            def __init__(self):
+                self.received = None
+
+            async def complete(self, system_prompt, user_message, model="opus", max_tokens=2000):
+                self.received = user_message
+                return "ok"
+
+        client = SingleTurn()
+        await client.complete_messages("sys", [
+            {"role": "user", "content": "问1"},
+            {"role": "assistant", "content": "答1"},
+            {"role": "user", "content": "问2"},
+        ])
+        assert "user: 问1" in client.received
+        assert "assistant: 答1" in client.received
+        assert client.received.endswith("问2")
+
+
+class TestStreaming:
+    @pytest.mark.asyncio
+    async def test_anthropic_stream(self):
+        """anthropic 流式：逐段产出文本，结束后记录 usage。"""
+        class _Stream:
+            def __init__(self):
+                async def gen():
+                    for piece in ["你", "好"]:
+                        yield piece
+                self.text_stream = gen()
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            async def get_final_message(self):
+                return SimpleNamespace(usage=SimpleNamespace(input_tokens=9, output_tokens=2))
+
+        captured = {}
+
+        def stream(**kwargs):
+            captured.update(kwargs)
+            return _Stream()
+
+        client = LLMClient(providers={"opus": {"type": "anthropic"}}, token_counter=TokenCounter())
+        client._clients["opus"] = SimpleNamespace(messages=SimpleNamespace(stream=stream))
+
+        pieces = [p async for p in client.stream_messages("sys", [{"role": "user", "content": "hi"}])]
+
+        assert pieces == ["你", "好"]
+        assert captured["messages"] == [{"role": "user", "content": "hi"}]
+        assert client.last_usage["input_tokens"] == 9
+
+    @pytest.mark.asyncio
+    async def test_openai_stream(self):
+        """openai 兼容流式：读取 delta.content，忽略空增量。"""
+        def chunk(text, usage=None):
+            return SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=usage
+            )
+
+        class _Completions:
+            async def create(self, **kwargs):
+                assert kwargs["stream"] is True
+
+                async def gen():
+                    yield chunk("a")
+                    yield chunk(None)
+                    yield chunk("b", SimpleNamespace(prompt_tokens=5, completion_tokens=2))
+                return gen()
+
+        client = LLMClient(providers={"qwen": {"type": "openai"}}, token_counter=TokenCounter())
+        client._clients["qwen"] = SimpleNamespace(chat=SimpleNamespace(completions=_Completions()))
+
+        pieces = [p async for p in client.stream_messages("sys", [{"role": "user", "content": "hi"}], model="qwen")]
+        assert pieces == ["a", "b"]
+        assert client.usage["qwen"]["input_tokens"] == 5
+
+    @pytest.mark.asyncio
+    async def test_stream_errors_swallowed(self):
+        """未知 provider 等错误不抛出，只结束产出。"""
+        client = LLMClient(providers={"opus": {"type": "anthropic"}}, token_counter=TokenCounter())
+        assert [p async for p in client.stream_messages("s", [], model="nope")] == []
+
+    @pytest.mark.asyncio
+    async def test_base_stream_yields_full_response(self):
+        """默认实现一次性产出 complete_messages 的结果。"""
+        client = MockLLMClient(responses={"opus": "完整回复"})
+        pieces = [p async for p in client.stream_messages("s", [{"role": "user", "content": "x"}])]
+        assert pieces == ["完整回复"]
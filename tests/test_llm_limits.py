@@ -0,0 +1,177 @@
+"""Provider 并发与速率限制测试。"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from core.llm_client import LLMClient
+from core.llm_limits import BACKGROUND, INTERACTIVE, PriorityGate, ProviderLimiter, TokenBucket
+from core.tokens import TokenCounter
+
+
+class TestPriorityGate:
+    @pytest.mark.asyncio
+    async def test_limits_concurrency(self):
+        gate = PriorityGate(2)
+        await gate.acquire()
+        await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        gate.release()
+        await waiter
+        assert gate.active == 2
+
+    @pytest.mark.asyncio
+    async def test_interactive_served_before_background(self):
+        gate = PriorityGate(1)
+        await gate.acquire(INTERACTIVE)
+        order = []
+
+        async def worker(priority):
+            await gate.acquire(priority)
+            order.append(priority)
+            gate.release(priority)
+
+        background = asyncio.create_task(worker(BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(worker(INTERACTIVE))
+        await asyncio.sleep(0)
+        gate.release(INTERACTIVE)
+        await asyncio.gather(background, interactive)
+        assert order == [INTERACTIVE, BACKGROUND]
+
+    @pytest.mark.asyncio
+    async def test_background_limit_reserves_slot(self):
+        gate = PriorityGate(2, background_limit=1)
+        await gate.acquire(BACKGROUND)
+        blocked = asyncio.create_task(gate.acquire(BACKGROUND))
+        await asyncio.sleep(0)
+        assert not blocked.done()
+        await asyncio.wait_for(gate.acquire(INTERACTIVE), timeout=1)
+        blocked.cancel()
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_removed(self):
+        gate = PriorityGate(1)
+        await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        gate.release()
+        assert gate.active == 0
+
+
+class TestTokenBucket:
+    @pytest.mark.asyncio
+    async def test_burst_then_wait(self, monkeypatch):
+        clock = [0.0]
+        sleeps = []
+
+        async def fake_sleep(seconds):
+            sleeps.append(seconds)
+            clock[0] += seconds
+
+        monkeypatch.setattr("core.llm_limits.time.monotonic", lambda: clock[0])
+        monkeypatch.setattr("core.llm_limits.asyncio.sleep", fake_sleep)
+        bucket = TokenBucket(60)  # 每秒 1 个
+        await bucket.acquire(60)
+        assert sleeps == []
+        await bucket.acquire(2)
+        assert sleeps == [pytest.approx(2.0)]
+
+    @pytest.mark.asyncio
+    async def test_refund(self, monkeypatch):
+        monkeypatch.setattr("core.llm_limits.time.monotonic", lambda: 0.0)
+        bucket = TokenBucket(100)
+        await bucket.acquire(80)
+        bucket.refund(50)
+        assert bucket._tokens == pytest.approx(70)
+
+    @pytest.mark.asyncio
+    async def test_interactive_waiter_served_before_background(self):
+        """令牌不足时后来的 interactive 等待者先于已在等待的 background 取到令牌。"""
+        bucket = TokenBucket(6000)  # 每秒 100 个
+        await bucket.acquire(6000)
+        order = []
+
+        async def take(priority):
+            await bucket.acquire(10, priority)
+            order.append(priority)
+
+        background = asyncio.create_task(take(BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(take(INTERACTIVE))
+        await asyncio.wait_for(asyncio.gather(background, interactive), timeout=2)
+        assert order == [INTERACTIVE, BACKGROUND]
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_hands_over(self):
+        bucket = TokenBucket(6000)
+        await bucket.acquire(6000)
+        first = asyncio.create_task(bucket.acquire(10))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(bucket.acquire(10))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await asyncio.wait_for(second, timeout=2)
+        assert not any(bucket._waiters.values())
+
+
+class TestProviderLimiter:
+    def test_from_config(self):
+        limiter = ProviderLimiter.from_config({"max_concurrency": 3, "rpm": 10})
+        assert limiter.gate.limit == 3
+        assert limiter.gate.background_limit == 2
+        assert limiter.requests.capacity == 10
+        assert limiter.tokens is None
+
+    def test_unconfigured_is_disabled(self):
+        assert not ProviderLimiter.from_config({"type": "openai"}).enabled
+
+    @pytest.mark.asyncio
+    async def test_unknown_priority(self):
+        with pytest.raises(ValueError):
+            async with ProviderLimiter().slot("urgent"):
+                pass
+
+
+class TestClientLimits:
+    @pytest.mark.asyncio
+    async def test_concurrency_and_tpm_refund(self):
+        in_flight = [0]
+        peak = [0]
+
+        class _Completions:
+            async def create(self, **kwargs):
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+                await asyncio.sleep(0.01)
+                in_flight[0] -= 1
+                return SimpleNamespace(
+                    choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))],
+                    usage=SimpleNamespace(prompt_tokens=5, completion_tokens=5),
+                )
+
+        client = LLMClient(
+            providers={"qwen": {"type": "openai", "max_concurrency": 2, "tpm": 6000}},
+            token_counter=TokenCounter(),
+        )
+        client._clients["qwen"] = SimpleNamespace(chat=SimpleNamespace(completions=_Completions()))
+        results = await asyncio.gather(*[
+            client.complete("sys", f"问题{i}", model="qwen", max_tokens=1000, priority=BACKGROUND)
+            for i in range(5)
+        ])
+
+        assert results == ["ok"] * 5
+        # 后台请求最多占 max_concurrency - 1 个位置
+        assert peak[0] == 1
+        limiter = client._limiters["qwen"]
+        assert limiter.gate.active == 0
+        # 每次预占约 1000 token、实际只用 10，多占的额度已退还
+        assert limiter.tokens._tokens > 5900
@@ -0,0 +1,271 @@
+"""LLM 调用容错测试：重试、截止时间、对冲与故障转移。"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from core.llm_client import LLMClient, StreamInterrupted
+from core.llm_resilience import LatencyTracker, ResiliencePolicy, is_retryable
+from core.tokens import TokenCounter
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+
+
+class _Provider:
+    """按脚本依次返回文本、抛出异常或延迟的 OpenAI 兼容假客户端。"""
+
+    def __init__(self, script, delay=0.0):
+        self.script = list(script)
+        self.delay = delay
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        step = self.script.pop(0) if self.script else "ok"
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if isinstance(step, Exception):
+            raise step
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=step))],
+            usage=SimpleNamespace(prompt_tokens=1, completion_tokens=1),
+        )
+
+
+def _client(policy, model_ids=None, **fakes):
+    model_ids = model_ids or {}
+    client = LLMClient(
+        providers={name: {"type": "openai", "model_id": model_ids.get(name, name)} for name in fakes},
+        token_counter=TokenCounter(),
+        resilience=policy,
+    )
+    client._clients.update(fakes)
+    return client
+
+
+def _policy(**kwargs):
+    kwargs.setdefault("base_delay", 0.0)
+    kwargs.setdefault("output_tokens_per_second", 0.0)
+    return ResiliencePolicy(**kwargs)
+
+
+class TestPolicy:
+    def test_retryable_classification(self):
+        assert is_retryable(_StatusError(429))
+        assert is_retryable(_StatusError(503))
+        assert is_retryable(asyncio.TimeoutError())
+        assert is_retryable(ConnectionError())
+        assert not is_retryable(_StatusError(400))
+        assert not is_retryable(ValueError("bad"))
+
+    def test_backoff_respects_retry_after_and_cap(self):
+        policy = ResiliencePolicy(base_delay=1.0, max_delay=4.0)
+        assert policy.backoff(0, _StatusError(429, {"retry-after": "2"})) == 2.0
+        assert policy.backoff(0, _StatusError(429, {"retry-after": "30"})) == 4.0
+        assert 0 <= policy.backoff(10) <= 4.0
+
+    def test_from_config(self):
+        policy = ResiliencePolicy.from_config({"max_retries": 5, "unknown": 1}, {"opus": ["qwen", "opus"]})
+        assert policy.max_retries == 5
+        assert policy.chain("opus") == ["opus", "qwen"]
+        assert policy.chain("qwen") == ["qwen"]
+
+    def test_limits_scale_with_max_tokens(self):
+        policy = ResiliencePolicy(attempt_timeout=30, deadline=60, output_tokens_per_second=20)
+        assert policy.limits(0) == (30, 60)
+        assert policy.limits(3000) == (180, 360)
+        assert policy.limits(3000, attempt_timeout=300) == (300, 600)
+        assert ResiliencePolicy().hedge_quantile <= 0
+
+    def test_latency_quantile(self):
+        tracker = LatencyTracker()
+        for i in range(1, 101):
+            tracker.record("opus", i / 100)
+        assert tracker.quantile("opus", 0.95) == pytest.approx(0.95)
+        assert tracker.quantile("opus", 0.95, min_samples=200) is None
+        assert tracker.quantile("qwen", 0.95) is None
+
+
+class TestRetryAndFailover:
+    @pytest.mark.asyncio
+    async def test_retries_transient_errors(self):
+        fake = _Provider([_StatusError(429), _StatusError(503), "ok"])
+        client = _client(_policy(max_retries=2), opus=fake)
+        assert await client.complete("sys", "hi") == "ok"
+        assert fake.calls == 3
+
+    @pytest.mark.asyncio
+    async def test_non_retryable_fails_over_immediately(self):
+        primary = _Provider([_StatusError(400)])
+        backup = _Provider(["backup"])
+        client = _client(_policy(failover={"opus": ["qwen"]}), opus=primary, qwen=backup)
+        assert await client.complete("sys", "hi") == "backup"
+        assert primary.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_exhausted_retries_fail_over(self):
+        primary = _Provider([_StatusError(500)] * 3)
+        backup = _Provider(["backup"])
+        client = _client(_policy(max_retries=1, failover={"opus": ["qwen"]}), opus=primary, qwen=backup)
+        assert await client.complete("sys", "hi") == "backup"
+        assert primary.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_all_failures_return_empty(self):
+        client = _client(_policy(max_retries=1), opus=_Provider([_StatusError(500)] * 5))
+        assert await client.complete("sys", "hi") == ""
+
+    @pytest.mark.asyncio
+    async def test_attempt_timeout_then_failover(self):
+        slow = _Provider(["late"], delay=1.0)
+        backup = _Provider(["backup"])
+        client = _client(
+            _policy(max_retries=0, attempt_timeout=0.05, failover={"opus": ["qwen"]}),
+            opus=slow, qwen=backup,
+        )
+        assert await client.complete("sys", "hi") == "backup"
+
+    @pytest.mark.asyncio
+    async def test_deadline_bounds_total_time(self):
+        client = _client(
+            _policy(max_retries=10, attempt_timeout=0.05, deadline=0.12),
+            opus=_Provider([], delay=1.0),
+        )
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        assert await client.complete("sys", "hi") == ""
+        assert loop.time() - started < 0.5
+
+
+    @pytest.mark.asyncio
+    async def test_per_call_attempt_timeout(self):
+        slow = _Provider(["late"], delay=0.2)
+        backup = _Provider(["backup"])
+        client = _client(
+            _policy(max_retries=0, attempt_timeout=0.05, failover={"opus": ["qwen"]}),
+            opus=slow, qwen=backup,
+        )
+        assert await client.complete("sys", "hi", attempt_timeout=1.0) == "late"
+        assert backup.calls == 0
+
+    @pytest.mark.asyncio
+    async def test_long_generation_gets_more_time(self):
+        slow = _Provider(["long"], delay=0.2)
+        client = _client(
+            _policy(max_retries=0, attempt_timeout=0.05, output_tokens_per_second=10_000),
+            opus=slow,
+        )
+        assert await client.complete("sys", "hi", max_tokens=3000) == "long"
+        assert slow.calls == 1
+
+
+def _hedging_client(primary, backup, **policy):
+    return _client(
+        _policy(hedge_quantile=0.95, hedge_min_samples=3, failover={"opus": ["opus-backup"]}, **policy),
+        model_ids={"opus": "claude-opus", "opus-backup": "claude-opus"},
+        opus=primary, **{"opus-backup": backup},
+    )
+
+
+class TestHedging:
+    @pytest.mark.asyncio
+    async def test_slow_primary_is_hedged(self):
+        primary = _Provider(["slow"], delay=0.5)
+        backup = _Provider(["fast"])
+        client = _hedging_client(primary, backup)
+        for _ in range(3):
+            client.latency.record("opus", 0.01)
+        assert await client.complete("sys", "hi") == "fast"
+        assert primary.calls == 1 and backup.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_no_hedge_without_samples(self):
+        primary = _Provider(["primary"], delay=0.02)
+        backup = _Provider(["fast"])
+        client = _hedging_client(primary, backup)
+        assert await client.complete("sys", "hi") == "primary"
+        assert backup.calls == 0
+        assert client.latency.quantile("opus", 0.5) is not None
+
+    @pytest.mark.asyncio
+    async def test_background_calls_not_hedged(self):
+        primary = _Provider(["primary"], delay=0.1)
+        backup = _Provider(["fast"])
+        client = _hedging_client(primary, backup)
+        for _ in range(3):
+            client.latency.record("opus", 0.01)
+        assert await client.complete("sys", "hi", priority="background") == "primary"
+        assert backup.calls == 0
+
+    @pytest.mark.asyncio
+    async def test_no_hedge_to_different_model(self):
+        primary = _Provider(["primary"], delay=0.1)
+        backup = _Provider(["fast"])
+        client = _client(
+            _policy(hedge_quantile=0.95, hedge_min_samples=3, failover={"opus": ["qwen"]}),
+            opus=primary, qwen=backup,
+        )
+        for _ in range(3):
+            client.latency.record("opus", 0.01)
+        assert await client.complete("sys", "hi") == "primary"
+        assert backup.calls == 0
+
+
+class TestStreamingFailover:
+    @pytest.mark.asyncio
+    async def test_fails_over_before_first_delta(self):
+        class _Stream:
+            def __init__(self, error=None):
+                self.error = error
+                self.chat = SimpleNamespace(completions=self)
+
+            async def create(self, **kwargs):
+                if self.error:
+                    raise self.error
+
+                async def chunks():
+                    yield SimpleNamespace(
+                        usage=None,
+                        choices=[SimpleNamespace(delta=SimpleNamespace(content="备用"))],
+                    )
+                return chunks()
+
+        client = _client(
+            _policy(max_retries=0, failover={"opus": ["qwen"]}),
+            opus=_Stream(_StatusError(503)), qwen=_Stream(),
+        )
+        deltas = [d async for d in client.stream_messages("sys", [{"role": "user", "content": "hi"}])]
+        assert deltas == ["备用"]
+
+    @pytest.mark.asyncio
+    async def test_stalled_stream_times_out(self):
+        class _Stalled:
+            def __init__(self):
+                self.chat = SimpleNamespace(completions=self)
+
+            async def create(self, **kwargs):
+                async def chunks():
+                    yield SimpleNamespace(
+                        usage=None,
+                        choices=[SimpleNamespace(delta=SimpleNamespace(content="前半"))],
+                    )
+                    await asyncio.sleep(10)
+                return chunks()
+
+        client = _client(_policy(max_retries=0, stream_idle_timeout=0.05), opus=_Stalled())
+        deltas = []
+
+        async def consume():
+            async for delta in client.stream_messages("sys", [{"role": "user", "content": "hi"}]):
+                deltas.append(delta)
+
+        with pytest.raises(StreamInterrupted):
+            await asyncio.wait_for(consume(), timeout=2)
+        assert deltas == ["前半"]
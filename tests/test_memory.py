@@ -117,6 +117,41 @@ class TestErrorPatterns:
         """无错误文件返回空。"""
         assert store.get_recent_errors() == ""
 
+    def test_recent_query_reads_only_recent_shards(self, store):
+        """条目按日期分片，最近 N 天的查询只读取对应分片。"""
+        store.append_error_pattern("今天的错误", source="task_001")
+        today = datetime.now().strftime("%Y-%m-%d")
+        shard = store.errors.shard_path(today)
+        assert json.loads(shard.read_text(encoding="utf-8"))["source"] == "task_001"
+
+        old = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+        store.errors.shard_path(old).write_text("not json\n", encoding="utf-8")
+        errors = store.get_recent_errors(days=7)
+        assert errors.startswith("# 已发现的错误模式")
+        assert "今天的错误" in errors
+
+    def test_legacy_view_migrated(self, tmp_path):
+        """已有的 error_patterns.md 在首次查询时拆分为日期分片。"""
+        workspace = tmp_path / "workspace"
+        user_dir = workspace / "memory" / "user"
+        user_dir.mkdir(parents=True)
+        old_date = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+        today = datetime.now().strftime("%Y-%m-%d")
+        (user_dir / "error_patterns.md").write_text(
+            f"# 已发现的错误模式\n\n- [{old_date}] 旧错误\n- [{today}] 新错误\n",
+            encoding="utf-8",
+        )
+
+        store = MemoryStore(str(workspace))
+        assert store.get_recent_errors(days=7) == f"# 已发现的错误模式\n\n- [{today}] 新错误"
+        assert store.errors.shard_path(old_date).exists()
+
+        store.append_error_pattern("追加的错误")
+        reopened = MemoryStore(str(workspace))
+        errors = reopened.get_recent_errors(days=7)
+        assert "追加的错误" in errors and "新错误" in errors
+        assert "旧错误" in reopened.get_recent_errors(days=60)
+
 
 class TestProjectMemory:
     def test_save_and_read(self, store):
@@ -177,6 +212,117 @@ class TestConversations:
         assert len(listed) == 0  # 跳过损坏文件
 
 
+
+class TestConversationLog:
+    def test_listing_reads_manifest_only(self, store):
+        """列出对话按修改时间倒序，且不读取段文件。"""
+        for i in range(3):
+            store.save_conversation(f"conv_{i}", [{"role": "user", "content": f"msg {i}"}])
+        store.save_conversation("conv_0", [{"role": "user", "content": "更新"}])
+
+        for seg in store.conversations_dir.glob("seg-*.jsonl"):
+            seg.write_text("", encoding="utf-8")
+        listed = store.list_conversations()
+        assert [c["conversation_id"] for c in listed] == ["conv_0", "conv_2", "conv_1"]
+        assert not list(store.conversations_dir.glob("*.json"))
+
+    def test_resave_replaces_record(self, store):
+        """同 ID 重复保存，读取与检索都只看到最新内容。"""
+        store.save_conversation("conv_a", [{"role": "user", "content": "旧话题：数据库"}])
+        store.save_conversation("conv_a", [{"role": "user", "content": "新话题：前端构建"}])
+
+        assert store.get_conversation("conv_a")["messages"][0]["content"] == "新话题：前端构建"
+        assert store.search("数据库", scope="conversations") == []
+        assert len(store.search("前端构建", scope="conversations")) == 1
+
+    def test_log_survives_reopen(self, store):
+        """重新打开后 manifest 与检索索引保持一致。"""
+        store.save_conversation("conv_a", [{"role": "user", "content": "讨论缓存淘汰策略"}], {"topic": "cache"})
+
+        reopened = MemoryStore(str(store.workspace))
+        assert reopened.list_conversations()[0]["metadata"]["topic"] == "cache"
+        assert reopened.refresh_index()["updated"] == 0
+        assert reopened.search("缓存淘汰", scope="conversations")
+
+    def test_segments_roll_and_reclaim(self, tmp_path):
+        """段写满后滚动；段内记录全部作废后删除段文件。"""
+        from core.conversation_log import ConversationLog
+
+        log = ConversationLog(tmp_path / "conversations", segment_bytes=200)
+        log.load()
+        for i in range(4):
+            log.append(f"c{i}", [{"role": "user", "content": "x" * 100}])
+        assert len(list(log.log_dir.glob("seg-*.jsonl"))) == 4
+
+        log.append("c0", [{"role": "user", "content": "y"}])
+        assert not log.segment_path(1).exists()
+        assert log.get("c0")["messages"][0]["content"] == "y"
+        assert log.get("c1")["messages"][0]["content"] == "x" * 100
+
+    def test_legacy_json_imported(self, tmp_path):
+        """旧版每对话一个 JSON 的文件在加载时导入日志。"""
+        workspace = tmp_path / "workspace"
+        conv_dir = workspace / "memory" / "conversations"
+        conv_dir.mkdir(parents=True)
+        (conv_dir / "old.json").write_text(json.dumps({
+            "conversation_id": "old",
+            "timestamp": "2026-01-01T00:00:00",
+            "messages": [{"role": "user", "content": "历史对话里的发布计划"}],
+            "metadata": {},
+        }, ensure_ascii=False, indent=2), encoding="utf-8")
+
+        store = MemoryStore(str(workspace))
+        assert store.list_conversations()[0]["timestamp"] == "2026-01-01T00:00:00"
+        assert (conv_dir / "legacy" / "old.json").exists()
+        assert store.search("发布计划", scope="conversations")
+
+
+class TestReadCache:
+    def test_repeated_reads_hit_cache(self, store):
+        """重复读取命中缓存；自身写入后直接更新缓存而不是重新读盘。"""
+        store.append_preference("喜欢简短回答")
+        first = store.get_user_preferences()
+        misses = store._cache.misses
+
+        assert store.get_user_preferences() == first
+        store.append_preference("偏好中文")
+        assert "偏好中文" in store.get_user_preferences()
+        assert store._cache.misses == misses
+
+    def test_external_write_invalidates(self, store):
+        """外部改写文件（mtime/size 变化）后读到新内容。"""
+        store.save_user_memory("profile", "旧画像")
+        assert store.get_user_profile() == "旧画像"
+
+        (store.user_dir / "profile.md").write_text("外部更新的画像", encoding="utf-8")
+        assert store.get_user_profile() == "外部更新的画像"
+
+        (store.user_dir / "profile.md").unlink()
+        assert store.get_user_profile() == ""
+
+    def test_recent_error_shards_cached(self, store):
+        """错误分片的解析结果随文件缓存，重复查询不重新读盘。"""
+        store.append_error_pattern("超时未重试")
+        assert "超时未重试" in store.get_recent_errors(days=7)
+        misses = store._cache.misses
+        assert "超时未重试" in store.get_recent_errors(days=7)
+        assert store._cache.misses == misses
+
+    def test_lru_byte_cap(self, tmp_path):
+        """超过字节上限时淘汰最久未用的条目。"""
+        from core.memory_cache import FileCache
+
+        cache = FileCache(max_bytes=100)
+        paths = []
+        for name in "abc":
+            path = tmp_path / f"{name}.md"
+            path.write_text(name * 40, encoding="utf-8")
+            paths.append(path)
+            cache.read_text(path)
+        assert len(cache) == 2
+        assert cache.read_text(paths[2]) == "c" * 40
+        assert cache.misses == 3
+
 class TestDailySummary:
     def test_save_and_get(self, store):
         """保存并获取每日摘要。"""
@@ -301,3 +447,211 @@ class TestGetRelevantMemories:
             assert "相关记忆" in ctx.system_prompt
         if preferences:
             assert "用户偏好" in ctx.system_prompt
+
+
+class TestSearchIndex:
+    def test_index_persists_across_instances(self, store):
+        """索引落盘，新实例无需重建即可检索。"""
+        store.save_user_memory("note", "系统架构设计方案讨论记录")
+
+        reopened = MemoryStore(str(store.workspace))
+        assert len(reopened.index) == len(store.index)
+        assert reopened.search("架构设计")
+
+    def test_append_updates_index_incrementally(self, store):
+        """追加偏好后新词项立即可检索。"""
+        store.append_preference("喜欢简短回答")
+        store.append_preference("偏好 TypeScript 示例")
+
+        results = store.search("TypeScript", scope="user")
+        assert len(results) == 1
+        assert "preferences.md" in results[0]["source"]
+
+    def test_refresh_picks_up_external_writes(self, store):
+        """绕过 MemoryStore 的写入在 refresh_index 后可检索。"""
+        (store.user_dir / "external.md").write_text("外部写入的部署流程说明", encoding="utf-8")
+        assert store.search("部署流程", scope="user") == []
+
+        stats = store.refresh_index()
+        assert stats["updated"] == 1
+        assert len(store.search("部署流程", scope="user")) == 1
+
+    def test_deleted_file_dropped_from_results(self, store):
+        """已删除的文件不再出现在结果中。"""
+        path = store.save_user_memory("temp", "临时记录的数据库迁移方案")
+        path.unlink()
+        assert store.search("数据库迁移") == []
+        assert store.index.get_file("user/temp.md") is None
+
+    def test_conversation_snippet_uses_index_offset(self, store):
+        """长对话只返回命中位置附近的片段。"""
+        filler = "无关内容。" * 300
+        store.save_conversation("conv_long", [
+            {"role": "user", "content": filler},
+            {"role": "assistant", "content": "结论：采用消息队列解耦"},
+        ])
+        results = store.search("消息队列", scope="conversations")
+        assert len(results) == 1
+        assert "消息队列" in results[0]["content"]
+        assert len(results[0]["content"]) <= 510
+
+
+
+class TestChunkedDocuments:
+    def test_large_file_returns_relevant_chunk_only(self, store):
+        """大文件只返回命中的段落，而不是整个文件。"""
+        sections = [f"## 主题 {i}\n\n" + f"第 {i} 节的普通记录。" * 20 + "\n" for i in range(10)]
+        sections[6] = "## 部署\n\n生产环境使用蓝绿部署，回滚窗口十分钟。\n"
+        store.save_user_memory("MEMORY", "# 核心记忆\n\n" + "\n".join(sections))
+
+        results = store.search("蓝绿部署", scope="user")
+        assert len(results) == 1
+        assert results[0]["content"].startswith("## 部署")
+        assert "主题" not in results[0]["content"]
+        assert results[0]["chunk_id"]
+
+    def test_long_preference_list_split_into_chunks(self, store):
+        """偏好列表按行打包成多个 chunk，检索只取相关部分。"""
+        for i in range(60):
+            store.append_preference(f"第 {i} 条日常偏好，与检索无关的内容")
+        store.append_preference("代码示例统一使用 TypeScript")
+
+        record = store.index.get_file("user/preferences.md")
+        assert len(record["chunks"]) > 1
+        results = store.search("TypeScript", scope="user")
+        assert len(results) == 1
+        assert "TypeScript" in results[0]["content"]
+        assert len(results[0]["content"]) < len(store.get_user_preferences()) // 2
+
+    def test_chunk_ids_stable_across_rewrites(self, store):
+        """内容不变的 chunk 重写后 ID 不变，只有改动的段落换 ID。"""
+        first = "# 笔记\n\n## 甲\n\n甲段内容\n\n## 乙\n\n乙段内容\n"
+        store.save_user_memory("note", first)
+        before = [c[0] for c in store.index.get_file("user/note.md")["chunks"]]
+
+        store.save_user_memory("note", first.replace("乙段内容", "乙段已修改"))
+        after = [c[0] for c in store.index.get_file("user/note.md")["chunks"]]
+        assert after[:2] == before[:2]
+        assert after[2] != before[2]
+        assert len(store.index) == 3
+
+    def test_incremental_append_matches_full_rebuild(self, store):
+        """追加写入的增量切分结果与整文件重新切分一致。"""
+        for i in range(40):
+            store.append_error_pattern(f"错误模式 {i}：超时未重试", source=f"task_{i:04d}")
+        incremental = store.index.get_file("user/error_patterns.md")["chunks"]
+
+        store.index.remove_file("user/error_patterns.md")
+        store.refresh_index()
+        assert store.index.get_file("user/error_patterns.md")["chunks"] == incremental
+
+    def test_external_edit_rechunks_on_read(self, store):
+        """索引后文件被外部改写，读取候选时重新切分而不是读错区间。"""
+        path = store.save_user_memory("note", "# 笔记\n\n缓存策略使用 redis\n")
+        path.write_text("# 笔记\n\n前置的新段落内容很长很长\n\n缓存策略使用 redis\n", encoding="utf-8")
+
+        for r in store.search("redis", scope="user"):
+            assert "redis" in r["content"]
+        results = store.search("redis", scope="user")
+        assert len(results) == 1
+        assert "前置的新段落" in results[0]["content"]
+
+class TestBM25Ranker:
+    def test_bm25_prefers_focused_document(self, store):
+        """词频高、篇幅短的文档排在前面。"""
+        store.save_user_memory("focused", "部署流程：先构建镜像，再按部署流程灰度发布。")
+        store.save_user_memory("diluted", "周会记录。" + "讨论了很多其他事项。" * 30 + "顺带提到部署流程。")
+
+        results = store.search("部署流程", scope="user", ranker="bm25")
+        assert len(results) == 2
+        assert "focused.md" in results[0]["source"]
+        assert results[0]["score"] > results[1]["score"]
+
+    def test_bm25_rare_term_outweighs_common(self, store):
+        """稀有词（高 IDF）贡献大于常见词。"""
+        for i in range(5):
+            store.save_user_memory(f"common_{i}", f"项目笔记 {i}")
+        store.save_user_memory("rare", "项目笔记 kubernetes")
+
+        results = store.search("项目 kubernetes", scope="user", ranker="bm25")
+        assert "rare.md" in results[0]["source"]
+
+    def test_bm25_stats_persist_and_update(self, store):
+        """文档统计持久化，重新打开后分数一致；增删文档增量更新 IDF。"""
+        store.save_user_memory("a", "缓存策略 redis")
+        store.save_user_memory("b", "缓存失效")
+        before = store.search("缓存", scope="user", ranker="bm25")
+
+        reopened = MemoryStore(str(store.workspace))
+        after = reopened.search("缓存", scope="user", ranker="bm25")
+        assert [r["score"] for r in before] == pytest.approx([r["score"] for r in after])
+
+        idf_before = reopened.index.idf("redis")
+        reopened.save_user_memory("c", "redis 集群")
+        assert reopened.index.idf("redis") < idf_before
+
+    def test_default_ranker_from_constructor(self, store):
+        """构造参数设置默认排序器。"""
+        bm25_store = MemoryStore(str(store.workspace), ranker="bm25")
+        bm25_store.save_user_memory("note", "系统架构设计方案")
+        assert bm25_store.search("架构设计")
+
+    def test_unknown_ranker(self, store):
+        """未知排序器抛出 ValueError。"""
+        with pytest.raises(ValueError):
+            store.search("任意", ranker="vector-magic")
+
+
+class TestVectorBackend:
+    @pytest.fixture
+    def vector_store(self, tmp_path):
+        pytest.importorskip("numpy")
+        workspace = tmp_path / "workspace"
+        workspace.mkdir()
+        return MemoryStore(str(workspace), backend="vector")
+
+    def test_vector_search(self, vector_store):
+        """向量后端返回最相似的文档。"""
+        vector_store.save_user_memory("infra", "Kubernetes 集群部署与容器编排")
+        vector_store.save_user_memory("food", "周末喜欢做川菜和火锅")
+
+        results = vector_store.search("容器编排 kubernetes")
+        assert results
+        assert "infra.md" in results[0]["source"]
+        assert 0 < results[0]["score"] <= 1.0
+
+    def test_vectors_persist_and_update(self, vector_store):
+        """向量库落盘；文档更新后旧向量作废。"""
+        vector_store.save_user_memory("note", "旧内容：数据库索引调优")
+        vector_store.save_user_memory("note", "新内容：前端性能优化")
+
+        reopened = MemoryStore(str(vector_store.workspace), backend="vector")
+        assert len(reopened.vectors) == 1
+        results = reopened.search("前端性能", scope="user")
+        assert results and "前端性能" in results[0]["content"]
+
+    def test_vector_scope_filter(self, vector_store):
+        """scope 过滤对向量后端同样生效。"""
+        vector_store.save_user_memory("profile", "用户擅长 Python 开发")
+        vector_store.save_project_memory("evo", "context", "项目使用 Python 开发")
+
+        results = vector_store.search("Python 开发", scope="project", project="evo")
+        assert results
+        assert all("projects" in r["source"] for r in results)
+
+    def test_falls_back_to_keyword_without_numpy(self, tmp_path, monkeypatch):
+        """numpy 不可用时回退关键词检索。"""
+        from core import memory_vector
+        monkeypatch.setattr(memory_vector, "np", None)
+
+        workspace = tmp_path / "workspace"
+        workspace.mkdir()
+        store = MemoryStore(str(workspace), backend="vector")
+        assert store.backend == "keyword"
+        store.save_user_memory("note", "系统架构设计方案")
+        assert store.search("架构设计")
+
+    def test_unknown_backend(self, tmp_path):
+        """未知后端抛出 ValueError。"""
+        with pytest.raises(ValueError):
+            MemoryStore(str(tmp_path), backend="faiss")
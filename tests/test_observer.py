@@ -31,6 +31,18 @@ class TestObserverEngine:
         assert json.loads(lines[0])["task_id"] == "task_042"
         assert set(log) == {"patterns_noticed", "suggestions", "urgency"}
 
+    @pytest.mark.asyncio
+    async def test_lightweight_uses_precomputed_note(self, tmp_path):
+        """批量反思给出的笔记直接写入日志，不再调用 LLM。"""
+        ws = _setup_workspace(tmp_path)
+        engine = _make_engine(ws)
+
+        await engine.lightweight_observe(_make_trace(), note="回复偏长\n第二行")
+
+        assert engine.llm_client.calls == []
+        log_file = ws / f"observations/light_logs/{date.today().isoformat()}.jsonl"
+        assert json.loads(log_file.read_text(encoding="utf-8"))["note"] == "回复偏长"
+
     @pytest.mark.asyncio
     async def test_lightweight_returns_contract(self, tmp_path):
         """轻量观察返回正确格式。"""
@@ -2,13 +2,14 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
 from pathlib import Path
 
 import pytest
 
 from core.llm_client import MockLLMClient
-from extensions.memory.reflection import ReflectionEngine
+from extensions.memory.reflection import ReflectionBatcher, ReflectionEngine
 
 
 class TestReflectionEngine:
@@ -174,6 +175,73 @@ class TestReflectionEngine:
         assert "x" * 550 not in llm.calls[0]["user_message"]
 
 
+class TestReflectionBatch:
+    @pytest.mark.asyncio
+    async def test_batch_single_call_keyed_by_task_id(self, tmp_path):
+        """多条轨迹合并为一次 LLM 调用，结果按 task_id 分发并保持输入顺序。"""
+        memory_dir = _setup_memory(tmp_path)
+        llm = MockLLMClient(responses={"gemini-flash": _batch_response("task_002", "task_001")})
+        engine = ReflectionEngine(llm, str(memory_dir))
+
+        results = await engine.reflect_batch([_make_trace("task_001"), _make_trace("task_002")])
+
+        assert len(llm.calls) == 1
+        assert llm.calls[0]["priority"] == "background"
+        assert "task_001" in llm.calls[0]["user_message"]
+        assert "task_002" in llm.calls[0]["user_message"]
+        assert [r["task_id"] for r, _ in results] == ["task_001", "task_002"]
+        assert results[0][0]["type"] == "PREFERENCE"
+        assert results[0][1] == "note for task_001"
+        lines = (memory_dir / "user" / "reflections.jsonl").read_text(encoding="utf-8").strip().split("\n")
+        assert len(lines) == 2
+
+    @pytest.mark.asyncio
+    async def test_batch_missing_task_falls_back(self, tmp_path):
+        """LLM 输出缺少某条任务时，该任务单独反思且没有笔记。"""
+        memory_dir = _setup_memory(tmp_path)
+        llm = MockLLMClient(responses={"gemini-flash": _batch_response("task_001")})
+        engine = ReflectionEngine(llm, str(memory_dir))
+
+        results = await engine.reflect_batch([_make_trace("task_001"), _make_trace("task_002")])
+
+        assert len(llm.calls) == 2
+        assert results[1][0]["task_id"] == "task_002"
+        assert results[1][1] is None
+
+    @pytest.mark.asyncio
+    async def test_batcher_flushes_when_full(self, tmp_path):
+        """凑满 max_items 条立即发出，不等待超时。"""
+        memory_dir = _setup_memory(tmp_path)
+        llm = MockLLMClient(responses={"gemini-flash": _batch_response("t1", "t2", "t3")})
+        batcher = ReflectionBatcher(ReflectionEngine(llm, str(memory_dir)), max_items=3, max_wait_ms=60_000)
+
+        results = await asyncio.wait_for(
+            asyncio.gather(*(batcher.reflect(_make_trace(f"t{i}")) for i in (1, 2, 3))),
+            timeout=5,
+        )
+
+        assert len(llm.calls) == 1
+        assert batcher.batches == 1
+        assert [r["task_id"] for r, _ in results] == ["t1", "t2", "t3"]
+        assert [note for _, note in results] == ["note for t1", "note for t2", "note for t3"]
+
+    @pytest.mark.asyncio
+    async def test_batcher_flushes_after_wait(self, tmp_path):
+        """不足一批时在 max_wait_ms 后发出。"""
+        memory_dir = _setup_memory(tmp_path)
+        llm = MockLLMClient(responses={"gemini-flash": _batch_response("t1", "t2")})
+        batcher = ReflectionBatcher(ReflectionEngine(llm, str(memory_dir)), max_items=8, max_wait_ms=20)
+
+        results = await asyncio.wait_for(
+            asyncio.gather(batcher.reflect(_make_trace("t1")), batcher.reflect(_make_trace("t2"))),
+            timeout=5,
+        )
+
+        assert len(llm.calls) == 1
+        assert batcher.items == 2
+        assert results[1][0]["task_id"] == "t2"
+
+
 def _setup_memory(tmp_path: Path) -> Path:
     memory_dir = tmp_path / "memory"
     (memory_dir / "user").mkdir(parents=True)
@@ -192,3 +260,21 @@ def _make_trace(task_id: str = "task_042", user_message: str = "帮我分析 Cur
         "model": "opus",
         "duration_ms": 15000,
     }
+
+
+def _batch_response(*task_ids: str) -> str:
+    return json.dumps(
+        [
+            {
+                "task_id": task_id,
+                "type": "PREFERENCE",
+                "outcome": "PARTIAL",
+                "lesson": "用户偏好简短",
+                "root_cause": None,
+                "reusable_experience": None,
+                "note": f"note for {task_id}",
+            }
+            for task_id in task_ids
+        ],
+        ensure_ascii=False,
+    )
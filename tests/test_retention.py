@@ -0,0 +1,187 @@
+"""Tests for memory retention engine."""
+
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta
+
+from core.memory import MemoryStore
+from extensions.memory.retention import RetentionEngine, RetentionPolicy, normalize_entry
+
+
+def _days_ago(days: int) -> str:
+    return (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+class TestDedupe:
+    def test_near_identical_lines_collapsed(self, tmp_path):
+        """日期和标签不同、内容近似的条目只保留最新一条。"""
+        prefs = tmp_path / "memory/user/preferences.md"
+        prefs.parent.mkdir(parents=True)
+        prefs.write_text(
+            "# 用户偏好\n\n"
+            f"- [{_days_ago(3)}] 用户偏好简短回答\n"
+            f"- {_days_ago(2)}T10:00:00 [task_0001] 用户偏好简短回答。\n"
+            f"- [{_days_ago(1)}] 喜欢 TypeScript 示例\n",
+            encoding="utf-8",
+        )
+
+        report = RetentionEngine(tmp_path).run()
+
+        assert report["memory/user/preferences.md"]["deduped"] == 1
+        content = prefs.read_text(encoding="utf-8")
+        assert content.startswith("# 用户偏好\n\n")
+        assert content.count("简短回答") == 1
+        assert "task_0001" in content
+
+    def test_normalize_strips_noise(self):
+        """归一化去掉日期、任务标签和标点。"""
+        a = normalize_entry("- [2026-01-01] (from task_0003) 超时未重试！")
+        b = normalize_entry("- 2026-02-01T08:00:00 [task_0009] (tool_misuse) 超时未重试")
+        assert a == b == "超时未重试"
+
+    def test_jsonl_dedupe_by_field(self, tmp_path):
+        """JSONL 按指定字段去重。"""
+        flush = tmp_path / "memory/user/compaction_flush.jsonl"
+        flush.parent.mkdir(parents=True)
+        now = datetime.now().replace(microsecond=0).isoformat()
+        rows = [
+            {"timestamp": now, "type": "fact", "content": "截止日期是 3 月 15 日"},
+            {"timestamp": now, "type": "fact", "content": "截止日期是 3 月 15 日"},
+            {"timestamp": now, "type": "todo", "content": "调研 Cron 机制"},
+        ]
+        flush.write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows), encoding="utf-8")
+
+        RetentionEngine(tmp_path).run()
+        assert len(flush.read_text(encoding="utf-8").strip().split("\n")) == 2
+
+
+class TestArchive:
+    def test_old_entries_rolled_into_monthly_archive(self, tmp_path):
+        """超过保留期的条目移入按月归档，并生成汇总。"""
+        log = tmp_path / "memory/user/reflections.jsonl"
+        log.parent.mkdir(parents=True)
+        old = (datetime.now() - timedelta(days=60)).replace(microsecond=0)
+        rows = [
+            {"timestamp": old.isoformat(), "task_id": "task_0001", "type": "NONE"},
+            {"timestamp": datetime.now().replace(microsecond=0).isoformat(), "task_id": "task_0002", "type": "NONE"},
+        ]
+        log.write_text("".join(json.dumps(r) + "\n" for r in rows), encoding="utf-8")
+
+        report = RetentionEngine(tmp_path).run()
+
+        assert report["memory/user/reflections.jsonl"]["archived"] == 1
+        assert "task_0002" in log.read_text(encoding="utf-8")
+        archive = tmp_path / "memory/archive/memory/user/reflections" / f"{old.strftime('%Y-%m')}.jsonl"
+        assert "task_0001" in archive.read_text(encoding="utf-8")
+        summary = (tmp_path / "memory/archive/memory/user/reflections/SUMMARY.md").read_text(encoding="utf-8")
+        assert f"{old.strftime('%Y-%m')}: 1 entries" in summary
+
+    def test_summary_rolls_up_archived_lessons(self, tmp_path):
+        """归档汇总保留每条归档条目的教训，重复的合并计数。"""
+        log = tmp_path / "memory/user/error_log.jsonl"
+        log.parent.mkdir(parents=True)
+        old = (datetime.now() - timedelta(days=120)).replace(microsecond=0).isoformat()
+        rows = [
+            {"timestamp": old, "task_id": "task_0001", "lesson": "先确认用户所在平台"},
+            {"timestamp": old, "task_id": "task_0002", "lesson": "调用工具前检查参数类型"},
+        ]
+        log.write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows), encoding="utf-8")
+        md = tmp_path / "rules/experience/error_patterns.md"
+        md.parent.mkdir(parents=True)
+        md.write_text(
+            "# 错误模式\n\n"
+            f"- {_days_ago(100)}T08:00:00 [task_0003] (tool_misuse) 超时未重试\n"
+            f"- {_days_ago(99)}T08:00:00 [task_0004] (wrong_assumption) 误判用户意图\n",
+            encoding="utf-8",
+        )
+
+        RetentionEngine(tmp_path).run()
+
+        summary = (tmp_path / "memory/archive/memory/user/error_log/SUMMARY.md").read_text(encoding="utf-8")
+        assert "- 先确认用户所在平台" in summary
+        assert "- 调用工具前检查参数类型" in summary
+        summary = (tmp_path / "memory/archive/rules/experience/error_patterns/SUMMARY.md").read_text(encoding="utf-8")
+        assert "- 超时未重试" in summary
+        assert "- 误判用户意图" in summary
+
+    def test_same_named_files_archived_separately(self, tmp_path):
+        """memory/ 与 rules/ 下同名的 error_patterns.md 各自归档，汇总标题为相对路径。"""
+        old = _days_ago(120)
+        month = old[:7]
+        for rel, lesson in (
+            ("memory/user/error_patterns.md", "记忆侧的旧错误"),
+            ("rules/experience/error_patterns.md", "规则侧的旧错误"),
+        ):
+            path = tmp_path / rel
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(f"# 错误模式\n\n- [{old}] {lesson}\n", encoding="utf-8")
+
+        RetentionEngine(tmp_path).run()
+
+        memory_dir = tmp_path / "memory/archive/memory/user/error_patterns"
+        rules_dir = tmp_path / "memory/archive/rules/experience/error_patterns"
+        memory_archive = (memory_dir / f"{month}.md").read_text(encoding="utf-8")
+        rules_archive = (rules_dir / f"{month}.md").read_text(encoding="utf-8")
+        assert "记忆侧" in memory_archive and "规则侧" not in memory_archive
+        assert "规则侧" in rules_archive and "记忆侧" not in rules_archive
+        summary = (rules_dir / "SUMMARY.md").read_text(encoding="utf-8")
+        assert summary.startswith("# Archive of rules/experience/error_patterns.md")
+        assert "记忆侧" not in summary
+
+    def test_preferences_never_archived_for_size(self, tmp_path):
+        """偏好只去重，不因大小被归档，get_user_preferences() 仍能读到最早的偏好。"""
+        prefs = tmp_path / "memory/user/preferences.md"
+        prefs.parent.mkdir(parents=True)
+        lines = [f"- [{_days_ago(400 - i)}] 偏好 {i}：{'独立内容' * 20} {i * 7919}" for i in range(200)]
+        prefs.write_text("# 用户偏好\n\n" + "\n".join(lines) + "\n", encoding="utf-8")
+
+        report = RetentionEngine(tmp_path).run()
+
+        assert report["memory/user/preferences.md"]["archived"] == 0
+        assert "偏好 0：" in prefs.read_text(encoding="utf-8")
+
+    def test_size_budget_archives_oldest(self, tmp_path):
+        """超过大小上限时归档最旧的条目，标题和无日期行保留。"""
+        path = tmp_path / "notes.md"
+        lines = [f"- [{_days_ago(100 - i)}] 第 {i} 条独立的记录内容 {i * 7919}" for i in range(50)]
+        path.write_text("# 标题\n\n- 手写的固定说明\n" + "\n".join(lines) + "\n", encoding="utf-8")
+        engine = RetentionEngine(tmp_path, policies=[RetentionPolicy("notes.md", max_bytes=1024)])
+
+        report = engine.run()
+
+        assert report["notes.md"]["bytes_after"] <= 1024
+        content = path.read_text(encoding="utf-8")
+        assert content.startswith("# 标题\n\n- 手写的固定说明\n")
+        assert "第 49 条" in content
+        assert "第 0 条" not in content
+
+    def test_noop_leaves_file_untouched(self, tmp_path):
+        """无需整理时不重写文件。"""
+        path = tmp_path / "memory/user/preferences.md"
+        path.parent.mkdir(parents=True)
+        path.write_text(f"# 用户偏好\n\n- [{_days_ago(0)}] 偏好中文\n", encoding="utf-8")
+        mtime = path.stat().st_mtime_ns
+
+        report = RetentionEngine(tmp_path).run()
+        assert report["memory/user/preferences.md"]["archived"] == 0
+        assert path.stat().st_mtime_ns == mtime
+
+
+class TestMemoryStoreIntegration:
+    def test_store_sees_rewritten_files(self, tmp_path):
+        """整理后 MemoryStore 的缓存、错误分片与检索索引同步更新。"""
+        store = MemoryStore(str(tmp_path))
+        store.append_preference("用户偏好简短回答")
+        store.append_preference("用户偏好简短回答！")
+        store.append_error_pattern("超时未重试")
+        store.append_error_pattern("超时未重试")
+        assert store.get_user_preferences().count("简短回答") == 2
+
+        RetentionEngine(tmp_path).run()
+
+        assert store.get_user_preferences().count("简短回答") == 1
+        assert store.get_recent_errors().count("超时未重试") == 1
+        store.refresh_index()
+        results = store.search("简短回答", scope="user")
+        assert sum(r["content"].count("简短回答") for r in results) == 1
@@ -0,0 +1,109 @@
+"""规则文件监听与增量重载测试。"""
+
+import os
+
+import pytest
+
+from core.rule_watcher import RuleWatcher
+from core.rules import RulesInterpreter
+
+
+def _setup_rules(tmp_path):
+    rules_dir = tmp_path / "rules"
+    (rules_dir / "constitution").mkdir(parents=True)
+    (rules_dir / "experience").mkdir(parents=True)
+    (rules_dir / "constitution" / "identity.md").write_text("# 系统身份\n\n自进化助手。\n", encoding="utf-8")
+    (rules_dir / "experience" / "task_strategies.md").write_text("# 任务策略\n\n先分析。\n", encoding="utf-8")
+    return rules_dir
+
+
+@pytest.fixture(params=[True, False], ids=["inotify", "polling"])
+def use_inotify(request):
+    return request.param
+
+
+class TestRuleWatcher:
+    def test_reports_changed_files(self, tmp_path, use_inotify):
+        """新增、修改、删除的规则文件都被报告。"""
+        rules_dir = _setup_rules(tmp_path)
+        watcher = RuleWatcher(rules_dir, poll_interval=0, use_inotify=use_inotify)
+        assert watcher.poll() == set()
+
+        new_file = rules_dir / "experience" / "new_rule.md"
+        new_file.write_text("# 新规则\n", encoding="utf-8")
+        strategies = rules_dir / "experience" / "task_strategies.md"
+        strategies.write_text("# 任务策略\n\n先分析，再动手。\n", encoding="utf-8")
+        (rules_dir / "constitution" / "identity.md").unlink()
+        (rules_dir / "experience" / "notes.txt").write_text("ignored", encoding="utf-8")
+
+        assert watcher.poll() == {
+            new_file,
+            strategies,
+            rules_dir / "constitution" / "identity.md",
+        }
+        assert watcher.poll() == set()
+        watcher.close()
+
+    def test_falls_back_to_polling_without_dirs(self, tmp_path):
+        """规则子目录不存在时使用轮询后端。"""
+        watcher = RuleWatcher(tmp_path / "rules", poll_interval=0)
+        assert watcher.backend == "polling"
+        assert watcher.poll() == set()
+
+
+class TestIncrementalReload:
+    def test_refresh_reparses_only_changed(self, tmp_path):
+        """refresh() 只替换变化的规则，其它 Rule 对象保持不变。"""
+        rules_dir = _setup_rules(tmp_path)
+        interpreter = RulesInterpreter(str(rules_dir), watch=True)
+        interpreter.load_rules()
+        interpreter._watcher = RuleWatcher(rules_dir, poll_interval=0)
+        identity = interpreter.get_rule_by_name("identity")
+
+        (rules_dir / "experience" / "task_strategies.md").write_text(
+            "# 任务策略\n\n## 数据分析\n\n先看分布。\n", encoding="utf-8"
+        )
+        (rules_dir / "experience" / "a_first.md").write_text("# 调研\n\n多来源交叉验证。\n", encoding="utf-8")
+
+        assert sorted(interpreter.refresh()) == ["a_first", "task_strategies"]
+        assert interpreter.get_rule_by_name("identity") is identity
+        assert [r.name for r in interpreter.get_experience_rules()] == ["a_first", "task_strategies"]
+        assert interpreter.get_experience_rules("数据分析")[0].name == "task_strategies"
+
+    def test_changes_invalidate_score_cache(self, tmp_path):
+        """规则变化后同一上下文重新打分。"""
+        rules_dir = _setup_rules(tmp_path)
+        interpreter = RulesInterpreter(str(rules_dir))
+        interpreter.load_rules()
+        assert interpreter.get_experience_rules("数据分析")[0].name == "task_strategies"
+
+        path = rules_dir / "experience" / "analysis.md"
+        path.write_text("# 数据分析\n\n先看分布。\n", encoding="utf-8")
+        interpreter.apply_changes([path])
+        assert interpreter.get_experience_rules("数据分析")[0].name == "analysis"
+
+    def test_deleted_file_removed(self, tmp_path):
+        """删除的规则文件被移除，清空的文件也一样。"""
+        rules_dir = _setup_rules(tmp_path)
+        interpreter = RulesInterpreter(str(rules_dir))
+        interpreter.load_rules()
+
+        (rules_dir / "constitution" / "identity.md").unlink()
+        (rules_dir / "experience" / "task_strategies.md").write_text("", encoding="utf-8")
+        interpreter.apply_changes([
+            rules_dir / "constitution" / "identity.md",
+            rules_dir / "experience" / "task_strategies.md",
+            tmp_path / "elsewhere.md",
+        ])
+
+        assert interpreter.get_constitution_rules() == []
+        assert interpreter.get_experience_rules() == []
+
+    def test_refresh_without_watch_is_noop(self, tmp_path):
+        """未开启监听时 refresh() 不读取文件。"""
+        rules_dir = _setup_rules(tmp_path)
+        interpreter = RulesInterpreter(str(rules_dir))
+        interpreter.load_rules()
+        os.remove(rules_dir / "constitution" / "identity.md")
+        assert interpreter.refresh() == []
+        assert len(interpreter.get_constitution_rules()) == 1
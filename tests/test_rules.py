@@ -1,7 +1,7 @@
 """规则解释器测试。"""
 
 import pytest
-from core.rules import RulesInterpreter, Rule, parse_rule_file
+from core.rules import RulesInterpreter, Rule, char_bigrams, parse_rule_file
 
 
 class TestParseRuleFile:
@@ -188,6 +188,48 @@ class TestRulesInterpreter:
         assert any("子标题" in kw for kw in keywords)
 
 
+class TestRuleIndex:
+    def _brute_force(self, interpreter, task_context):
+        """逐条打分 + 稳定排序（索引引入前的行为）。"""
+        scored = [(interpreter._relevance_score(r, task_context), r) for r in interpreter._experience]
+        scored.sort(key=lambda x: x[0], reverse=True)
+        return [r.name for _, r in scored]
+
+    def test_matches_linear_scoring(self, tmp_path):
+        """索引 + 堆选出的顺序与逐条打分排序一致。"""
+        exp = tmp_path / "experience"
+        exp.mkdir()
+        topics = ["代码审查", "数据分析", "竞品调研", "API design", "写作润色", "错误处理", "x"]
+        for i in range(40):
+            topic = topics[i % len(topics)]
+            (exp / f"rule_{i:02d}_{i % 3}.md").write_text(
+                f"# {topic}\n\n第 {i} 条：{topic}时注意细节 {i * 37}\n", encoding="utf-8"
+            )
+        interpreter = RulesInterpreter(str(tmp_path))
+        interpreter.load_rules()
+
+        for ctx in ["帮我做数据分析", "api design review", "代码", "x", "1", "完全无关的请求 qq"]:
+            expected = self._brute_force(interpreter, ctx)
+            assert [r.name for r in interpreter.get_experience_rules(ctx)] == expected
+            limited = interpreter.get_experience_rules(ctx, max_tokens=60)
+            assert [r.name for r in limited] == expected[:len(limited)]
+
+    def test_candidates_pruned(self, tmp_path):
+        """无关规则不进入候选集。"""
+        exp = tmp_path / "experience"
+        exp.mkdir()
+        (exp / "analysis.md").write_text("# 数据分析\n\n先看分布", encoding="utf-8")
+        (exp / "writing.md").write_text("# 写作\n\n保持简洁", encoding="utf-8")
+        interpreter = RulesInterpreter(str(tmp_path))
+        interpreter.load_rules()
+
+        index = interpreter._experience_index
+        ctx = "数据分析报告"
+        candidates = index.candidates(ctx, char_bigrams(ctx))
+        assert [index.rules[i].name for i in candidates] == ["analysis"]
+        assert interpreter.get_experience_rules(ctx)[0].name == "analysis"
+
+
 class TestRule:
     def test_token_estimate(self):
         """Token 估算。"""
@@ -206,3 +248,68 @@ class TestRule:
                     "# 分析策略\n\n## 竞品分析\n\n内容")
         kws = rule.keywords
         assert "分析策略" in " ".join(kws)
+
+    def test_features_memoized(self):
+        """匹配特征只计算一次，content 替换后重新计算。"""
+        rule = Rule("test.md", "code_review", "experience", "# Code Review\n\n检查边界条件")
+        features = rule.features
+        assert rule.features is features
+        assert features.keywords_lower == ("code", "review")
+        assert features.name_readable == "code review"
+        assert "边界" in features.bigrams
+
+        rule.content = "# 新标题\n\n内容"
+        assert rule.features is not features
+        assert rule.keywords == ["新标题"]
+
+    def test_load_rules_precomputes_features(self, tmp_path):
+        """load_rules 时预计算特征。"""
+        (tmp_path / "experience").mkdir()
+        (tmp_path / "experience" / "a.md").write_text("# 调研\n\n先搜索再总结", encoding="utf-8")
+        interpreter = RulesInterpreter(str(tmp_path))
+        interpreter.load_rules()
+        assert interpreter.get_rule_by_name("a")._features is not None
+
+
+class TestConstitutionBlock:
+    def _setup(self, tmp_path):
+        (tmp_path / "constitution").mkdir()
+        (tmp_path / "constitution" / "identity.md").write_text("# 系统身份\n\n你是助手。", encoding="utf-8")
+        (tmp_path / "constitution" / "safety.md").write_text("# 安全\n\n不得执行危险操作。", encoding="utf-8")
+        interpreter = RulesInterpreter(str(tmp_path))
+        interpreter.load_rules()
+        return interpreter
+
+    def test_block_cached_and_byte_stable(self, tmp_path):
+        """内容不变时返回同一个渲染字符串，哈希稳定。"""
+        interpreter = self._setup(tmp_path)
+        first = interpreter.build_system_prompt_section("任务A")
+        second = interpreter.build_system_prompt_section("完全不同的任务B")
+
+        assert first["constitution_prompt"] is second["constitution_prompt"]
+        assert first["constitution_hash"] == second["constitution_hash"]
+        assert first["constitution_prompt"].startswith("## 核心规则\n\n### identity")
+
+        interpreter.reload()
+        assert interpreter.constitution_hash == first["constitution_hash"]
+        assert interpreter.render_constitution(3000)[0] == first["constitution_prompt"]
+
+    def test_hash_changes_with_content(self, tmp_path):
+        """宪法文件内容变化后哈希与渲染结果随之变化。"""
+        interpreter = self._setup(tmp_path)
+        old_hash = interpreter.constitution_hash
+
+        path = tmp_path / "constitution" / "safety.md"
+        path.write_text("# 安全\n\n危险操作需确认。", encoding="utf-8")
+        interpreter.apply_changes([path])
+
+        assert interpreter.constitution_hash != old_hash
+        assert "需确认" in interpreter.render_constitution()[0]
+
+    def test_budget_respected(self, tmp_path):
+        """预算不足时只注入能放下的规则。"""
+        interpreter = self._setup(tmp_path)
+        prompt, tokens, count = interpreter.render_constitution(budget=15)
+        assert count == 1
+        assert "identity" in prompt and "safety" not in prompt
+        assert interpreter.render_constitution(budget=0) == ("", 0, 0)
@@ -0,0 +1,68 @@
+"""会话管理测试。"""
+
+from core.sessions import Session, SessionManager
+
+
+class TestSession:
+    def test_default_session_task_ids(self):
+        session = Session("default", "default")
+        assert session.next_task_id() == "task_0001"
+
+    def test_other_session_task_ids_prefixed(self):
+        a, b = Session("telegram", "1"), Session("telegram", "2")
+        assert a.next_task_id() != b.next_task_id()
+
+    def test_round_trip(self):
+        session = Session("telegram", "1")
+        session.history.append({"role": "user", "content": "你好"})
+        session.task_counter = 3
+        session.compaction["count"] = 1
+        restored = Session.from_dict(session.to_dict())
+        assert list(restored.history) == list(session.history)
+        assert restored.history.total_tokens == session.history.total_tokens
+        assert restored.task_counter == 3
+        assert restored.compaction["count"] == 1
+
+
+class TestSessionManager:
+    def test_get_returns_same_session(self, tmp_path):
+        manager = SessionManager(tmp_path)
+        assert manager.get("telegram", "1") is manager.get("telegram", "1")
+        assert manager.get("telegram", "1") is not manager.get("telegram", "2")
+
+    def test_lru_eviction_and_rehydration(self, tmp_path):
+        manager = SessionManager(tmp_path, max_active=2)
+        first = manager.get("telegram", "1")
+        first.history.append({"role": "user", "content": "记住我"})
+        manager.get("telegram", "2")
+        manager.get("telegram", "1")  # 刷新最近使用
+        manager.get("telegram", "3")
+
+        assert len(manager) == 2
+        assert ("telegram", "2") not in manager
+        assert ("telegram", "1") in manager
+
+        manager.get("telegram", "4")
+        restored = manager.get("telegram", "1")
+        assert restored is not first
+        assert [m["content"] for m in restored.history] == ["记住我"]
+
+    def test_busy_session_not_evicted(self, tmp_path):
+        manager = SessionManager(tmp_path, max_active=1)
+        busy = manager.get("telegram", "1")
+        busy.in_use += 1
+        manager.get("telegram", "2")
+        assert ("telegram", "1") in manager
+
+    def test_flush_persists_all(self, tmp_path):
+        manager = SessionManager(tmp_path)
+        manager.get("telegram", "1").history.append({"role": "user", "content": "a"})
+        manager.flush()
+        reloaded = SessionManager(tmp_path).get("telegram", "1")
+        assert len(reloaded.history) == 1
+
+    def test_corrupt_file_starts_fresh(self, tmp_path):
+        manager = SessionManager(tmp_path)
+        path = tmp_path / f"{Session('telegram', '1').slug}.json"
+        path.write_text("{broken", encoding="utf-8")
+        assert len(manager.get("telegram", "1").history) == 0
@@ -0,0 +1,232 @@
+"""持久化任务队列测试。"""
+
+import asyncio
+import json
+
+import pytest
+
+from core.task_queue import PersistentTaskQueue
+
+
+def _spool_records(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+class TestPersistentTaskQueue:
+    @pytest.mark.asyncio
+    async def test_processes_items(self, tmp_path):
+        seen = []
+
+        async def handler(item):
+            seen.append(item["n"])
+
+        queue = PersistentTaskQueue(tmp_path / "q.jsonl", handler, workers=1)
+        for n in range(3):
+            await queue.submit({"n": n})
+        await queue.join()
+        assert seen == [0, 1, 2]
+        assert queue.stats()["processed"] == 3
+        assert await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limited_to_workers(self, tmp_path):
+        running = [0]
+        peak = [0]
+
+        async def handler(item):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+
+        queue = PersistentTaskQueue(tmp_path / "q.jsonl", handler, workers=2)
+        for n in range(6):
+            await queue.submit({"n": n})
+        await queue.join()
+        assert peak[0] == 2
+        await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_backpressure_blocks_submit(self, tmp_path):
+        release = asyncio.Event()
+
+        async def handler(item):
+            await release.wait()
+
+        queue = PersistentTaskQueue(tmp_path / "q.jsonl", handler, workers=1, max_pending=2)
+        await queue.submit({"n": 0})
+        await queue.submit({"n": 1})
+        blocked = asyncio.create_task(queue.submit({"n": 2}))
+        await asyncio.sleep(0.1)
+        assert not blocked.done()
+        release.set()
+        await asyncio.wait_for(blocked, timeout=1)
+        await queue.join()
+        stats = queue.stats()
+        assert stats["blocked_submits"] == 1
+        assert stats["high_watermark"] == 2
+        await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_backpressure_never_exceeds_max_pending(self, tmp_path):
+        """多个等待中的 submit 不会被同一空位同时放行。"""
+        release = asyncio.Event()
+        peak = [0]
+        queue = None
+
+        async def handler(item):
+            peak[0] = max(peak[0], queue.pending)
+            await release.wait()
+
+        queue = PersistentTaskQueue(tmp_path / "q.jsonl", handler, workers=1, max_pending=2)
+        submits = [asyncio.create_task(queue.submit({"n": i})) for i in range(10)]
+        await asyncio.sleep(0.05)
+        assert queue.pending == 2
+        release.set()
+        await asyncio.wait_for(asyncio.gather(*submits), timeout=2)
+        await queue.join()
+        assert queue.stats()["high_watermark"] == 2
+        assert peak[0] <= 2
+        assert queue.processed == 10
+        await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_submit_nowait_defers_to_spool_when_full(self, tmp_path):
+        """队列满时 submit_nowait 不等待，条目延后到 spool，空闲后按顺序补充处理。"""
+        release = asyncio.Event()
+        seen = []
+
+        async def handler(item):
+            await release.wait()
+            seen.append(item["n"])
+
+        queue = PersistentTaskQueue(tmp_path / "q.jsonl", handler, workers=1, max_pending=1)
+        for i in range(4):
+            queue.submit_nowait({"n": i})
+        assert queue.pending == 1
+        assert queue.stats()["deferred"] == 3
+        release.set()
+        await asyncio.wait_for(queue.join(), timeout=2)
+        assert seen == [0, 1, 2, 3]
+        assert queue.deferred == 0
+        assert await queue.stop()
+        assert not (tmp_path / "q.jsonl").read_text(encoding="utf-8")
+
+    @pytest.mark.asyncio
+    async def test_refill_reads_by_offset_and_compacts_while_deferred(self, tmp_path, monkeypatch):
+        """补充延后条目不重读整个 spool；有延后条目时也能压缩 spool。"""
+        monkeypatch.setattr("core.task_queue._COMPACT_AFTER", 3)
+        release = asyncio.Event()
+        seen = []
+
+        async def handler(item):
+            await release.wait()
+            seen.append(item["n"])
+
+        path = tmp_path / "q.jsonl"
+        queue = PersistentTaskQueue(path, handler, workers=1, max_pending=1)
+        queue.start()
+
+        def full_scan():
+            raise AssertionError("refill must not rescan the spool")
+
+        monkeypatch.setattr(queue, "_load_spool", full_scan)
+        for i in range(8):
+            queue.submit_nowait({"n": i})
+        assert queue.deferred == 7
+        release.set()
+        await asyncio.sleep(0)
+        while len(seen) < 4:
+            await asyncio.sleep(0.01)
+        # 压缩过的 spool 仍保留所有未完成（含延后）条目
+        records = _spool_records(path)
+        unfinished = {r["id"] for r in records if r["op"] == "put"} - {
+            r["id"] for r in records if r["op"] == "done"
+        }
+        assert len(unfinished) == 8 - queue.processed
+        await asyncio.wait_for(queue.join(), timeout=2)
+        assert seen == list(range(8))
+        assert len(_spool_records(path)) < 16
+        monkeypatch.undo()
+        assert await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_deferred_items_replayed_after_restart(self, tmp_path):
+        """未来得及补充的延后条目在重启后重放。"""
+        async def stuck(item):
+            await asyncio.sleep(10)
+
+        path = tmp_path / "q.jsonl"
+        queue = PersistentTaskQueue(path, stuck, workers=1, max_pending=1)
+        queue.submit_nowait({"n": 0})
+        queue.submit_nowait({"n": 1})
+        await asyncio.sleep(0)
+        assert not await queue.stop(timeout=0.05)
+
+        seen = []
+
+        async def handler(item):
+            seen.append(item["n"])
+
+        restarted = PersistentTaskQueue(path, handler, workers=1)
+        restarted.start()
+        await restarted.join()
+        assert sorted(seen) == [0, 1]
+        await restarted.stop()
+
+    @pytest.mark.asyncio
+    async def test_handler_error_counts_as_done(self, tmp_path):
+        async def handler(item):
+            raise RuntimeError("boom")
+
+        queue = PersistentTaskQueue(tmp_path / "q.jsonl", handler)
+        await queue.submit({"n": 0})
+        await queue.join()
+        assert queue.failed == 1
+        assert await queue.stop()
+        assert queue._load_spool() == []
+
+    @pytest.mark.asyncio
+    async def test_unfinished_items_replayed_on_restart(self, tmp_path):
+        spool = tmp_path / "q.jsonl"
+
+        async def stuck(item):
+            await asyncio.sleep(10)
+
+        queue = PersistentTaskQueue(spool, stuck, workers=1)
+        await queue.submit({"n": 0})
+        await queue.submit({"n": 1})
+        assert not await queue.stop(timeout=0.05)
+        assert [r["item"]["n"] for r in _spool_records(spool) if r["op"] == "put"] == [0, 1]
+
+        seen = []
+
+        async def handler(item):
+            seen.append(item["n"])
+
+        restarted = PersistentTaskQueue(spool, handler, workers=1)
+        restarted.start()
+        await restarted.join()
+        assert seen == [0, 1]
+        assert restarted.replayed == 2
+        await restarted.stop()
+        assert restarted._load_spool() == []
+
+    @pytest.mark.asyncio
+    async def test_corrupt_spool_lines_skipped(self, tmp_path):
+        spool = tmp_path / "q.jsonl"
+        spool.write_text(
+            '{"op": "put", "id": "a", "item": {"n": 1}}\n{broken\n'
+            '{"op": "put", "id": "b", "item": {"n": 2}}\n{"op": "done", "id": "a"}\n',
+            encoding="utf-8",
+        )
+        seen = []
+
+        async def handler(item):
+            seen.append(item["n"])
+
+        queue = PersistentTaskQueue(spool, handler)
+        queue.start()
+        await queue.join()
+        assert seen == [2]
+        await queue.stop()
@@ -5,7 +5,12 @@ from unittest.mock import AsyncMock, MagicMock, patch
 import pytest
 
 from core.channels.bus import InboundMessage, MessageBus
-from core.channels.telegram import TelegramChannelConfig, TelegramInboundChannel
+from core.channels.telegram import (
+    TelegramChannelConfig,
+    TelegramInboundChannel,
+    TelegramReplyStream,
+    split_message,
+)
 
 
 # ──────────────────────────────────────
@@ -308,3 +313,73 @@ class TestTelegramChannelConfig:
     def test_with_proxy(self):
         cfg = TelegramChannelConfig(token="t", allowed_chat_ids=[], proxy="socks5://localhost:1080")
         assert cfg.proxy == "socks5://localhost:1080"
+
+
+# ──────────────────────────────────────
+#  流式回复测试
+# ──────────────────────────────────────
+
+def _stream_bot():
+    bot = MagicMock()
+    sent = iter(range(100, 200))
+    bot.send_message = AsyncMock(side_effect=lambda **kw: MagicMock(message_id=next(sent)))
+    bot.edit_message_text = AsyncMock()
+    bot.delete_message = AsyncMock()
+    return bot
+
+
+class TestReplyStream:
+    @pytest.mark.asyncio
+    async def test_placeholder_then_edits(self):
+        """先发占位消息，增量按间隔编辑，结束时显示最终文本。"""
+        bot = _stream_bot()
+        stream = TelegramReplyStream(bot, 111, edit_interval=0)
+        await stream.start()
+        bot.send_message.assert_awaited_once_with(chat_id=111, text="…")
+
+        await stream.append("你好")
+        await stream.append("，世界")
+        await stream.finish()
+
+        texts = [c.kwargs["text"] for c in bot.edit_message_text.await_args_list]
+        assert texts == ["你好", "你好，世界"]
+        assert all(c.kwargs["message_id"] == 100 for c in bot.edit_message_text.await_args_list)
+
+    @pytest.mark.asyncio
+    async def test_edits_throttled(self):
+        """间隔内的增量只累积不编辑。"""
+        bot = _stream_bot()
+        stream = TelegramReplyStream(bot, 111, edit_interval=60)
+        await stream.start()
+        for ch in "abc":
+            await stream.append(ch)
+        bot.edit_message_text.assert_not_awaited()
+        await stream.finish()
+        bot.edit_message_text.assert_awaited_once_with(chat_id=111, message_id=100, text="abc")
+
+    @pytest.mark.asyncio
+    async def test_overflow_continues_in_new_message(self):
+        """超过单条上限时续发新消息；最终文本变短时删除多余消息。"""
+        bot = _stream_bot()
+        stream = TelegramReplyStream(bot, 111, edit_interval=0, max_len=10)
+        await stream.start()
+        await stream.append("0123456789abcde")
+        assert bot.send_message.await_count == 2
+        assert bot.send_message.await_args.kwargs["text"] == "abcde"
+
+        await stream.finish("出错了")
+        bot.delete_message.assert_awaited_once_with(chat_id=111, message_id=101)
+        assert bot.edit_message_text.await_args.kwargs["text"] == "出错了"
+
+    def test_open_stream_requires_running_bot(self, channel, mock_app):
+        assert channel.open_stream("111") is None
+        channel._app = mock_app
+        assert channel.open_stream("abc") is None
+        assert isinstance(channel.open_stream("111"), TelegramReplyStream)
+
+    def test_split_message_prefix_stable(self):
+        """文本只在末尾增长时已满的分段不变。"""
+        text = "第一行\n" * 5 + "x" * 30
+        first = split_message(text[:25], 20)
+        full = split_message(text, 20)
+        assert full[0] == first[0]
@@ -0,0 +1,61 @@
+"""统一 token 计数测试。"""
+
+import pytest
+
+from core.tokens import TokenCounter
+
+
+class TestEstimate:
+    def test_empty(self):
+        assert TokenCounter().count("") == 0
+
+    def test_english_words(self):
+        """英文按约 4 字符/token，短词 1 token。"""
+        counter = TokenCounter()
+        assert counter.estimate("the cat sat") == 3
+        assert counter.estimate("internationalization") == 5
+
+    def test_cjk_per_char(self):
+        """中文每字 1 token，标点单独计数。"""
+        assert TokenCounter().estimate("你好世界，再见") == 7
+
+    def test_digits_and_newlines(self):
+        """数字每 3 位 1 token，连续换行计 1。"""
+        assert TokenCounter().estimate("123456\n\n\n7") == 4
+
+    def test_lru_cache(self):
+        """同一文本只估算一次，缓存有上限。"""
+        counter = TokenCounter(cache_size=2)
+        for text in ["a", "b", "a", "c"]:
+            counter.estimate(text)
+        assert len(counter._cache) == 2
+        assert (hash("b"), 1) not in counter._cache
+
+
+class TestCalibration:
+    def test_first_sample_sets_ratio(self):
+        counter = TokenCounter()
+        counter.calibrate(100, 130)
+        assert counter.ratio == pytest.approx(1.3)
+        assert counter.count("x" * 400) == 130
+
+    def test_ema_and_clamp(self):
+        """后续样本做滑动平均，比例限制在 [0.5, 2.0]。"""
+        counter = TokenCounter()
+        counter.calibrate(100, 1000)
+        assert counter.ratio == 2.0
+        counter.calibrate(100, 100)
+        assert counter.ratio == pytest.approx(2.0 + 0.2 * (1.0 - 2.0))
+
+    def test_only_reference_provider_applies(self):
+        """其它 provider 的比例单独记录，不影响 count()。"""
+        counter = TokenCounter(reference_provider="opus")
+        counter.calibrate(100, 150, provider="qwen")
+        assert counter.ratio == 1.0
+        assert counter.ratios["qwen"] == pytest.approx(1.5)
+
+    def test_ignores_empty_samples(self):
+        counter = TokenCounter()
+        counter.calibrate(0, 100)
+        counter.calibrate(100, 0)
+        assert counter.ratios == {}